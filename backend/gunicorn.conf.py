@@ -0,0 +1,14 @@
+"""
+Hooks do gunicorn (as demais opções continuam na linha de comando do Dockerfile)
+
+post_worker_init roda depois do app ser carregado: o aquecimento da análise
+(src/utils/warmup.py) começa aqui, em uma thread, para que o primeiro upload
+após cada reciclagem não pague a compilação do numba sem que o worker deixe
+de atender enquanto isso.
+"""
+
+
+def post_worker_init(worker):
+    from utils import warmup
+
+    warmup.warm_up_in_background(worker.log)
@@ -3,16 +3,29 @@ Módulo de IA Chat para RegistraSom
 Integração com OpenAI (gpt-4.1-mini)
 """
 import os
+import hashlib
 import logging
-from openai import OpenAI
-from datetime import datetime
-import requests
+import threading
+import time
+from utils import metrics, prompt_cache
 
 logger = logging.getLogger(__name__)
 
 # Configurações da OpenAI
-# A chave API e o base_url são injetados via variáveis de ambiente do sandbox
-client = OpenAI()
+# A chave API e o base_url são injetados via variáveis de ambiente do sandbox.
+# O cliente (e o pacote openai) só são carregados na primeira chamada.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI()
+    return _client
 
 # System prompt especializado em mercado fonográfico
 SYSTEM_PROMPT = """Você é uma IA especializada em mercado fonográfico, royalties, direito autoral, propriedade intelectual, contratos musicais e distribuição digital.
@@ -29,7 +42,58 @@ Sua expertise inclui:
 - Legislação musical
 Sempre responda de forma clara, profissional e educativa. Use exemplos práticos quando possível."""
 
-def chat_with_phi2(message: str, user_id: int, conversation_history: list = None) -> dict:
+# Parâmetros do modelo compartilhados pelas versões com e sem streaming
+MODEL = "gpt-4.1-mini"
+TEMPERATURE = 0.7
+MAX_TOKENS = 512
+REQUEST_TIMEOUT = 120
+
+# Orçamento de tokens do histórico enviado no prompt (além do system prompt e do resumo)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("IA_HISTORY_TOKEN_BUDGET", 1200))
+SUMMARY_MAX_TOKENS = 300
+
+SUMMARY_PROMPT = """Você mantém o resumo de uma conversa entre um usuário e uma IA especializada em mercado fonográfico.
+Atualize o resumo anterior com as novas mensagens. Preserve fatos sobre o usuário, obras, contratos, números e decisões,
+e as perguntas ainda em aberto. Descarte cumprimentos e repetições. Responda só com o resumo, em até 150 palavras."""
+
+# Respostas em cache só valem para o mesmo modelo, system prompt e temperatura
+CACHE_NAMESPACE = hashlib.sha256(f"{MODEL}|{TEMPERATURE}|{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:16]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token, mais o envelope da mensagem)"""
+    return len(text) // 4 + 4
+
+
+def build_messages(message: str, conversation_history: list = None, summary: str = None) -> list:
+    """
+    Monta a lista de mensagens (system + resumo + histórico + mensagem atual).
+
+    Do histórico entram as mensagens mais recentes que couberem em
+    HISTORY_TOKEN_BUDGET; as anteriores estão representadas no resumo.
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    if summary:
+        messages.append({"role": "system", "content": f"Resumo da conversa até aqui:\n{summary}"})
+
+    # Adicionar histórico dentro do orçamento, da mensagem mais nova para a mais antiga
+    budget = HISTORY_TOKEN_BUDGET
+    recent = []
+    for turn in reversed(conversation_history or []):
+        cost = estimate_tokens(turn["content"])
+        if cost > budget:
+            break
+        recent.append(turn)
+        budget -= cost
+    messages.extend(reversed(recent))
+
+    # Adicionar mensagem atual
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+def chat_with_phi2(message: str, user_id: int, conversation_history: list = None, summary: str = None) -> dict:
     """
     Envia mensagem para a API da OpenAI e retorna a resposta
     
@@ -37,30 +101,24 @@ def chat_with_phi2(message: str, user_id: int, conversation_history: list = None
         message: Mensagem do usuário
         user_id: ID do usuário
         conversation_history: Histórico de conversação (lista de dicts com role e content)
+        summary: Resumo acumulado das mensagens anteriores ao histórico
         
     Returns:
         dict com success, response e error (se houver)
     """
     try:
         # Construir mensagens com histórico
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        
-        # Adicionar histórico (últimas 10 mensagens)
-        if conversation_history:
-            messages.extend(conversation_history[-10:])
-        
-        # Adicionar mensagem atual
-        messages.append({"role": "user", "content": message})
+        messages = build_messages(message, conversation_history, summary)
         
         logger.info(f"Enviando requisição para OpenAI (user_id={user_id})")
         
         # Fazer requisição para a API da OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
+        response = get_client().chat.completions.create(
+            model=MODEL,
             messages=messages,
-            temperature=0.7,
-            max_tokens=512,
-            timeout=120 # Timeout estendido para garantir a primeira resposta
+            temperature=TEMPERATURE,
+            max_tokens=MAX_TOKENS,
+            timeout=REQUEST_TIMEOUT # Timeout estendido para garantir a primeira resposta
         )
         
         assistant_message = response.choices[0].message.content
@@ -82,6 +140,113 @@ def chat_with_phi2(message: str, user_id: int, conversation_history: list = None
             "response": None
         }
 
+def cached_chat(message: str, user_id: int, conversation_history: list = None, summary: str = None) -> dict:
+    """
+    chat_with_phi2 com cache para perguntas sem histórico.
+
+    Perguntas equivalentes (ver utils/prompt_cache.py) são respondidas do
+    cache, e perguntas idênticas simultâneas geram uma única chamada à OpenAI.
+    """
+    if conversation_history or summary:
+        return chat_with_phi2(message, user_id, conversation_history, summary)
+
+    key = prompt_cache.cache_key(message, CACHE_NAMESPACE)
+    result, source = prompt_cache.get_or_compute(
+        key, lambda: chat_with_phi2(message, user_id), REQUEST_TIMEOUT
+    )
+    if source == "miss":
+        return result
+
+    logger.info(f"Resposta servida do cache ({source}) para user_id={user_id}")
+    return {"success": True, "response": result["response"], "tokens_used": 0, "cached": True}
+
+
+def stream_chat(message: str, user_id: int, conversation_history: list = None, summary: str = None):
+    """
+    Versão com streaming de chat_with_phi2.
+
+    Gera tuplas ("delta", texto) conforme os tokens chegam e, ao final,
+    ("done", {"response": texto_completo, "tokens_used": n}). Erros da API
+    propagam como exceção para a rota decidir o que enviar ao cliente.
+    """
+    key = None
+    if not conversation_history and not summary:
+        key = prompt_cache.cache_key(message, CACHE_NAMESPACE)
+        cached = prompt_cache.get(key)
+        if cached is not None:
+            metrics.incr("ia_cache_hits")
+            metrics.incr("ia_cache_saved_ms", cached["latency_ms"])
+            yield "delta", cached["response"]
+            yield "done", {"response": cached["response"], "tokens_used": 0, "cached": True}
+            return
+        metrics.incr("ia_cache_misses")
+
+    messages = build_messages(message, conversation_history, summary)
+
+    logger.info(f"Enviando requisição com streaming para OpenAI (user_id={user_id})")
+    started = time.monotonic()
+
+    stream = get_client().chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        timeout=REQUEST_TIMEOUT,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+    parts = []
+    tokens_used = 0
+    try:
+        for chunk in stream:
+            if chunk.usage is not None:
+                tokens_used = chunk.usage.total_tokens
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield "delta", delta
+    finally:
+        # Fecha a conexão com a OpenAI se o cliente desconectar no meio
+        stream.close()
+
+    logger.info(f"Streaming concluído (user_id={user_id}), tokens={tokens_used}")
+
+    response = "".join(parts).strip()
+    if key is not None and response:
+        prompt_cache.put(key, response, tokens_used, (time.monotonic() - started) * 1000)
+
+    yield "done", {"response": response, "tokens_used": tokens_used}
+
+
+def summarize_conversation(previous_summary: str, turns: list) -> str:
+    """
+    Incorpora `turns` (dicts com role e content) ao resumo anterior.
+
+    Usado em segundo plano por utils/chat_memory.py; retorna None em caso de erro.
+    """
+    transcript = "\n".join(
+        f"{'Usuário' if turn['role'] == 'user' else 'IA'}: {turn['content']}" for turn in turns
+    )
+    try:
+        response = get_client().chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Resumo anterior:\n{previous_summary or '(vazio)'}\n\nNovas mensagens:\n{transcript}"}
+            ],
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            timeout=REQUEST_TIMEOUT
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Erro ao resumir conversa: {str(e)}")
+        return None
+
+
 def validate_message(message: str) -> tuple:
     """
     Valida a mensagem do usuário
@@ -1,74 +1,44 @@
 """
 Rotas de API para Chat de IA - RegistraSom
 """
-from flask import Blueprint, request, jsonify
-from functools import wraps
-import jwt
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
+import json
 import logging
 from datetime import datetime, timedelta
-from collections import defaultdict
 import time
+from utils.auth import token_required
+from utils.rate_limit import rate_limit
 
 logger = logging.getLogger(__name__)
 
 # Blueprint para rotas de IA
 ia_bp = Blueprint('ia', __name__, url_prefix='/api/ia')
 
-# Rate limiting simples (5 requisições por minuto por usuário)
-user_requests = defaultdict(list)
-RATE_LIMIT = 5
-RATE_WINDOW = 60  # segundos
+def load_conversation(user_id):
+    """(resumo, mensagens ainda não resumidas em ordem cronológica no formato da OpenAI)"""
+    return current_app.extensions["chat_memory"].context(user_id)
 
 
-def check_rate_limit(user_id):
-    """Verifica se o usuário excedeu o limite de requisições"""
-    now = time.time()
-    # Limpar requisições antigas
-    user_requests[user_id] = [req_time for req_time in user_requests[user_id] 
-                               if now - req_time < RATE_WINDOW]
-    
-    if len(user_requests[user_id]) >= RATE_LIMIT:
-        return False
-    
-    user_requests[user_id].append(now)
-    return True
+def summarize_history(previous_summary, turns):
+    """Gera o resumo acumulado do chat; chamado em segundo plano por utils/chat_memory.py"""
+    from ia_chat import summarize_conversation
+    return summarize_conversation(previous_summary, turns)
 
 
-def token_required(f):
-    """Decorator para verificar autenticação JWT"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Verificar header Authorization
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({"error": "Token inválido"}), 401
-        
-        if not token:
-            return jsonify({"error": "Token não fornecido"}), 401
-        
-        try:
-            # Decodificar token JWT
-            from main import app  # Importar app para pegar SECRET_KEY
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user_id = data['user_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token expirado"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Token inválido"}), 401
-        
-        return f(current_user_id, *args, **kwargs)
-    
-    return decorated
+def save_exchange(user_id, message, response):
+    """Acrescenta a pergunta e a resposta à janela; o banco é gravado em segundo plano"""
+    current_app.extensions["chat_memory"].append(user_id, [("user", message), ("assistant", response)])
+
+
+def sse_event(event, data):
+    """Formata um evento Server-Sent Events com payload JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 
 @ia_bp.route('/chat', methods=['POST'])
 @token_required
-def chat(current_user_id):
+@rate_limit("ia_chat", limit=5, period=60)  # 5 requisições por minuto por usuário
+def chat(current_user):
     """
     Endpoint para chat com a IA
     
@@ -79,12 +49,6 @@ def chat(current_user_id):
     }
     """
     try:
-        # Verificar rate limit
-        if not check_rate_limit(current_user_id):
-            return jsonify({
-                "error": "Limite de requisições excedido. Aguarde um minuto."
-            }), 429
-        
         # Obter dados da requisição
         data = request.get_json()
         if not data or 'message' not in data:
@@ -99,51 +63,25 @@ def chat(current_user_id):
             return jsonify({"error": error_msg}), 400
         
         # Buscar histórico do usuário
-        from src.models import ChatHistory\nfrom main import db
-        history_records = ChatHistory.query.filter_by(user_id=current_user_id)\
-            .order_by(ChatHistory.created_at.desc())\
-            .limit(20)\
-            .all()
-        
-        # Converter histórico para formato esperado
-        conversation_history = []
-        for record in reversed(history_records):  # Ordem cronológica
-            conversation_history.append({
-                "role": record.role,
-                "content": record.message
-            })
+        summary, conversation_history = load_conversation(current_user.id)
         
         # Enviar para IA
-        from ia_chat import chat_with_phi2
-        result = chat_with_phi2(message, current_user_id, conversation_history)
+        from ia_chat import cached_chat
+        result = cached_chat(message, current_user.id, conversation_history, summary)
         
         if not result['success']:
             return jsonify({"error": result['error']}), 500
         
         # Salvar no histórico
-        # Mensagem do usuário
-        user_msg = ChatHistory(
-            user_id=current_user_id,
-            role="user",
-            message=message
-        )
-        db.session.add(user_msg)
+        save_exchange(current_user.id, message, result['response'])
         
-        # Resposta da IA
-        assistant_msg = ChatHistory(
-            user_id=current_user_id,
-            role="assistant",
-            message=result['response']
-        )
-        db.session.add(assistant_msg)
-        db.session.commit()
-        
-        logger.info(f"Chat IA: user_id={current_user_id}, tokens={result.get('tokens_used', 0)}")
+        logger.info(f"Chat IA: user_id={current_user.id}, tokens={result.get('tokens_used', 0)}")
         
         return jsonify({
             "success": True,
             "response": result['response'],
-            "tokens_used": result.get('tokens_used', 0)
+            "tokens_used": result.get('tokens_used', 0),
+            "cached": result.get('cached', False)
         }), 200
         
     except Exception as e:
@@ -151,9 +89,67 @@ def chat(current_user_id):
         return jsonify({"error": "Erro interno do servidor"}), 500
 
 
+@ia_bp.route('/chat/stream', methods=['POST'])
+@token_required
+@rate_limit("ia_chat", limit=5, period=60)
+def chat_stream(current_user):
+    """
+    Chat com a IA com resposta em streaming (Server-Sent Events)
+    
+    POST /api/ia/chat/stream
+    Headers: Authorization: Bearer <token>
+    Body: {
+        "message": "Sua pergunta aqui"
+    }
+    
+    Eventos: "delta" ({"content": "..."}) a cada trecho recebido, "done"
+    ({"response": "...", "tokens_used": n}) ao final, ou "error" ({"error": "..."}).
+    A conversa só é gravada no histórico quando o streaming termina.
+    """
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({"error": "Campo 'message' é obrigatório"}), 400
+    
+    message = data['message']
+    
+    from ia_chat import validate_message, stream_chat
+    is_valid, error_msg = validate_message(message)
+    if not is_valid:
+        return jsonify({"error": error_msg}), 400
+    
+    user_id = current_user.id
+    try:
+        summary, conversation_history = load_conversation(user_id)
+    except Exception as e:
+        logger.error(f"Erro no endpoint /api/ia/chat/stream: {str(e)}")
+        return jsonify({"error": "Erro interno do servidor"}), 500
+    
+    def generate():
+        try:
+            for kind, payload in stream_chat(message, user_id, conversation_history, summary):
+                if kind == "delta":
+                    yield sse_event("delta", {"content": payload})
+                else:
+                    save_exchange(user_id, message, payload["response"])
+                    logger.info(f"Chat IA (stream): user_id={user_id}, tokens={payload['tokens_used']}")
+                    yield sse_event("done", payload)
+        except GeneratorExit:
+            # Cliente desconectou: nada é gravado
+            logger.info(f"Streaming interrompido pelo cliente: user_id={user_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Erro no streaming /api/ia/chat/stream: {str(e)}")
+            yield sse_event("error", {"error": "Erro ao gerar resposta"})
+    
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # nginx repassa cada evento sem bufferizar
+    })
+
+
 @ia_bp.route('/history', methods=['GET'])
 @token_required
-def get_history(current_user_id):
+def get_history(current_user):
     """
     Endpoint para obter histórico de conversas
     
@@ -161,23 +157,8 @@ def get_history(current_user_id):
     Headers: Authorization: Bearer <token>
     """
     try:
-        from src.models import ChatHistory\nfrom main import db
-        
-        # Buscar últimas 20 mensagens
-        history = ChatHistory.query.filter_by(user_id=current_user_id)\
-            .order_by(ChatHistory.created_at.desc())\
-            .limit(20)\
-            .all()
-        
-        # Converter para JSON
-        messages = []
-        for record in reversed(history):  # Ordem cronológica
-            messages.append({
-                "id": record.id,
-                "role": record.role,
-                "message": record.message,
-                "created_at": record.created_at.isoformat()
-            })
+        # Últimas mensagens servidas pela janela em memória
+        messages = current_app.extensions["chat_memory"].recent(current_user.id)
         
         return jsonify({
             "success": True,
@@ -191,7 +172,7 @@ def get_history(current_user_id):
 
 @ia_bp.route('/clear-history', methods=['DELETE'])
 @token_required
-def clear_history(current_user_id):
+def clear_history(current_user):
     """
     Endpoint para limpar histórico de conversas
     
@@ -199,13 +180,10 @@ def clear_history(current_user_id):
     Headers: Authorization: Bearer <token>
     """
     try:
-        from src.models import ChatHistory\nfrom main import db
-        
-        # Deletar todas as mensagens do usuário
-        ChatHistory.query.filter_by(user_id=current_user_id).delete()
-        db.session.commit()
+        # Deletar todas as mensagens do usuário (janela e banco)
+        current_app.extensions["chat_memory"].clear(current_user.id)
         
-        logger.info(f"Histórico limpo: user_id={current_user_id}")
+        logger.info(f"Histórico limpo: user_id={current_user.id}")
         
         return jsonify({
             "success": True,
@@ -1,35 +1,70 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 import os
 import sys
 # Adiciona o diretório 'backend' ao PYTHONPATH para encontrar 'utils'
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# Blueprints importam "from main import ..."; registrar este módulo com esse
+# nome evita uma segunda cópia do app quando o gunicorn carrega src.main
+sys.modules.setdefault("main", sys.modules[__name__])
 import logging
 import sys
 import time
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 import hashlib
-import jwt
+import base64
 import re
-from functools import wraps
 import json
-from utils.audio_analysis import analyze_audio_features
+import itertools
+from urllib.parse import quote
+import click
+from contextlib import ExitStack, contextmanager
+# librosa, pyloudnorm e soundfile (utils.audio_analysis) são importados só
+# nas rotas de análise, para que o worker responda /api/health sem esperar
+# por eles (ver tools/import_report.py)
 from utils.transcription import transcribe_audio_manus
-from utils.pdf_generator import generate_transcription_pdf
 from utils.chord_analysis import analyze_chords_and_suggestions
+from utils.analyzers import (REGISTRY, UnknownFeature, feature_versions, parse_features, public_features,
+                             run_analysis)
+from utils.auth import init_auth, generate_token, token_required
+from utils import bulk_ingest, metrics, warmup
+from utils.rate_limit import rate_limit
+from utils.admission import admission_control, get_controller, Saturated, saturated_response
+from utils.user_stats import install_stats_listener, seed_user_stats, load_histogram
+from utils.chat_memory import init_chat_memory
+from utils.blob_store import BlobStore, TempBlob, install_blob_listener
+from utils.fingerprint import FingerprintIndex
+from utils import similarity
+from utils import tiering, renditions
+from utils.static_assets import AssetManifest
+from utils.json_provider import init_json, raw_json
+from utils.compression import init_compression
 
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
-app = Flask(__name__, static_folder="../../frontend/src/dist", static_url_path="/")
+# O build do SPA é servido por serve_frontend a partir do manifesto (ver utils/static_assets.py)
+app = Flask(__name__, static_folder=None)
+# Respostas JSON com orjson, numpy nativo e colunas JSON sem re-serializar (ver utils/json_provider.py)
+init_json(app)
+FRONTEND_DIST = os.environ.get("FRONTEND_DIST") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../frontend/src/dist")
 
 
 # Pasta de uploads (garante caminho absoluto)
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# "nginx": o Flask só autoriza e devolve X-Accel-Redirect para uma location
+# interna do nginx que serve UPLOAD_FOLDER (ver frontend/nginx.conf)
+FILE_DELIVERY_MODE = os.environ.get("FILE_DELIVERY_MODE", "flask")
+X_ACCEL_PREFIX = os.environ.get("X_ACCEL_PREFIX", "/_protected_uploads/")
+# Uploads endereçados por conteúdo em UPLOAD_FOLDER/ab/cd/<sha256><ext> (ver utils/blob_store.py)
+blob_store = BlobStore(UPLOAD_FOLDER)
 # Configuração de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 app.logger.setLevel(logging.INFO)
@@ -47,6 +82,11 @@ app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # 10MB max file size
 
 # Configurar CORS
 CORS(app, origins=["*"])
+# Compressão gzip/zstd das respostas JSON grandes da API (ver utils/compression.py)
+init_compression(app)
+sock = Sock(app)
+# Índice de reconhecimento de gravações (ver utils/fingerprint.py)
+fingerprints = FingerprintIndex(os.environ.get("FINGERPRINT_DB") or os.path.join(app.instance_path, "fingerprints.db"))
 
 # Configuração do banco de dados
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///registrasom.db"
@@ -85,11 +125,17 @@ class User(db.Model):
 
 # Modelo de áudio simplificado
 class Audio(db.Model):
+    __table_args__ = (
+        # Índice para a paginação por cursor em (uploaded_at, id) de cada usuário
+        db.Index("ix_audio_user_uploaded", "user_id", "uploaded_at", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
+    filename = db.Column(db.String(255), nullable=False) # Relativo a UPLOAD_FOLDER
     original_filename = db.Column(db.String(255), nullable=False)
     filesize = db.Column(db.Integer, nullable=False)
+    blob_hash = db.Column(db.String(64), nullable=True, index=True) # None em uploads anteriores ao blob store
     bpm = db.Column(db.Float, nullable=True)
     key = db.Column(db.String(10), nullable=True)
     lufs = db.Column(db.Float, nullable=True)
@@ -100,63 +146,186 @@ class Audio(db.Model):
     chord_progressions = db.Column(db.Text, nullable=True) # Armazenar como JSON string
     instruments = db.Column(db.Text, nullable=True) # Armazenar como JSON string
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    analysis_versions = db.Column(db.Text, nullable=True) # JSON {feature: versão do analisador}
+    embedding = db.Column(db.Text, nullable=True) # JSON, vetor da busca por similaridade (ver utils/similarity.py)
+
+    # Calculado no SQL para que a listagem não precise carregar a transcrição
+    has_transcription = db.column_property(
+        db.and_(transcription.isnot(None), transcription != ".")
+    )
+
+    def to_dict(self, fields=None):
+        """Serializa o áudio; fields limita os campos (padrão: todos)"""
+        return {name: AUDIO_FIELDS[name][1](self) for name in (fields or AUDIO_ALL_FIELDS)}
+
+# Campos serializáveis de Audio: nome -> (colunas necessárias, getter)
+AUDIO_FIELDS = {
+    "id": (("id",), lambda a: a.id),
+    "original_filename": (("original_filename",), lambda a: a.original_filename),
+    "filesize": (("filesize",), lambda a: a.filesize),
+    "bpm": (("bpm",), lambda a: a.bpm),
+    "key": (("key",), lambda a: a.key),
+    "lufs": (("lufs",), lambda a: a.lufs),
+    "frequency_spectrum": (("frequency_spectrum",), lambda a: a.frequency_spectrum),
+    "status": (("status",), lambda a: a.status),
+    "uploaded_at": (("uploaded_at",), lambda a: a.uploaded_at.isoformat() if a.uploaded_at else None),
+    "transcription": (("transcription",), lambda a: a.transcription),
+    "has_transcription": (("has_transcription",), lambda a: bool(a.has_transcription)),
+    "chords": (("chords",), lambda a: raw_json(a.chords)),
+    "chord_progressions": (("chord_progressions",), lambda a: raw_json(a.chord_progressions)),
+    "instruments": (("instruments",), lambda a: raw_json(a.instruments)),
+}
+AUDIO_ALL_FIELDS = tuple(AUDIO_FIELDS)
+# Projeção leve usada pela listagem (sem espectro, transcrição e JSONs)
+AUDIO_SUMMARY_FIELDS = ("id", "original_filename", "filesize", "bpm", "key", "lufs",
+                        "status", "uploaded_at", "has_transcription")
+
+def parse_audio_fields(raw):
+    """
+    Converte o parâmetro fields= em uma tupla de campos.
+    Aceita nomes de campos e os atalhos "summary" e "all".
+    Retorna None se algum campo for desconhecido.
+    """
+    if not raw:
+        return AUDIO_SUMMARY_FIELDS
+    fields = []
+    for name in (part.strip() for part in raw.split(",")):
+        if not name:
+            continue
+        if name == "summary":
+            expanded = AUDIO_SUMMARY_FIELDS
+        elif name == "all":
+            expanded = AUDIO_ALL_FIELDS
+        elif name in AUDIO_FIELDS:
+            expanded = (name,)
+        else:
+            return None
+        fields.extend(field for field in expanded if field not in fields)
+    if "id" not in fields:
+        fields.insert(0, "id")
+    return tuple(fields)
+
+def audio_load_options(fields):
+    """Opções de query que carregam apenas as colunas usadas pelos campos pedidos"""
+    columns = {column for name in fields for column in AUDIO_FIELDS[name][0]}
+    return db.load_only(*(getattr(Audio, column) for column in columns), raiseload=True)
+
+def encode_cursor(audio):
+    raw = json.dumps([audio.uploaded_at.isoformat(), audio.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """Decodifica o cursor opaco; retorna None se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        uploaded_at, audio_id = json.loads(raw)
+        return datetime.fromisoformat(uploaded_at), int(audio_id)
+    except (ValueError, TypeError):
+        return None
 
+# Agregados por usuário mantidos incrementalmente (ver utils/user_stats.py)
+class UserStats(db.Model):
+    __tablename__ = "user_stats"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    total_uploads = db.Column(db.Integer, nullable=False, default=0)
+    completed_analyses = db.Column(db.Integer, nullable=False, default=0)
+    pending_analyses = db.Column(db.Integer, nullable=False, default=0)
+    total_size = db.Column(db.BigInteger, nullable=False, default=0)
+    bpm_histogram = db.Column(db.Text, nullable=True) # JSON {"120-129": n}
+    key_histogram = db.Column(db.Text, nullable=True) # JSON {"C Major": n}
+    lufs_histogram = db.Column(db.Text, nullable=True) # JSON {"-15": n}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def to_dict(self):
         return {
-            "id": self.id,
-            "original_filename": self.original_filename,
-            "filesize": self.filesize,
-            "bpm": self.bpm,
-            "key": self.key,
-            "lufs": self.lufs,
-            "frequency_spectrum": self.frequency_spectrum,
-            "status": self.status,
-            "uploaded_at": self.uploaded_at.isoformat() if self.uploaded_at else None,
-            "transcription": self.transcription,
-            "chords": json.loads(self.chords) if self.chords else None,
-            "chord_progressions": json.loads(self.chord_progressions) if self.chord_progressions else None,
-            "instruments": json.loads(self.instruments) if self.instruments else None
+            "total_uploads": self.total_uploads,
+            "completed_analyses": self.completed_analyses,
+            "pending_analyses": self.pending_analyses,
+            "total_size_mb": round((self.total_size or 0) / (1024 * 1024), 2),
+            "histograms": {
+                "bpm": load_histogram(self.bpm_histogram),
+                "key": load_histogram(self.key_histogram),
+                "lufs": load_histogram(self.lufs_histogram)
+            }
         }
 
-# Utilitários de autenticação
-def generate_token(user_id):
-    """Gera token JWT"""
-    payload = {
-        "user_id": user_id,
-        "exp": datetime.utcnow().timestamp() + 86400  # 24 horas
-    }
-    return jwt.encode(payload, app.config["SECRET_KEY"], algorithm="HS256")
-
-def verify_token(token):
-    """Verifica token JWT"""
-    try:
-        payload = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
-        return payload["user_id"]
-    except:
-        return None
-
-def token_required(f):
-    """Decorator para rotas que requerem autenticação"""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get("Authorization")
-        if not token:
-            return jsonify({"error": "Token não fornecido"}), 401
+install_stats_listener(db.session, UserStats, Audio)
+similarity.install_similarity_listener(db.session, Audio)
 
-        if token.startswith("Bearer "):
-            token = token[7:]
+# Arquivos físicos compartilhados por áudios com o mesmo conteúdo
+class Blob(db.Model):
+    __tablename__ = "blob"
 
-        user_id = verify_token(token)
-        if not user_id:
-            return jsonify({"error": "Token inválido"}), 401
-
-        current_user = User.query.get(user_id)
-        if not current_user:
-            return jsonify({"error": "Usuário não encontrado"}), 401
-
-        return f(current_user, *args, **kwargs)
-    return decorated
+    hash = db.Column(db.String(64), primary_key=True) # SHA-256 do conteúdo
+    path = db.Column(db.String(255), nullable=False) # Relativo a UPLOAD_FOLDER
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_access = db.Column(db.DateTime, default=datetime.utcnow) # Stream/download (ver utils/tiering.py)
+    cold_path = db.Column(db.String(255), nullable=True) # FLAC da camada fria; None se o original está em disco
+    cold_size = db.Column(db.BigInteger, nullable=True)
+    rendition_path = db.Column(db.String(255), nullable=True) # Versão web para o player (ver utils/renditions.py)
+    rendition_size = db.Column(db.BigInteger, nullable=True)
+
+install_blob_listener(db.session, blob_store, Blob, Audio)
+
+def resolve_audio_file(audio):
+    """Caminho absoluto do arquivo de um áudio"""
+    return blob_store.abspath(audio.filename)
+
+@contextmanager
+def audio_source(audio):
+    """Arquivo com o conteúdo original do áudio, descomprimido se estiver na camada fria"""
+    blob = db.session.get(Blob, audio.blob_hash) if audio.blob_hash else None
+    if blob is None:
+        yield resolve_audio_file(audio)
+        return
+    with tiering.materialize(blob_store, blob) as path:
+        yield path
+
+def deliver_upload(relpath, mimetype=None, as_attachment=False, download_name=None):
+    """Entrega um arquivo de UPLOAD_FOLDER pelo Flask ou, no modo nginx, via X-Accel-Redirect"""
+    if FILE_DELIVERY_MODE != "nginx":
+        return send_from_directory(UPLOAD_FOLDER, relpath, mimetype=mimetype,
+                                   as_attachment=as_attachment, download_name=download_name)
+    path = safe_join(UPLOAD_FOLDER, relpath)
+    if path is None or not os.path.isfile(path):
+        return jsonify({"error": "Arquivo não encontrado"}), 404
+    response = Response(status=200, mimetype=mimetype)
+    if mimetype is None:
+        # Deixar o nginx escolher o Content-Type pela extensão
+        del response.headers["Content-Type"]
+    response.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX + quote(relpath)
+    if as_attachment:
+        response.headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(download_name or os.path.basename(relpath))}"
+    return response
+
+def send_audio(audio, as_attachment, quality="original"):
+    """
+    Resposta com o arquivo do áudio. quality="web" usa a versão leve quando
+    existe; o original é decodificado on-the-fly se estiver na camada fria.
+    """
+    blob = db.session.get(Blob, audio.blob_hash) if audio.blob_hash else None
+    if blob is not None:
+        tiering.touch(db.engine, Blob.__table__, blob.hash)
+        if quality == "web" and blob.rendition_path:
+            return deliver_upload(blob.rendition_path, mimetype=renditions.mimetype_for(blob.rendition_path))
+        if not blob.cold_path and not os.path.exists(blob_store.abspath(blob.path)):
+            # Recomprimido depois de carregarmos a linha
+            db.session.refresh(blob)
+        if blob.cold_path:
+            fmt = tiering.original_format(blob.path)
+            headers = {}
+            if as_attachment:
+                headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(audio.original_filename)}"
+            return Response(stream_with_context(tiering.decode_stream(blob_store.abspath(blob.cold_path), fmt)),
+                            mimetype=tiering.MIMETYPES[fmt], headers=headers)
+    return deliver_upload(audio.filename, as_attachment=as_attachment,
+                          download_name=audio.original_filename if as_attachment else None)
+
+# Autenticação compartilhada por todas as rotas (ver utils/auth.py)
+init_auth(app, User)
 
 # Validações
 def validate_email(email):
@@ -190,6 +359,16 @@ def health_check():
         return jsonify({"status": "error", "error": str(e)}), 500
 
 
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    """Contadores compartilhados entre workers (cache da IA, etc.)"""
+    try:
+        return jsonify({"metrics": metrics.snapshot()}), 200
+    except Exception as e:
+        app.logger.error("Erro ao ler métricas: %s", str(e))
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+
 @app.route("/api/register", methods=["POST"])
 def register():
     """Cadastro de novo usuário"""
@@ -284,10 +463,139 @@ def profile(current_user):
     """Perfil do usuário"""
     return jsonify({"user": current_user.to_dict()}), 200
 
+# Dono das faixas de catálogo (flask ingest), que aparecem no reconhecimento para todos
+CATALOGUE_USER_ID = int(os.environ["CATALOGUE_USER_ID"]) if os.environ.get("CATALOGUE_USER_ID") else None
+# Tudo que o upload grava no registro do áudio
+UPLOAD_FEATURES = ["bpm", "key", "lufs", "spectrum", "chords", "chord_progressions", "instruments", "transcription",
+                   "embedding"]
+# Nome do campo na resposta de /api/analyze-audio, quando difere do nome da feature
+ANALYSIS_RESPONSE_FIELDS = {"spectrum": "frequency_spectrum", "instruments": "suggested_instruments"}
+
+
+# Feature -> (coluna de Audio, guardada como JSON)
+STORED_FEATURES = {
+    "bpm": ("bpm", False),
+    "key": ("key", False),
+    "lufs": ("lufs", False),
+    "spectrum": ("frequency_spectrum", True),
+    "chords": ("chords", True),
+    "chord_progressions": ("chord_progressions", True),
+    "instruments": ("instruments", True),
+    "transcription": ("transcription", False),
+    "embedding": ("embedding", True),
+}
+
+
+def apply_features(audio, analysis_results):
+    """Grava as features calculadas nas colunas do Audio junto com a versão de cada uma"""
+    versions = json.loads(audio.analysis_versions or "{}")
+    versions.update(feature_versions(analysis_results))
+    for name, value in analysis_results.items():
+        column, as_json = STORED_FEATURES[name]
+        setattr(audio, column, json.dumps(value) if as_json else value)
+    audio.analysis_versions = json.dumps(versions, sort_keys=True)
+
+
+def stored_features(audio, names):
+    """Valores já gravados no Audio, no formato de run_analysis"""
+    values = {}
+    for name in names:
+        column, as_json = STORED_FEATURES[name]
+        value = getattr(audio, column)
+        values[name] = json.loads(value) if as_json and value else value
+    return values
+
+
+def build_audio(user_id, original_filename, temp, analysis_results):
+    """Registro Audio com os resultados de run_analysis(UPLOAD_FEATURES)"""
+    audio = Audio(
+        user_id=user_id,
+        original_filename=original_filename,
+        filesize=temp.size,
+        blob_hash=temp.digest,
+        status="completed"
+    )
+    apply_features(audio, analysis_results)
+    return audio
+
+
+def attach_blob(audio, temp, ext, rendition):
+    """
+    Move o temporário (e a versão web) para o store e adiciona o Audio à sessão.
+    Chamar sob blob_store.shard_lock(temp.digest), que deve ficar tomado até o
+    commit; retorna o caminho frio a apagar depois do commit, se houver.
+    """
+    # Relido sob o lock: uma cópia carregada antes pode ter sido apagada pelo GC ou
+    # por uma exclusão nesse meio tempo, e não pode chegar ao listener de refcount
+    blob = db.session.get(Blob, temp.digest, populate_existing=True)
+    if blob is None:
+        stale = db.session.identity_map.get(db.session.identity_key(Blob, temp.digest))
+        if stale is not None:
+            db.session.expunge(stale)
+    audio.filename = blob.path if blob else blob_store.relpath(temp.digest, ext)
+    blob_store.place(temp, audio.filename)
+    rehydrated = None
+    if blob is not None and blob.cold_path:
+        # Conteúdo reenviado: o original volta para a camada quente
+        rehydrated, blob.cold_path, blob.cold_size = blob.cold_path, None, None
+    db.session.add(audio)
+    db.session.flush()
+    if rendition:
+        blob = db.session.get(Blob, temp.digest)
+        if not blob.rendition_path:
+            blob.rendition_size = os.path.getsize(rendition)
+            blob.rendition_path = renditions.rendition_relpath(temp.digest)
+            blob_store.place_file(rendition, blob.rendition_path)
+        else:
+            blob_store.remove_temp(rendition)
+    return rehydrated
+
+
+def index_fingerprint(digest, landmarks):
+    """Adiciona os landmarks de um blob ao índice; uma falha aqui não desfaz o upload"""
+    if landmarks is None:
+        # O fingerprint falhou na análise: o áudio fica fora do reconhecimento
+        return
+    try:
+        fingerprints.add(digest, *landmarks, feature_versions(["fingerprint"])["fingerprint"])
+    except Exception:
+        app.logger.warning("Falha ao indexar fingerprint de %s", digest, exc_info=True)
+
+
+def recognized(user_id, matches):
+    """Resultados de fingerprints.match restritos aos áudios do usuário e do catálogo"""
+    if not matches:
+        return []
+    owners = {user_id, CATALOGUE_USER_ID} - {None}
+    audios = {}
+    query = Audio.query.filter(Audio.blob_hash.in_([match["blob_hash"] for match in matches]),
+                               Audio.user_id.in_(owners))\
+                       .options(db.load_only(Audio.id, Audio.user_id, Audio.original_filename, Audio.blob_hash))\
+                       .order_by(Audio.id)
+    for audio in query:
+        # O upload do próprio usuário tem preferência sobre a faixa do catálogo
+        if audio.blob_hash not in audios or audios[audio.blob_hash].user_id != user_id:
+            audios[audio.blob_hash] = audio
+    return [
+        {
+            "audio_id": audios[match["blob_hash"]].id,
+            "original_filename": audios[match["blob_hash"]].original_filename,
+            "catalogue": audios[match["blob_hash"]].user_id != user_id,
+            "offset_seconds": match["offset_seconds"],
+            "aligned": match["aligned"],
+            "confidence": match["confidence"],
+        }
+        for match in matches if match["blob_hash"] in audios
+    ]
+
+
 @app.route("/api/upload", methods=["POST"])
 @token_required
+@rate_limit("upload", limit=10, period=60)
+@admission_control("analysis")
 def upload_audio(current_user):
     """Upload de arquivo de áudio (simulado)"""
+    temp = rendition = None
     try:
         if "audio" not in request.files:
             return jsonify({"error": "Nenhum arquivo enviado"}), 400
@@ -296,86 +604,145 @@ def upload_audio(current_user):
         if file.filename == "":
             return jsonify({"error": "Nenhum arquivo selecionado"}), 400
 
-        # Salvar o arquivo temporariamente para análise
-        upload_dir = UPLOAD_FOLDER
-        if not os.path.exists(upload_dir):
-            os.makedirs(upload_dir)
-
-        unique_filename = f"{current_user.id}_{datetime.now().timestamp()}_{secure_filename(file.filename)}"
-        filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.save(filepath)
+        # Salvar o arquivo temporariamente para análise, já calculando o hash do conteúdo
+        ext = os.path.splitext(secure_filename(file.filename))[1]
+        temp = blob_store.save_temp(file.stream, ext)
+        filepath = temp.path
 
-        # Realizar análise de áudio
-        analysis_results = analyze_audio_features(filepath)
+        # Realizar análise de áudio, acordes, sugestões e transcrição (Whisper Local)
+        with warmup.timed_first_analysis():
+            analysis_results = run_analysis(filepath, UPLOAD_FEATURES, optional=["fingerprint"])
         
         # Verificar se a análise foi bem-sucedida
         if not analysis_results:
-            os.remove(filepath)
+            blob_store.discard(temp)
             return jsonify({"error": "Falha na análise do arquivo de áudio"}), 500
 
-        # Realizar transcrição de áudio usando Whisper Local
-        from utils.transcription_whisper_local import transcribe_audio_whisper_local
-        transcription_text = transcribe_audio_whisper_local(filepath)
-
-        # Realizar análise de acordes e sugestões
-        chord_analysis = analyze_chords_and_suggestions(analysis_results["bpm"], filepath)
-
-        filesize = os.path.getsize(filepath)
+        # Gravações já registradas (do usuário ou do catálogo) que contêm este áudio
+        # (se o fingerprint ou a busca falharem, o upload segue sem reconhecimento)
+        landmarks = analysis_results.pop("fingerprint")
+        matches = []
+        if landmarks is not None:
+            try:
+                matches = recognized(current_user.id, fingerprints.match(*landmarks))
+            except Exception:
+                app.logger.warning("Falha no reconhecimento do upload", exc_info=True)
+
+        # Versão web para o player, se o conteúdo ainda não tem uma
+        # (só uma consulta de coluna: o Blob é relido sob o lock em attach_blob)
+        existing = db.session.query(Blob.rendition_path).filter(Blob.hash == temp.digest).first()
+        rendition = None
+        if existing is None or not existing.rendition_path:
+            rendition = renditions.encode_rendition(filepath, blob_store.tmp_dir)
 
         # Criar registro no banco com os resultados da análise
-        audio = Audio(
-            user_id=current_user.id,
-            filename=unique_filename,
-            original_filename=file.filename,
-            filesize=filesize,
-            bpm=analysis_results["bpm"],
-            key=chord_analysis["key"],
-            lufs=analysis_results["lufs"],
-            frequency_spectrum=json.dumps(analysis_results.get("mean_frequency_spectrum") or analysis_results.get("frequency_spectrum")),
-            status="completed",
-            transcription=transcription_text,
-            chords=json.dumps(chord_analysis["chords"]),
-            chord_progressions=json.dumps(chord_analysis["suggestions"]["chordProgressions"]),
-            instruments=json.dumps(chord_analysis["suggestions"]["instruments"])
-        )
-
-
-
-        db.session.add(audio)
-        db.session.commit()
-
-        # O arquivo NÃO deve ser removido, pois é necessário para streaming e transcrição on-demand.
-        # os.remove(filepath)
+        audio = build_audio(current_user.id, file.filename, temp, analysis_results)
 
+        # Mover para o store e gravar o registro sob o lock do shard, para que
+        # uma exclusão concorrente do mesmo conteúdo não apague o arquivo
+        with blob_store.shard_lock(temp.digest):
+            rehydrated = attach_blob(audio, temp, ext, rendition)
+            db.session.commit()
+            if rehydrated:
+                blob_store.unlink(rehydrated)
+        index_fingerprint(temp.digest, landmarks)
 
         return jsonify({
             "message": "Upload realizado com sucesso",
-            "audio": audio.to_dict()
+            "audio": audio.to_dict(),
+            "matches": matches
         }), 201
 
     except Exception as e:
         db.session.rollback()
+        if temp is not None:
+            blob_store.discard(temp)
+        if rendition:
+            blob_store.remove_temp(rendition)
+        import traceback
+        app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+@app.route("/api/recognize", methods=["POST"])
+@token_required
+@rate_limit("recognize", limit=20, period=60)
+@admission_control("analysis")
+def recognize_audio(current_user):
+    """
+    Identifica um trecho de áudio (alguns segundos bastam, de qualquer ponto da
+    faixa) entre os uploads do usuário e o catálogo. Nada é gravado.
+    """
+    temp = None
+    try:
+        if "audio" not in request.files or request.files["audio"].filename == "":
+            return jsonify({"error": "Nenhum arquivo enviado"}), 400
+
+        file = request.files["audio"]
+        temp = blob_store.save_temp(file.stream, os.path.splitext(secure_filename(file.filename))[1])
+        results = run_analysis(temp.path, ["fingerprint"])
+        if results is None:
+            return jsonify({"error": "Falha na análise do arquivo de áudio"}), 500
+
+        matches = recognized(current_user.id, fingerprints.match(*results["fingerprint"]))
+        metrics.incr("recognition_hits" if matches else "recognition_misses")
+        return jsonify({"matches": matches}), 200
+
+    except Exception as e:
         import traceback
         app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
         return jsonify({"error": "Erro interno do servidor"}), 500
+    finally:
+        if temp is not None:
+            blob_store.discard(temp)
 
 @app.route("/api/my-uploads", methods=["GET"])
 @token_required
 def my_uploads(current_user):
-    """Lista uploads do usuário"""
+    """
+    Lista uploads do usuário com paginação por cursor em (uploaded_at, id).
+
+    Query params:
+        cursor: valor de next_cursor da página anterior (omitir na primeira)
+        per_page: itens por página (máximo 100)
+        fields: campos separados por vírgula (padrão: projeção "summary")
+        page: paginação legada por OFFSET, usada apenas sem cursor
+    """
     try:
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 10, type=int)
-
-        audios = Audio.query.filter_by(user_id=current_user.id)\
-                           .order_by(Audio.uploaded_at.desc())\
-                           .paginate(page=page, per_page=per_page, error_out=False)
+        per_page = max(1, min(request.args.get("per_page", 10, type=int), 100))
+        fields = parse_audio_fields(request.args.get("fields"))
+        if fields is None:
+            return jsonify({"error": "Parâmetro fields inválido"}), 400
+
+        query = Audio.query.filter_by(user_id=current_user.id)\
+                           .options(audio_load_options(fields + ("uploaded_at",)))\
+                           .order_by(Audio.uploaded_at.desc(), Audio.id.desc())
+
+        cursor = request.args.get("cursor")
+        page = request.args.get("page", type=int)
+        if cursor:
+            position = decode_cursor(cursor)
+            if position is None:
+                return jsonify({"error": "Cursor inválido"}), 400
+            query = query.filter(db.tuple_(Audio.uploaded_at, Audio.id) < position)
+        elif page and page > 1:
+            query = query.offset((page - 1) * per_page)
+
+        # Um item a mais indica se existe próxima página, sem COUNT(*)
+        audios = query.limit(per_page + 1).all()
+        has_more = len(audios) > per_page
+        audios = audios[:per_page]
+
+        # O total vem dos agregados mantidos em user_stats (busca por chave primária)
+        user_stats = db.session.get(UserStats, current_user.id)
+        total = user_stats.total_uploads if user_stats else len(audios)
 
         return jsonify({
-            "audios": [audio.to_dict() for audio in audios.items],
-            "total": audios.total,
-            "pages": audios.pages,
-            "current_page": page
+            "audios": [audio.to_dict(fields) for audio in audios],
+            "next_cursor": encode_cursor(audios[-1]) if has_more else None,
+            "has_more": has_more,
+            "total": total,
+            "pages": max(1, -(-total // per_page)),
+            "current_page": page or 1
         }), 200
 
     except Exception as e:
@@ -383,27 +750,42 @@ def my_uploads(current_user):
         app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
         return jsonify({"error": "Erro interno do servidor"}), 500
 
+@app.route("/api/audio/<int:audio_id>", methods=["GET"])
+@token_required
+def get_audio(current_user, audio_id):
+    """Detalhes de um áudio; aceita fields= como /api/my-uploads (padrão: todos)"""
+    try:
+        fields = parse_audio_fields(request.args.get("fields") or "all")
+        if fields is None:
+            return jsonify({"error": "Parâmetro fields inválido"}), 400
+
+        audio = Audio.query.filter_by(id=audio_id, user_id=current_user.id)\
+                           .options(audio_load_options(fields)).first()
+        if not audio:
+            return jsonify({"error": "Áudio não encontrado"}), 404
+
+        return jsonify({"audio": audio.to_dict(fields)}), 200
+
+    except Exception as e:
+        import traceback
+        app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
 @app.route("/api/stats", methods=["GET"])
 @token_required
 def stats(current_user):
-    """Estatísticas do usuário"""
+    """Estatísticas do usuário (busca por chave primária em user_stats)"""
     try:
-        total_uploads = Audio.query.filter_by(user_id=current_user.id).count()
-        completed_analyses = Audio.query.filter_by(user_id=current_user.id, status="completed").count()
-        pending_analyses = Audio.query.filter_by(user_id=current_user.id, status="pending").count()
+        user_stats = db.session.get(UserStats, current_user.id)
+        if user_stats is None:
+            # Usuários anteriores aos agregados: semear uma única vez
+            user_stats = seed_user_stats(db.session, UserStats, Audio, current_user.id)
+            db.session.commit()
 
-        total_size = db.session.query(db.func.sum(Audio.filesize))\
-                              .filter_by(user_id=current_user.id).scalar() or 0
-        total_size_mb = round(total_size / (1024 * 1024), 2)
-
-        return jsonify({
-            "total_uploads": total_uploads,
-            "completed_analyses": completed_analyses,
-            "pending_analyses": pending_analyses,
-            "total_size_mb": total_size_mb
-        }), 200
+        return jsonify(user_stats.to_dict()), 200
 
     except Exception as e:
+        db.session.rollback()
         import traceback
         app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
         return jsonify({"error": "Erro interno do servidor"}), 500
@@ -432,7 +814,7 @@ def delete_audio(current_user, audio_id):
 @app.route("/uploads/<path:filename>")
 def serve_uploads(filename):
     try:
-        return send_from_directory(UPLOAD_FOLDER, filename)
+        return deliver_upload(filename)
     except Exception as e:
         app.logger.error("Erro ao servir upload %s: %s", filename, str(e))
         return jsonify({"error": "Arquivo não encontrado"}), 404
@@ -458,10 +840,10 @@ class MusicRegistration(db.Model):
             "titulo": self.titulo,
             "genero": self.genero,
             "data_criacao": self.data_criacao.isoformat() if self.data_criacao else None,
-            "autores": json.loads(self.autores) if self.autores else [],
+            "autores": raw_json(self.autores, []),
             "letra": self.letra,
-            "contratos": json.loads(self.contratos) if self.contratos else [],
-            "status_checklist": json.loads(self.status_checklist) if self.status_checklist else {},
+            "contratos": raw_json(self.contratos, []),
+            "status_checklist": raw_json(self.status_checklist, {}),
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
@@ -571,36 +953,26 @@ def delete_music_registration(current_user, reg_id):
 
 
 
-# Criar tabelas
-with app.app_context():
-    db.create_all()
-
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
-def serve_frontend(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, "index.html")
-
-if __name__ == "__main__":
-
-    app.run(host="0.0.0.0", port=5000, debug=False)
 
 
 
 
 @app.route("/api/audio/<int:audio_id>/stream", methods=["GET"])
 def stream_audio(audio_id):
-    """Serve o arquivo de áudio para o player."""
+    """
+    Serve o áudio para o player: por padrão a versão web (Opus/AAC), ou o
+    arquivo enviado com ?quality=original.
+    """
     try:
+        quality = request.args.get("quality", "web")
+        if quality not in ("web", "original"):
+            return jsonify({"error": "quality deve ser 'web' ou 'original'"}), 400
+
         audio = Audio.query.filter_by(id=audio_id).first()
         if not audio:
             return jsonify({"error": "Áudio não encontrado"}), 404
 
-        # Usar send_from_directory para servir o arquivo
-        # O UPLOAD_FOLDER é o diretório raiz. O audio.filename é o nome do arquivo.
-        return send_from_directory(UPLOAD_FOLDER, audio.filename, as_attachment=False)
+        return send_audio(audio, as_attachment=False, quality=quality)
 
     except Exception as e:
         import traceback
@@ -617,8 +989,7 @@ def download_audio(current_user, audio_id):
         if not audio:
             return jsonify({"error": "Áudio não encontrado"}), 404
 
-        # Usar send_from_directory para servir o arquivo para download
-        return send_from_directory(UPLOAD_FOLDER, audio.filename, as_attachment=True, download_name=audio.original_filename)
+        return send_audio(audio, as_attachment=True)
 
     except Exception as e:
         import traceback
@@ -637,9 +1008,15 @@ def get_transcription(current_user, audio_id):
 
         # Se a transcrição ainda não foi gerada, tenta gerá-la
         if not audio.transcription:
-            filepath = os.path.join(UPLOAD_FOLDER, audio.filename)
-            if os.path.exists(filepath):
-                transcription_text = transcribe_audio_manus(filepath)
+            blob = db.session.get(Blob, audio.blob_hash) if audio.blob_hash else None
+            filepath = resolve_audio_file(audio)
+            if (blob is not None and blob.cold_path) or os.path.exists(filepath):
+                with get_controller("analysis").admitted():
+                    if blob is not None:
+                        with tiering.materialize(blob_store, blob) as filepath:
+                            transcription_text = transcribe_audio_manus(filepath)
+                    else:
+                        transcription_text = transcribe_audio_manus(filepath)
                 if transcription_text:
                     audio.transcription = transcription_text
                     db.session.commit()
@@ -651,30 +1028,123 @@ def get_transcription(current_user, audio_id):
 
         return jsonify({"transcription": audio.transcription}), 200
 
+    except Saturated as e:
+        return saturated_response(e)
     except Exception as e:
         import traceback
         app.logger.error(f"Erro ao buscar transcrição: {traceback.format_exc()}")
         return jsonify({"error": "Erro interno do servidor"}), 500
 
 
+def load_embeddings():
+    """[(id, user_id, embedding)] de todos os áudios já com embedding, para o índice de similaridade"""
+    # Também chamado pela thread de reconstrução do índice, fora de requisições
+    with app.app_context():
+        return db.session.query(Audio.id, Audio.user_id, Audio.embedding).filter(Audio.embedding.isnot(None)).all()
+
+
+@app.route("/api/audio/<int:audio_id>/similar", methods=["GET"])
+@token_required
+def similar_audio(current_user, audio_id):
+    """
+    Uploads do usuário e faixas do catálogo com som parecido (ver utils/similarity.py).
+
+    Query params:
+        limit: quantidade de resultados (máximo 50)
+    """
+    try:
+        limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+        owners = {current_user.id, CATALOGUE_USER_ID} - {None}
+        audio = Audio.query.filter(Audio.id == audio_id, Audio.user_id.in_(owners))\
+                           .options(db.load_only(Audio.id, Audio.blob_hash, Audio.filename, Audio.embedding,
+                                                 Audio.analysis_versions))\
+                           .first()
+        if not audio:
+            return jsonify({"error": "Áudio não encontrado"}), 404
+
+        # Uploads anteriores ao embedding: calcula agora (uma vez) em vez de esperar o backfill
+        if audio.embedding is None:
+            with get_controller("analysis").admitted():
+                with audio_source(audio) as filepath:
+                    results = run_analysis(filepath, ["embedding"])
+            if results is None:
+                return jsonify({"error": "Falha na análise do arquivo de áudio"}), 500
+            apply_features(audio, results)
+            db.session.commit()
+
+        # Outros registros do mesmo conteúdo não contam como "parecidos"
+        if audio.blob_hash:
+            exclude = {row_id for (row_id,) in db.session.query(Audio.id).filter(Audio.blob_hash == audio.blob_hash)}
+        else:
+            exclude = {audio.id}
+        index = similarity.get_index(load_embeddings)
+        hits = index.search(json.loads(audio.embedding), limit, owners, exclude)
+
+        rows = {row.id: row for row in Audio.query.filter(Audio.id.in_([hit_id for hit_id, _ in hits]))
+                .options(db.load_only(Audio.id, Audio.user_id, Audio.original_filename, Audio.bpm, Audio.key))}
+        return jsonify({
+            "audio_id": audio.id,
+            "method": index.method,
+            "similar": [
+                {
+                    "audio_id": hit_id,
+                    "original_filename": rows[hit_id].original_filename,
+                    "bpm": rows[hit_id].bpm,
+                    "key": rows[hit_id].key,
+                    "catalogue": rows[hit_id].user_id != current_user.id,
+                    "score": score,
+                }
+                for hit_id, score in hits if hit_id in rows
+            ]
+        }), 200
+
+    except Saturated as e:
+        return saturated_response(e)
+    except Exception as e:
+        import traceback
+        app.logger.error("Erro interno do servidor: %s", traceback.format_exc())
+        return jsonify({"error": "Erro interno do servidor"}), 500
+
+
+
 
 
+frontend_assets = AssetManifest(FRONTEND_DIST)
 
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
-def serve(path):
+def serve_frontend(path):
     if path.startswith("api/"):
         return jsonify({"error": "Rota de API não encontrada"}), 404
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, "index.html")
+    response = frontend_assets.respond(path)
+    if response is None:
+        return jsonify({"error": "Frontend não encontrado"}), 404
+    return response
 # Novo endpoint para análise de áudio sem autenticação
 # Para ser adicionado ao main.py
 
+@app.route("/api/analyzers", methods=["GET"])
+def list_analyzers():
+    """Features que podem ser pedidas em /api/analyze-audio?features="""
+    return jsonify({
+        "features": [
+            {"name": name, "requires": list(REGISTRY[name].requires), "version": REGISTRY[name].version}
+            for name in public_features()
+        ]
+    })
+
+
 @app.route("/api/analyze-audio", methods=["POST", "OPTIONS"])
+@rate_limit("analyze_audio", limit=6, period=60, key="ip")
+@admission_control("analysis")
 def analyze_audio_public():
-    """Endpoint público para análise de áudio (para extensão Chrome)"""
+    """Endpoint público para análise de áudio (para extensão Chrome)
+
+    ?features=bpm,lufs escolhe o que calcular (ver utils/analyzers.py); sem ele,
+    BPM, tom, LUFS, espectro, acordes e instrumentos. ?mode=preview analisa só
+    algumas janelas da faixa (?windows=, ?window_seconds=) e devolve BPM, tom e
+    LUFS com confiança; a transcrição só roda com ?transcribe=1.
+    """
     
     # Tratar CORS preflight
     if request.method == "OPTIONS":
@@ -696,6 +1166,17 @@ def analyze_audio_public():
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 400
         
+        preview = request.values.get("mode", "full") == "preview"
+        transcribe = request.values.get("transcribe", "").lower() in ("1", "true", "yes")
+        try:
+            features = parse_features(request.values.get("features"))
+        except UnknownFeature as e:
+            response = jsonify({"error": f"Feature desconhecida: {e}", "available": public_features()})
+            response.headers.add("Access-Control-Allow-Origin", "*")
+            return response, 400
+        if transcribe and "transcription" not in features:
+            features.append("transcription")
+        
         # Salvar o arquivo temporariamente para análise
         import tempfile
         temp_dir = tempfile.gettempdir()
@@ -703,8 +1184,17 @@ def analyze_audio_public():
         filepath = os.path.join(temp_dir, unique_filename)
         file.save(filepath)
         
-        # Realizar análise de áudio
-        analysis_results = analyze_audio_features(filepath)
+        # Realizar análise de áudio (rápida por janelas ou da faixa inteira)
+        if preview:
+            from utils.preview_analysis import analyze_preview
+            analysis_results = analyze_preview(
+                filepath,
+                windows=request.values.get("windows", type=int),
+                window_seconds=request.values.get("window_seconds", type=float)
+            )
+        else:
+            with warmup.timed_first_analysis():
+                analysis_results = run_analysis(filepath, features)
         
         # Verificar se a análise foi bem-sucedida
         if not analysis_results:
@@ -713,12 +1203,32 @@ def analyze_audio_public():
             response.headers.add("Access-Control-Allow-Origin", "*")
             return response, 500
         
-        # Realizar transcrição de áudio usando Whisper Local
-        from utils.transcription_whisper_local import transcribe_audio_whisper_local
-        transcription_text = transcribe_audio_whisper_local(filepath)
-        
-        # Realizar análise de acordes e sugestões
-        chord_analysis = analyze_chords_and_suggestions(analysis_results["bpm"], filepath)
+        if preview:
+            # Transcrição (Whisper Local) só quando pedida
+            transcription_text = None
+            if transcribe:
+                transcription_text = (run_analysis(filepath, ["transcription"]) or {}).get("transcription")
+            # Acordes e sugestões a partir do tom estimado
+            chord_analysis = analyze_chords_and_suggestions(
+                analysis_results["bpm"], filepath, key=analysis_results["key"]
+            )
+            result = {
+                "bpm": analysis_results["bpm"],
+                "key": analysis_results["key"],
+                "lufs": analysis_results["lufs"],
+                "chords": chord_analysis["chords"],
+                "suggested_instruments": chord_analysis["suggestions"]["instruments"],
+                "transcription": transcription_text,
+                "frequency_spectrum": analysis_results["mean_frequency_spectrum"],
+                "mode": "preview"
+            }
+            for field in ("confidence", "windows", "window_seconds", "duration", "coverage"):
+                result[field] = analysis_results[field]
+        else:
+            # Resposta no formato esperado pela extensão, só com as features calculadas
+            result = {ANALYSIS_RESPONSE_FIELDS.get(name, name): value for name, value in analysis_results.items()}
+            if not request.values.get("features"):
+                result.setdefault("transcription", None)
         
         # Remover arquivo temporário
         try:
@@ -726,17 +1236,6 @@ def analyze_audio_public():
         except:
             pass
         
-        # Preparar resposta no formato esperado pela extensão
-        result = {
-            "bpm": analysis_results["bpm"],
-            "key": chord_analysis["key"],
-            "lufs": analysis_results["lufs"],
-            "chords": chord_analysis["chords"],
-            "suggested_instruments": chord_analysis["suggestions"]["instruments"],
-            "transcription": transcription_text,
-            "frequency_spectrum": analysis_results.get("mean_frequency_spectrum") or analysis_results.get("frequency_spectrum")
-        }
-        
         response = jsonify(result)
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 200
@@ -756,9 +1255,79 @@ def analyze_audio_public():
         response.headers.add("Access-Control-Allow-Origin", "*")
         return response, 500
 
+@sock.route("/api/live-analysis")
+def live_analysis(ws):
+    """Análise ao vivo por WebSocket (extensão Chrome)
+
+    Parâmetros na URL: format (s16le, f32le, webm ou ogg), sample_rate e
+    channels (só PCM) e interval (segundos de áudio entre estimativas).
+    O cliente envia o áudio em mensagens binárias e "end" ao terminar; o
+    servidor responde {"type": "estimate", ...} durante a captura e
+    {"type": "final", ...} no fim. Ver utils/live_analysis.py.
+    """
+    from utils import live_analysis as live
+
+    if not live.acquire_slot():
+        ws.send(json.dumps({"type": "error", "error": "Servidor ocupado, tente novamente"}))
+        return
+    session = None
+    try:
+        try:
+            session = live.LiveSession(
+                fmt=request.args.get("format", "s16le"),
+                sample_rate=request.args.get("sample_rate", 48000, type=int),
+                channels=request.args.get("channels", 1, type=int),
+                interval=request.args.get("interval", 3.0, type=float)
+            )
+        except ValueError as e:
+            ws.send(json.dumps({"type": "error", "error": str(e)}))
+            return
+
+        # Limite em segundos de áudio e também de relógio: pedaços pequenos e
+        # espaçados não seguram a thread além de LIVE_MAX_SECONDS
+        deadline = time.monotonic() + live.MAX_SECONDS
+        while session.seconds < live.MAX_SECONDS:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            message = ws.receive(timeout=min(live.IDLE_TIMEOUT, remaining))
+            if message is None or message == "end":
+                break
+            if isinstance(message, str):
+                continue
+            if len(message) > live.MAX_CHUNK_BYTES:
+                ws.send(json.dumps({"type": "error", "error": "Pedaço de áudio muito grande"}))
+                return
+            estimate = session.feed(message)
+            if estimate:
+                ws.send(json.dumps({"type": "estimate", **estimate}))
+
+        ws.send(json.dumps({"type": "final", **session.finish()}))
+    except ConnectionClosed:
+        pass
+    except Exception as e:
+        import traceback
+        app.logger.error("Erro na análise ao vivo: %s", traceback.format_exc())
+        try:
+            ws.send(json.dumps({"type": "error", "error": "Erro interno do servidor"}))
+        except ConnectionClosed:
+            pass
+    finally:
+        if session is not None:
+            session.close()
+        live.release_slot()
+
+# @sock.route não devolve a view; o rate limit por IP embrulha a view registrada
+# para recusar com 429 ainda no handshake, antes de ocupar uma sessão
+app.view_functions["live_analysis"] = rate_limit("live_analysis", 6, 60, key="ip")(
+    app.view_functions["live_analysis"])
+
 # Modelo para histórico de chat com IA
 class ChatHistory(db.Model):
     __tablename__ = 'chat_history'
+    __table_args__ = (
+        db.Index("ix_chat_history_user_created", "user_id", "created_at"),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -775,8 +1344,233 @@ class ChatHistory(db.Model):
             "created_at": self.created_at.isoformat()
         }
 
-
+# Resumo acumulado das mensagens antigas de cada usuário (ver utils/chat_memory.py)
+class ChatSummary(db.Model):
+    __tablename__ = 'chat_summary'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False)
+    summarized_through = db.Column(db.DateTime, nullable=False)  # created_at da última mensagem resumida
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def add_missing_columns(model):
+    """create_all não altera tabelas existentes: acrescenta colunas novas (anuláveis) do modelo"""
+    existing = {column["name"] for column in db.inspect(db.engine).get_columns(model.__tablename__)}
+    with db.engine.begin() as conn:
+        for column in model.__table__.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(db.text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column_type}"))
+
+# Criar tabelas (depois de todos os modelos, inclusive ChatHistory)
+with app.app_context():
+    db.create_all()
+    add_missing_columns(Audio)
+    add_missing_columns(Blob)
+    # create_all não cria índices novos em tabelas que já existem
+    for index in Audio.__table__.indexes | ChatHistory.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
 
 # Registrar blueprint de IA
-from ia_routes import ia_bp
+from ia_routes import ia_bp, summarize_history
 app.register_blueprint(ia_bp)
+
+# Janela de conversa em memória, com gravação do histórico em segundo plano
+init_chat_memory(app, ChatHistory, ChatSummary, db, summarizer=summarize_history)
+
+# Camada fria dos uploads: `flask --app src/main.py tier-uploads --idle-days 30`
+@app.cli.command("tier-uploads")
+@click.option("--idle-days", type=int, default=lambda: int(os.environ.get("COLD_TIER_IDLE_DAYS", 30)),
+              help="Dias sem stream/download para recomprimir")
+@click.option("--limit", type=int, default=None, help="Máximo de arquivos nesta execução")
+@click.option("--dry-run", is_flag=True, help="Só listar candidatos")
+def tier_uploads(idle_days, limit, dry_run):
+    """Recomprime para FLAC os uploads WAV/AIFF não acessados e mostra os bytes recuperados"""
+    report = tiering.run_tiering(db.engine, Blob.__table__, blob_store, idle_days, limit, dry_run)
+    if not dry_run:
+        metrics.incr("cold_tier_files", report["tiered"])
+        metrics.incr("cold_tier_bytes_reclaimed", report["bytes_reclaimed"])
+    click.echo(json.dumps(report, indent=2))
+
+# Versões web dos uploads anteriores: `flask --app src/main.py build-renditions`
+@app.cli.command("build-renditions")
+@click.option("--limit", type=int, default=None, help="Máximo de arquivos nesta execução")
+def build_renditions(limit):
+    """Gera a versão web (Opus/AAC) dos blobs que ainda não têm uma"""
+    query = Blob.query.filter(Blob.rendition_path.is_(None), Blob.refcount > 0).order_by(Blob.created_at.desc())
+    built = failed = 0
+    for blob in query.limit(limit).all() if limit else query.all():
+        with tiering.materialize(blob_store, blob) as source:
+            rendition = renditions.encode_rendition(source, blob_store.tmp_dir)
+        if rendition is None:
+            failed += 1
+            continue
+        with blob_store.shard_lock(blob.hash):
+            db.session.refresh(blob)
+            blob.rendition_size = os.path.getsize(rendition)
+            blob.rendition_path = renditions.rendition_relpath(blob.hash)
+            blob_store.place_file(rendition, blob.rendition_path)
+            db.session.commit()
+        built += 1
+    click.echo(json.dumps({"built": built, "failed": failed}))
+
+def store_ingested(user_id, batch):
+    """Grava um lote de resultados de bulk_ingest.process_file em uma única transação"""
+    if not batch:
+        return
+    with ExitStack() as locks:
+        # Locks de todos os shards do lote, em ordem, até o commit
+        for digest in sorted({outcome["digest"][:2] for outcome in batch}):
+            locks.enter_context(blob_store.shard_lock(digest))
+        rehydrated = []
+        try:
+            for outcome in batch:
+                temp = TempBlob(outcome["temp_path"], outcome["digest"], outcome["size"])
+                results = dict(outcome["results"])
+                results.pop("fingerprint")
+                audio = build_audio(user_id, os.path.basename(outcome["path"]), temp, results)
+                cold = attach_blob(audio, temp, outcome["ext"], outcome["rendition"])
+                if cold:
+                    rehydrated.append(cold)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            for outcome in batch:
+                blob_store.remove_temp(outcome["temp_path"])
+                if outcome["rendition"]:
+                    blob_store.remove_temp(outcome["rendition"])
+            raise
+    for path in rehydrated:
+        blob_store.unlink(path)
+    for outcome in batch:
+        index_fingerprint(outcome["digest"], outcome["results"]["fingerprint"])
+
+
+# Ingestão de catálogo sem HTTP: `flask --app src/main.py ingest /dados/catalogo --user-id 7`
+@app.cli.command("ingest")
+@click.argument("source", type=click.Path(exists=True))
+@click.option("--user-id", type=int, required=True, default=lambda: CATALOGUE_USER_ID,
+              help="Dono dos registros (padrão: CATALOGUE_USER_ID)")
+@click.option("--workers", type=int, default=lambda: os.cpu_count() or 1, help="Processos de análise")
+@click.option("--batch-size", type=int, default=50, help="Registros por transação")
+@click.option("--no-transcription", is_flag=True, help="Não rodar o Whisper")
+def ingest(source, user_id, workers, batch_size, no_transcription):
+    """Analisa um diretório ou manifesto em paralelo e grava os Audio em lotes (retomável)"""
+    if db.session.get(User, user_id) is None:
+        raise click.BadParameter(f"usuário {user_id} não existe", param_hint="--user-id")
+    features = [f for f in UPLOAD_FEATURES if not (no_transcription and f == "transcription")]
+    paths = bulk_ingest.discover(source)
+    known = {digest for (digest,) in db.session.query(Audio.blob_hash).filter(
+        Audio.user_id == user_id, Audio.blob_hash.isnot(None))}
+    with_rendition = {digest for (digest,) in db.session.query(Blob.hash).filter(Blob.rendition_path.isnot(None))}
+
+    progress = bulk_ingest.Progress(len(paths))
+    batch = []
+    for outcome in bulk_ingest.run_pool(paths, workers, blob_store.root, features, known, with_rendition,
+                                        optional=["fingerprint"]):
+        status = outcome["status"]
+        if status == "ok" and outcome["digest"] in known:
+            # Mesmo conteúdo duas vezes na fonte
+            blob_store.remove_temp(outcome["temp_path"])
+            if outcome["rendition"]:
+                blob_store.remove_temp(outcome["rendition"])
+            status = "skipped"
+        elif status == "ok":
+            known.add(outcome["digest"])
+            batch.append(outcome)
+        elif status == "failed":
+            click.echo(f"falha: {outcome['path']}: {outcome['error']}", err=True)
+        progress.update(status, outcome["size"])
+        if len(batch) >= batch_size:
+            store_ingested(user_id, batch)
+            batch = []
+    store_ingested(user_id, batch)
+
+    metrics.incr("bulk_ingest_files", progress.counts["ok"])
+    click.echo(json.dumps(progress.summary()))
+
+# Reanálise depois de mudanças nos analisadores: `flask --app src/main.py backfill-analysis --sleep 1`
+@app.cli.command("backfill-analysis")
+@click.option("--limit", type=int, default=None, help="Máximo de arquivos nesta execução")
+@click.option("--batch-size", type=int, default=20, help="Arquivos por transação")
+@click.option("--sleep", "pause", type=float, default=0.5, help="Pausa entre arquivos, em segundos")
+@click.option("--nice", type=int, default=10, help="Quanto baixar a prioridade do processo")
+@click.option("--no-transcription", is_flag=True, help="Não rodar o Whisper")
+@click.option("--dry-run", is_flag=True, help="Só contar o que está desatualizado")
+def backfill_analysis(limit, batch_size, pause, nice, no_transcription, dry_run):
+    """Recalcula só as features cujo analisador mudou de versão desde a análise gravada"""
+    os.nice(nice)
+    features = [f for f in STORED_FEATURES if not (no_transcription and f == "transcription")]
+    current = feature_versions(features)
+
+    # Áudios com o mesmo conteúdo formam um grupo: cada arquivo é lido e analisado uma vez
+    groups = {}
+    stale_counts = dict.fromkeys(features, 0)
+    rows = db.session.query(Audio.id, Audio.blob_hash, Audio.filename, Audio.analysis_versions).order_by(Audio.id)
+    for audio_id, blob_hash, filename, versions in rows:
+        versions = json.loads(versions or "{}")
+        stale = {f for f in features if versions.get(f) != current[f]}
+        if not stale:
+            continue
+        for f in stale:
+            stale_counts[f] += 1
+        group = groups.setdefault(blob_hash or filename, {"ids": [], "stale": set()})
+        group["ids"].append(audio_id)
+        group["stale"] |= stale
+
+    report = {"rows": sum(len(g["ids"]) for g in groups.values()), "files": len(groups),
+              "stale": {f: n for f, n in stale_counts.items() if n}, "updated": 0, "failed": 0}
+    if dry_run:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    for group in list(groups.values())[:limit]:
+        audios = Audio.query.filter(Audio.id.in_(group["ids"])).all()
+        # Features atualizadas em todos os registros do grupo entram prontas e não são refeitas
+        fresh = [f for f in features if f not in group["stale"]]
+        known = {f: v for f, v in stored_features(audios[0], fresh).items() if v is not None}
+        with audio_source(audios[0]) as path:
+            results = run_analysis(path, sorted(group["stale"]), known=known)
+        if results is None:
+            report["failed"] += 1
+        else:
+            for audio in audios:
+                apply_features(audio, results)
+            report["updated"] += 1
+            if report["updated"] % batch_size == 0:
+                db.session.commit()
+        time.sleep(pause)
+    db.session.commit()
+
+    metrics.incr("analysis_backfill_files", report["updated"])
+    click.echo(json.dumps(report, indent=2))
+
+# Índice de reconhecimento dos uploads anteriores: `flask --app src/main.py fingerprint-index`
+@app.cli.command("fingerprint-index")
+@click.option("--limit", type=int, default=None, help="Máximo de arquivos nesta execução")
+@click.option("--sleep", "pause", type=float, default=0.2, help="Pausa entre arquivos, em segundos")
+@click.option("--nice", type=int, default=10, help="Quanto baixar a prioridade do processo")
+def fingerprint_index(limit, pause, nice):
+    """Indexa os blobs sem fingerprint (ou de versão antiga) e remove os que foram apagados"""
+    os.nice(nice)
+    version = feature_versions(["fingerprint"])["fingerprint"]
+    indexed = fingerprints.versions()
+    live = {digest for (digest,) in db.session.query(Blob.hash).filter(Blob.refcount > 0)}
+    report = {"pruned": fingerprints.prune(live), "indexed": 0, "failed": 0}
+
+    query = Blob.query.filter(Blob.refcount > 0).order_by(Blob.created_at)
+    pending = (blob for blob in query if indexed.get(blob.hash) != version)
+    for blob in itertools.islice(pending, limit):
+        with tiering.materialize(blob_store, blob) as path:
+            results = run_analysis(path, ["fingerprint"])
+        if results is None:
+            report["failed"] += 1
+        else:
+            fingerprints.add(blob.hash, *results["fingerprint"], version)
+            report["indexed"] += 1
+        time.sleep(pause)
+    click.echo(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,153 @@
+"""
+Controle de admissão para rotas pesadas (librosa, Whisper)
+
+Cada grupo de rotas tem um limite de execuções simultâneas por processo e
+um limite global no container. Os slots globais são arquivos com flock no
+diretório compartilhado, liberados pelo kernel mesmo se o worker morrer.
+Requisições além do limite esperam em uma fila limitada até um prazo;
+com a fila cheia ou o prazo esgotado a resposta é 503 imediato com
+Retry-After, e as threads restantes de cada worker ficam livres para
+/api/health e leituras baratas.
+
+Configuração por variáveis de ambiente (padrões entre parênteses):
+    ADMISSION_PER_PROCESS (1)  execuções pesadas simultâneas por worker
+    ADMISSION_GLOBAL (2)       execuções pesadas simultâneas no container
+    ADMISSION_QUEUE (1)        requisições esperando por worker
+    ADMISSION_MAX_WAIT (20)    segundos máximos de espera na fila
+"""
+import fcntl
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import jsonify, request
+
+from utils import shared_state
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+
+
+class Saturated(Exception):
+    """Sem capacidade para admitir a requisição"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Servidor ocupado, tente novamente em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, name, per_process=1, global_slots=2, max_queue=1, max_wait=20.0):
+        self.name = name
+        self.global_slots = global_slots
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._local = threading.BoundedSemaphore(per_process)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._avg_duration = 10.0  # média móvel do tempo de execução (s)
+
+    def _retry_after(self):
+        return max(1, min(60, math.ceil(self._avg_duration)))
+
+    def _try_global_slot(self):
+        for index in range(self.global_slots):
+            path = shared_state.state_path(f"admission-{self.name}-{index}.lock")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def acquire(self):
+        """Retorna o descritor do slot global ou levanta Saturated"""
+        # Caminho rápido: há capacidade livre, sem passar pela fila
+        if self._local.acquire(blocking=False):
+            fd = self._try_global_slot()
+            if fd is not None:
+                return fd
+            self._local.release()
+
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                raise Saturated(self._retry_after())
+            self._waiting += 1
+        try:
+            deadline = time.monotonic() + self.max_wait
+            if not self._local.acquire(timeout=self.max_wait):
+                raise Saturated(self._retry_after())
+            while True:
+                fd = self._try_global_slot()
+                if fd is not None:
+                    return fd
+                if time.monotonic() >= deadline:
+                    self._local.release()
+                    raise Saturated(self._retry_after())
+                time.sleep(POLL_INTERVAL)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self, fd, duration):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+        self._local.release()
+        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    @contextmanager
+    def admitted(self):
+        fd = self.acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(fd, time.monotonic() - started)
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_controller(name):
+    """Controlador compartilhado pelo processo para um grupo de rotas"""
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            controller = _controllers[name] = AdmissionController(
+                name,
+                per_process=int(os.environ.get("ADMISSION_PER_PROCESS", 1)),
+                global_slots=int(os.environ.get("ADMISSION_GLOBAL", 2)),
+                max_queue=int(os.environ.get("ADMISSION_QUEUE", 1)),
+                max_wait=float(os.environ.get("ADMISSION_MAX_WAIT", 20)),
+            )
+        return controller
+
+
+def saturated_response(error):
+    response = jsonify({"error": "Servidor ocupado processando outros áudios. Tente novamente em instantes."})
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+def admission_control(name):
+    """Decorator que só executa a rota com um slot do grupo `name`"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method == "OPTIONS":
+                return f(*args, **kwargs)
+            try:
+                with get_controller(name).admitted():
+                    return f(*args, **kwargs)
+            except Saturated as e:
+                logger.warning("Requisição recusada por falta de capacidade (%s)", name)
+                return saturated_response(e)
+        return decorated
+    return decorator
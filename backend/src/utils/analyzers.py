@@ -0,0 +1,238 @@
+"""
+Registro de analisadores de áudio com resolução de dependências
+
+Cada analisador declara o nome do resultado que produz, os resultados de
+que precisa (`requires`) e uma versão, que deve subir sempre que a saída
+mudar. feature_versions() combina a versão da feature com as de todas as
+suas dependências, e é isso que fica gravado em Audio.analysis_versions:
+mudar a STFT invalida espectro, croma, tom e acordes, mas não BPM nem LUFS.
+
+run_analysis() recebe só as features pedidas, monta a ordem de execução a
+partir do grafo de dependências e calcula cada nó uma única vez,
+compartilhando intermediários: pedir bpm e lufs carrega o áudio uma vez e
+não calcula STFT, croma nem transcrição.
+
+Nós internos (signal, stft, chroma, harmony, embedding, fingerprint) não
+podem ser pedidos
+diretamente. As bibliotecas pesadas são importadas dentro de cada
+analisador, então listar o registro não carrega librosa nem whisper.
+
+Uso:
+    features = parse_features("bpm,lufs")
+    results = run_analysis(path, features)   # {"bpm": 120, "lufs": -14.2}
+"""
+import hashlib
+from collections import namedtuple
+
+Analyzer = namedtuple("Analyzer", "name func requires version public")
+
+REGISTRY = {}
+
+# Features calculadas quando o cliente não escolhe (mesma resposta de antes do registro)
+DEFAULT_FEATURES = ("bpm", "key", "lufs", "spectrum", "chords", "instruments")
+
+
+class UnknownFeature(ValueError):
+    """Feature pedida que não existe ou é interna"""
+
+
+def analyzer(name, requires=(), version=1, public=True):
+    """Registra `func(audio_path, *resultados_de_requires)` como produtora de `name`"""
+    def decorator(func):
+        REGISTRY[name] = Analyzer(name, func, tuple(requires), version, public)
+        return func
+    return decorator
+
+
+def public_features():
+    return sorted(name for name, a in REGISTRY.items() if a.public)
+
+
+def parse_features(raw, default=DEFAULT_FEATURES):
+    """Lista de features de "bpm,lufs"; `default` se vazio. UnknownFeature se inválida"""
+    if not raw:
+        return list(default)
+    features = []
+    for name in (part.strip().lower() for part in raw.split(",")):
+        if not name:
+            continue
+        entry = REGISTRY.get(name)
+        if entry is None or not entry.public:
+            raise UnknownFeature(name)
+        if name not in features:
+            features.append(name)
+    return features
+
+
+def plan(features, known=()):
+    """Ordem de execução (dependências primeiro) para calcular `features`; `known` já estão prontas"""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order or name in known:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependência circular em {name}")
+        visiting.add(name)
+        for dependency in REGISTRY[name].requires:
+            visit(dependency)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in features:
+        visit(name)
+    return order
+
+
+def feature_versions(features):
+    """{feature: "versão:hash"}, o hash cobrindo as versões de todas as dependências"""
+    result = {}
+    for feature in features:
+        closure = sorted(f"{name}@{REGISTRY[name].version}" for name in plan([feature]))
+        digest = hashlib.sha1(",".join(closure).encode()).hexdigest()[:8]
+        result[feature] = f"{REGISTRY[feature].version}:{digest}"
+    return result
+
+
+def run_analysis(audio_path, features, known=None, optional=()):
+    """
+    Calcula só `features` (e suas dependências); retorna {feature: valor} ou None se falhar.
+    `known` traz valores já calculados (ex.: do banco) que não precisam ser refeitos.
+    `optional` são calculadas depois, reaproveitando o que a análise já tem em
+    mãos; se uma delas falhar, ela vem como None e o resto do resultado vale.
+    """
+    computed, name = dict(known or {}), None
+    try:
+        for name in plan(features, known=computed):
+            entry = REGISTRY[name]
+            computed[name] = entry.func(audio_path, *(computed[d] for d in entry.requires))
+    except Exception as e:
+        print(f"Erro ao analisar áudio ({name}): {e}")
+        return None
+    results = {name: computed[name] for name in features}
+    for feature in optional:
+        try:
+            for name in plan([feature], known=computed):
+                entry = REGISTRY[name]
+                computed[name] = entry.func(audio_path, *(computed[d] for d in entry.requires))
+            results[feature] = computed[feature]
+        except Exception as e:
+            print(f"Erro ao analisar áudio ({name}), ignorado: {e}")
+            results[feature] = None
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Analisadores
+
+
+@analyzer("signal", public=False)
+def load_signal(audio_path):
+    """Áudio mono e taxa de amostragem"""
+    import librosa
+    import soundfile as sf
+
+    data, rate = sf.read(audio_path)
+    # Se o áudio for estéreo, converter para mono para análise
+    if data.ndim > 1:
+        data = librosa.to_mono(data.T)
+    return data, rate
+
+
+@analyzer("stft", requires=("signal",), public=False)
+def magnitude_stft(audio_path, signal):
+    import librosa
+    import numpy as np
+
+    return np.abs(librosa.stft(signal[0]))
+
+
+@analyzer("lufs", requires=("signal",))
+def integrated_loudness(audio_path, signal):
+    """Loudness integrada BS.1770 em LUFS"""
+    import pyloudnorm as pyln
+
+    data, rate = signal
+    loudness = pyln.Meter(rate).integrated_loudness(data)
+    return round(float(loudness), 2)
+
+
+@analyzer("spectrum", requires=("stft",))
+def mean_spectrum(audio_path, stft):
+    """Média do espectrograma em dB por faixa de frequência"""
+    import librosa
+    import numpy as np
+
+    spectrogram = librosa.amplitude_to_db(stft, ref=np.max)
+    return np.mean(spectrogram, axis=1).tolist()
+
+
+@analyzer("bpm", requires=("signal",))
+def tempo(audio_path, signal):
+    import librosa
+    import numpy as np
+
+    data, rate = signal
+    bpm, _ = librosa.beat.beat_track(y=data, sr=rate)
+    return round(float(np.atleast_1d(bpm)[0]))
+
+
+@analyzer("chroma", requires=("signal", "stft"), public=False)
+def chroma(audio_path, signal, stft):
+    """Croma somado ao longo da faixa (mesma STFT do espectro, em potência)"""
+    import librosa
+
+    return librosa.feature.chroma_stft(S=stft ** 2, sr=signal[1]).sum(axis=1)
+
+
+@analyzer("key", requires=("chroma",))
+def key(audio_path, chroma):
+    """Tom pelo perfil de Krumhansl-Schmuckler ("A Minor")"""
+    from utils.preview_analysis import estimate_key
+
+    return estimate_key(chroma)[0]
+
+
+@analyzer("harmony", requires=("bpm", "key"), public=False)
+def harmony(audio_path, bpm, key):
+    from utils.chord_analysis import analyze_chords_and_suggestions
+
+    return analyze_chords_and_suggestions(bpm, audio_path, key=key)
+
+
+@analyzer("chords", requires=("harmony",))
+def chords(audio_path, harmony):
+    return harmony["chords"]
+
+
+@analyzer("chord_progressions", requires=("harmony",))
+def chord_progressions(audio_path, harmony):
+    return harmony["suggestions"]["chordProgressions"]
+
+
+@analyzer("instruments", requires=("harmony",))
+def instruments(audio_path, harmony):
+    return harmony["suggestions"]["instruments"]
+
+
+@analyzer("embedding", requires=("signal", "stft", "bpm"), public=False)
+def embedding(audio_path, signal, stft, bpm):
+    """Vetor de croma, forma do espectro e andamento para a busca por similaridade (utils/similarity.py)"""
+    from utils.similarity import track_embedding
+
+    return track_embedding(stft, signal[1], bpm)
+
+
+@analyzer("fingerprint", requires=("signal",), public=False)
+def fingerprint(audio_path, signal):
+    """Landmarks (hashes, frames) para o índice de reconhecimento (utils/fingerprint.py)"""
+    from utils.fingerprint import fingerprint_signal
+
+    return fingerprint_signal(*signal)
+
+
+@analyzer("transcription")
+def transcription(audio_path):
+    from utils.transcription_whisper_local import transcribe_audio_whisper_local
+
+    return transcribe_audio_whisper_local(audio_path)
@@ -1,57 +1,181 @@
-import jwt
-from datetime import datetime, timedelta
+"""
+Camada de autenticação compartilhada por todas as rotas e blueprints
+
+Tokens já verificados ficam em um cache LRU com TTL junto com um snapshot do
+usuário, então uma requisição com token em cache não decodifica o JWT de
+novo nem consulta o banco. O cache é por processo: alterações e exclusões de
+User invalidam as entradas do próprio worker imediatamente, e o TTL limita
+por quanto tempo os demais workers podem servir um snapshot antigo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 from functools import wraps
+
+import jwt
 from flask import request, jsonify, current_app
-from src.models.user import User
+from sqlalchemy import event
+
+TOKEN_LIFETIME = 86400  # 24 horas
+DEFAULT_CACHE_TTL = 120  # segundos
+DEFAULT_CACHE_SIZE = 10000
+
+
+class CachedUser:
+    """Snapshot somente leitura do usuário autenticado, desacoplado da sessão do banco"""
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        object.__setattr__(self, "_data", data)
+
+    def __getattr__(self, name):
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CachedUser é somente leitura")
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class TokenCache:
+    """Cache LRU com TTL de tokens verificados -> snapshot do usuário"""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (expira_em, user_id, snapshot)
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return entry[2]
+
+    def put(self, token, user_id, snapshot, token_expires_at):
+        # Nunca manter o token em cache além da expiração do próprio JWT
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            if token in self._entries:
+                self._remove(token)
+            self._entries[token] = (expires_at, user_id, snapshot)
+            self._tokens_by_user.setdefault(user_id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, token):
+        _, user_id, _ = self._entries.pop(token)
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+class Auth:
+    """Estado de autenticação registrado em app.extensions["auth"]"""
+
+    def __init__(self, app, user_model):
+        self.user_model = user_model
+        self.cache = TokenCache(
+            max_entries=app.config.get("AUTH_CACHE_SIZE", DEFAULT_CACHE_SIZE),
+            ttl=app.config.get("AUTH_CACHE_TTL", DEFAULT_CACHE_TTL),
+        )
+
+        # Invalida os snapshots quando o usuário é alterado ou excluído
+        def _invalidate(mapper, connection, target):
+            self.cache.invalidate_user(target.id)
+
+        event.listen(user_model, "after_update", _invalidate)
+        event.listen(user_model, "after_delete", _invalidate)
+
+    def authenticate(self, token):
+        """
+        Retorna (CachedUser, None) ou (None, mensagem de erro).
+        Com o token em cache não há decodificação nem consulta ao banco.
+        """
+        snapshot = self.cache.get(token)
+        if snapshot is not None:
+            return snapshot, None
+
+        try:
+            payload = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+            user_id = payload["user_id"]
+        except jwt.ExpiredSignatureError:
+            return None, "Token expirado"
+        except (jwt.InvalidTokenError, KeyError):
+            return None, "Token inválido"
+
+        user = self.user_model.query.get(user_id)
+        if not user:
+            return None, "Usuário não encontrado"
+
+        snapshot = CachedUser(user.to_dict())
+        self.cache.put(token, user_id, snapshot, payload.get("exp", time.time() + TOKEN_LIFETIME))
+        return snapshot, None
+
+
+def init_auth(app, user_model):
+    """Registra a camada de autenticação no app"""
+    app.extensions["auth"] = Auth(app, user_model)
+    return app.extensions["auth"]
+
 
 def generate_token(user_id):
-    """Gera um token JWT para o usuário"""
+    """Gera token JWT"""
     payload = {
-        'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=7),  # Token válido por 7 dias
-        'iat': datetime.utcnow()
+        "user_id": user_id,
+        "exp": datetime.utcnow().timestamp() + TOKEN_LIFETIME
     }
-    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+    return jwt.encode(payload, current_app.config["SECRET_KEY"], algorithm="HS256")
+
 
 def verify_token(token):
-    """Verifica se um token JWT é válido e retorna o user_id"""
-    try:
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['user_id']
-    except jwt.ExpiredSignatureError:
-        return None  # Token expirado
-    except jwt.InvalidTokenError:
-        return None  # Token inválido
+    """Verifica token JWT e retorna o user_id (ou None)"""
+    user, _ = current_app.extensions["auth"].authenticate(token)
+    return user.id if user else None
+
 
 def token_required(f):
-    """Decorator para proteger rotas que requerem autenticação"""
+    """Decorator para rotas que requerem autenticação; injeta current_user"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-
-        # Verificar se o token está no header Authorization
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            try:
-                token = auth_header.split(" ")[1]  # Bearer <token>
-            except IndexError:
-                return jsonify({'error': 'Token malformado'}), 401
-
+        token = request.headers.get("Authorization")
         if not token:
-            return jsonify({'error': 'Token de acesso é obrigatório'}), 401
+            return jsonify({"error": "Token não fornecido"}), 401
 
-        try:
-            user_id = verify_token(token)
-            if not user_id:
-                return jsonify({'error': 'Token inválido'}), 401
+        if token.startswith("Bearer "):
+            token = token[7:]
 
-            current_user = User.query.get(user_id)
-            if not current_user:
-                return jsonify({'error': 'Usuário não encontrado'}), 404
-
-        except Exception as e:
-            return jsonify({'error': 'Token inválido'}), 401
+        current_user, error = current_app.extensions["auth"].authenticate(token)
+        if current_user is None:
+            return jsonify({"error": error}), 401
 
         return f(current_user, *args, **kwargs)
-
-    return decorated
\ No newline at end of file
+    return decorated
@@ -0,0 +1,182 @@
+"""
+Armazenamento de uploads endereçado por conteúdo
+
+Cada arquivo é gravado uma única vez sob o SHA-256 do seu conteúdo, em
+diretórios de dois níveis (ab/cd/<hash><ext>), de modo que uploads
+idênticos compartilham o mesmo arquivo e nenhum diretório acumula todos os
+uploads. A tabela blob guarda quantos registros Audio apontam para cada
+arquivo; o contador é ajustado no flush junto com o Audio e o arquivo é
+apagado do disco depois do commit em que ele chega a zero.
+
+Gravações usam arquivo temporário + rename (atômico no mesmo sistema de
+arquivos). Colocar e apagar um arquivo acontece sob um flock do shard,
+tomado também durante o commit do upload, para que um upload concorrente
+do mesmo conteúdo nunca aponte para um arquivo que está sendo removido.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class TempBlob:
+    """Upload já gravado em disco e com hash calculado, ainda fora do store"""
+
+    def __init__(self, path, digest, size):
+        self.path = path
+        self.digest = digest
+        self.size = size
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, ".tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def relpath(self, digest, ext):
+        """Caminho relativo ao root, usado em Audio.filename e Blob.path"""
+        return os.path.join(digest[:2], digest[2:4], digest + ext.lower())
+
+    def abspath(self, relpath):
+        return os.path.join(self.root, relpath)
+
+    def save_temp(self, stream, ext):
+        """Copia o stream para um arquivo temporário calculando o hash no caminho"""
+        path = os.path.join(self.tmp_dir, uuid.uuid4().hex + ext.lower())
+        sha = hashlib.sha256()
+        size = 0
+        with open(path, "wb") as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        return TempBlob(path, sha.hexdigest(), size)
+
+    @contextmanager
+    def shard_lock(self, digest):
+        """Exclusão mútua entre processos para colocar/apagar blobs do shard"""
+        shard = os.path.join(self.root, digest[:2])
+        os.makedirs(shard, exist_ok=True)
+        fd = os.open(os.path.join(shard, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def place(self, temp, relpath):
+        """Move o temporário para relpath; se o conteúdo já existe, descarta a cópia"""
+        self.place_file(temp.path, relpath)
+
+    def place_file(self, path, relpath):
+        """Como place(), para arquivos derivados (ex.: versão web) gerados em tmp_dir"""
+        target = self.abspath(relpath)
+        if os.path.exists(target):
+            self.remove_temp(path)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def discard(self, temp):
+        self.remove_temp(temp.path)
+
+    def remove_temp(self, path):
+        """Apaga um arquivo, se existir"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def unlink(self, relpath):
+        self.remove_temp(self.abspath(relpath))
+
+
+def install_blob_listener(session, store, blob_model, audio_model):
+    """
+    Registra os hooks que mantêm blob.refcount em sincronia com Audio e
+    apagam do disco os arquivos sem referências depois do commit.
+
+    Áudios antigos (anteriores ao store, sem blob_hash) têm o arquivo
+    apagado diretamente quando o registro é excluído.
+    """
+    @event.listens_for(session, "before_flush")
+    def _update_refcounts(flush_session, flush_context, instances):
+        deltas = defaultdict(int)
+        audios = {}
+        for obj in flush_session.new:
+            if isinstance(obj, audio_model) and obj.blob_hash:
+                deltas[obj.blob_hash] += 1
+                audios[obj.blob_hash] = obj
+
+        released = flush_session.info.setdefault("released_blobs", set())
+        legacy = flush_session.info.setdefault("released_files", set())
+        for obj in flush_session.deleted:
+            if not isinstance(obj, audio_model):
+                continue
+            if obj.blob_hash:
+                deltas[obj.blob_hash] -= 1
+                released.add(obj.blob_hash)
+            else:
+                legacy.add(obj.filename)
+
+        with flush_session.no_autoflush:
+            for digest, delta in deltas.items():
+                if delta == 0:
+                    continue
+                blob = flush_session.get(blob_model, digest)
+                if blob is None:
+                    # Primeira referência: o arquivo acabou de ser colocado no store
+                    audio = audios[digest]
+                    flush_session.add(blob_model(hash=digest, path=audio.filename,
+                                                 size=audio.filesize, refcount=delta))
+                else:
+                    blob.refcount = blob_model.refcount + delta
+
+    @event.listens_for(session, "after_commit")
+    def _collect_released(committed_session):
+        released = committed_session.info.pop("released_blobs", set())
+        legacy = committed_session.info.pop("released_files", set())
+        if not released and not legacy:
+            return
+        engine = committed_session.get_bind()
+        table = blob_model.__table__
+        for digest in released:
+            try:
+                with store.shard_lock(digest):
+                    with engine.begin() as conn:
+                        row = conn.execute(
+                            table.delete()
+                            .where(table.c.hash == digest, table.c.refcount <= 0)
+                            .returning(table.c.path, table.c.cold_path, table.c.rendition_path)
+                        ).first()
+                    if row is not None:
+                        for path in (row.path, row.cold_path, row.rendition_path):
+                            if path:
+                                store.unlink(path)
+            except Exception as e:
+                logger.error("Falha ao liberar blob %s: %s", digest, e)
+        for filename in legacy:
+            store.unlink(filename)
+
+    @event.listens_for(session, "after_rollback")
+    def _forget_released(rolled_back_session):
+        rolled_back_session.info.pop("released_blobs", None)
+        rolled_back_session.info.pop("released_files", None)
+
+    return _update_refcounts
@@ -0,0 +1,156 @@
+"""
+Ingestão em lote de catálogos (comando `flask ingest`)
+
+Percorre um diretório (ou um manifesto .txt/.csv com um caminho por linha)
+e analisa os arquivos em um pool de processos, com o mesmo pipeline do
+upload: cópia para o store calculando o SHA-256, análise pelo registro de
+analisadores (utils/analyzers.py) e versão web para o player. O processo
+principal recebe os resultados e grava os Audio em transações por lote
+(main.store_ingested).
+
+A retomada é pelo hash do conteúdo: arquivos cujo hash já tem um Audio do
+usuário de destino são pulados antes de qualquer cópia ou análise, então
+uma ingestão interrompida pode simplesmente ser executada de novo.
+
+Os workers usam o método "spawn" (não herdam threads nem conexões do
+processo do Flask). Não há aquecimento (utils/warmup.py) nos workers: em
+lote só a vazão importa, e arquivos já ingeridos não chegam a carregar o
+librosa.
+"""
+import csv
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".ogg", ".opus", ".m4a", ".aif", ".aiff"}
+MANIFEST_EXTENSIONS = {".txt", ".csv"}
+CHUNK_SIZE = 1024 * 1024
+
+_worker = {}
+
+
+def discover(source):
+    """Caminhos de áudio de um diretório (recursivo, em ordem) ou de um manifesto"""
+    if os.path.isdir(source):
+        paths = []
+        for directory, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(os.path.join(directory, name) for name in sorted(files)
+                         if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS)
+        return paths
+    if os.path.splitext(source)[1].lower() not in MANIFEST_EXTENSIONS:
+        return [source]
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline="", encoding="utf-8") as f:
+        rows = [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+    # Caminhos relativos são relativos ao manifesto; linhas que não são arquivos (cabeçalho) são ignoradas
+    paths = [path if os.path.isabs(path) else os.path.join(base, path) for path in rows]
+    return [path for path in paths if os.path.isfile(path)]
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def init_worker(upload_root, features, optional, known_digests, rendition_digests):
+    from utils.blob_store import BlobStore
+
+    _worker.update(
+        store=BlobStore(upload_root),
+        features=features,
+        optional=optional,
+        known=known_digests,
+        with_rendition=rendition_digests,
+    )
+
+
+def process_file(path):
+    """Pipeline do upload para um arquivo; roda no worker e devolve um dict serializável"""
+    from utils import renditions
+    from utils.analyzers import run_analysis
+
+    store = _worker["store"]
+    outcome = {"path": path, "size": os.path.getsize(path)}
+    try:
+        digest = file_digest(path)
+        if digest in _worker["known"]:
+            return dict(outcome, status="skipped", digest=digest)
+
+        ext = os.path.splitext(path)[1]
+        with open(path, "rb") as f:
+            temp = store.save_temp(f, ext)
+        results = run_analysis(temp.path, _worker["features"], optional=_worker["optional"])
+        if results is None:
+            store.discard(temp)
+            return dict(outcome, status="failed", error="Falha na análise")
+
+        rendition = None
+        if temp.digest not in _worker["with_rendition"]:
+            rendition = renditions.encode_rendition(temp.path, store.tmp_dir)
+        return dict(outcome, status="ok", digest=temp.digest, ext=ext, temp_path=temp.path,
+                    results=results, rendition=rendition)
+    except Exception as e:
+        return dict(outcome, status="failed", error=str(e))
+
+
+def run_pool(paths, workers, upload_root, features, known_digests, rendition_digests, optional=()):
+    """Gera os resultados de process_file conforme ficam prontos (no máximo 4 por worker em voo)"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(upload_root, features, optional, known_digests, rendition_digests)) as pool:
+        pending = set()
+        remaining = iter(paths)
+        while True:
+            for path in remaining:
+                pending.add(pool.submit(process_file, path))
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class Progress:
+    """Contadores e vazão da ingestão, impressos em stderr no máximo uma vez por segundo"""
+
+    def __init__(self, total, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.start = self.last_print = time.monotonic()
+        self.counts = {"ok": 0, "skipped": 0, "failed": 0}
+        self.bytes = 0
+
+    @property
+    def done(self):
+        return sum(self.counts.values())
+
+    def update(self, status, size=0):
+        self.counts[status] += 1
+        self.bytes += size
+        now = time.monotonic()
+        if now - self.last_print >= 1 or self.done == self.total:
+            self.last_print = now
+            self.stream.write(self.line() + "\n")
+            self.stream.flush()
+
+    def line(self):
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate else 0
+        return (f"[{self.done}/{self.total}] {rate:.1f} arquivos/s, {self.bytes / elapsed / 1e6:.1f} MB/s | "
+                f"ok {self.counts['ok']}, pulados {self.counts['skipped']}, falhas {self.counts['failed']} | "
+                f"restam ~{eta / 60:.0f} min")
+
+    def summary(self):
+        elapsed = time.monotonic() - self.start
+        return dict(self.counts, total=self.total, seconds=round(elapsed, 1),
+                    files_per_second=round(self.done / elapsed, 2) if elapsed else 0.0)
@@ -0,0 +1,425 @@
+"""
+Janela de conversa em memória com gravação assíncrona (write-behind)
+
+As últimas WINDOW_SIZE mensagens de cada usuário ficam em um ring buffer no
+SQLite do diretório compartilhado (em memória, visível por todos os
+workers) e servem tanto o histórico enviado à IA quanto /api/ia/history.
+A tabela chat_history continua sendo a cópia durável: novas mensagens entram
+em uma fila por processo que uma thread grava em lotes, e a fila é esvaziada
+na saída do processo. Assim o caminho crítico do chat não toca o banco. Um
+lote cuja gravação falha (banco travado, disco cheio) é desfeito e tentado
+de novo, com espera crescente, em vez de descartado.
+
+Mensagens antigas são compactadas em um resumo acumulado (chat_summary):
+a cada IA_SUMMARY_EVERY mensagens novas, um worker gera em segundo plano
+o resumo das mensagens que já saíram do trecho recente, e o prompt passa a
+levar só o resumo e as mensagens posteriores a ele. Linhas de chat_history
+já cobertas pelo resumo e mais antigas que CHAT_RETENTION_DAYS são apagadas.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from utils import metrics, shared_state
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 20
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 0.5  # segundos
+FLUSH_TIMEOUT = 10  # segundos que flush() espera pela thread de gravação
+HISTORY_COLUMNS = ("user_id", "role", "message", "created_at")
+RETRY_MIN = 1  # segundos até regravar um lote que falhou; dobra a cada falha
+RETRY_MAX = 60
+
+SUMMARY_EVERY = int(os.environ.get("IA_SUMMARY_EVERY", 10))  # mensagens
+KEEP_RECENT = 6  # mensagens mais novas que nunca entram no resumo
+SUMMARY_LEASE = 120  # segundos
+RETENTION_DAYS = int(os.environ.get("CHAT_RETENTION_DAYS", 90))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS windows (
+    user_id INTEGER PRIMARY KEY,
+    next_seq INTEGER NOT NULL,
+    cleared_at TEXT,
+    summary TEXT,
+    summarized_upto INTEGER NOT NULL DEFAULT 0,
+    summary_lease REAL
+);
+CREATE TABLE IF NOT EXISTS turns (
+    user_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    history_id INTEGER,  -- chat_history.id, preenchido quando a mensagem é gravada
+    PRIMARY KEY (user_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+def _conn():
+    # O sufixo muda junto com o schema: a janela é só um cache, recarregado do banco
+    return shared_state.connect("chat_memory_v2", _SCHEMA)
+
+
+class ChatMemory:
+    """Registrado em app.extensions["chat_memory"] por init_chat_memory()"""
+
+    def __init__(self, app, history_model, summary_model, db, summarizer=None):
+        self.app = app
+        self.history_model = history_model
+        self.summary_model = summary_model
+        self.db = db
+        # summarizer(resumo_anterior, mensagens) -> novo resumo ou None
+        self.summarizer = summarizer
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._executor = None
+        self._executor_pid = None
+        self._flush_lock = threading.Lock()
+        self._failed = []  # mensagens cuja gravação falhou, aguardando nova tentativa
+        self._retry_at = 0.0
+        self._retry_delay = RETRY_MIN
+        atexit.register(self.flush)
+
+    # Janela de conversa
+
+    def _ensure_loaded(self, conn, user_id):
+        """Na primeira vez, carrega a janela a partir do banco"""
+        if conn.execute("SELECT 1 FROM windows WHERE user_id = ?", (user_id,)).fetchone():
+            return
+        records = self.history_model.query.filter_by(user_id=user_id)\
+            .order_by(self.history_model.created_at.desc())\
+            .limit(WINDOW_SIZE)\
+            .all()
+        records.reverse()
+        stored = self.db.session.get(self.summary_model, user_id)
+        summary = stored.summary if stored else None
+        summarized_upto = 0
+        if stored:
+            summarized_upto = sum(1 for record in records if record.created_at <= stored.summarized_through)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Outro worker pode ter carregado enquanto consultávamos o banco
+            if not conn.execute("SELECT 1 FROM windows WHERE user_id = ?", (user_id,)).fetchone():
+                for seq, record in enumerate(records):
+                    conn.execute(
+                        "INSERT INTO turns VALUES (?, ?, ?, ?, ?, ?)",
+                        (user_id, seq, record.role, record.message, record.created_at.isoformat(), record.id)
+                    )
+                conn.execute(
+                    "INSERT INTO windows (user_id, next_seq, summary, summarized_upto) VALUES (?, ?, ?, ?)",
+                    (user_id, len(records), summary, summarized_upto)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def recent(self, user_id):
+        """
+        Mensagens da janela em ordem cronológica, no formato de
+        ChatHistory.to_dict() (id é a chave de chat_history)
+        """
+        conn = _conn()
+        self._ensure_loaded(conn, user_id)
+        rows = self._window(conn, user_id)
+        if any(history_id is None for history_id, *_ in rows):
+            # Mensagens ainda na fila de gravação: grava as deste processo e relê
+            self.flush()
+            rows = self._window(conn, user_id)
+        if any(history_id is None for history_id, *_ in rows):
+            # Ainda pendentes na fila de outro worker: o banco tem os ids definitivos
+            records = self.history_model.query.filter_by(user_id=user_id)\
+                .order_by(self.history_model.created_at.desc())\
+                .limit(WINDOW_SIZE)\
+                .all()
+            return [record.to_dict() for record in reversed(records)]
+        return [{"id": history_id, "user_id": user_id, "role": role, "message": message,
+                 "created_at": created_at}
+                for history_id, role, message, created_at in rows]
+
+    @staticmethod
+    def _window(conn, user_id):
+        return conn.execute(
+            "SELECT history_id, role, message, created_at FROM turns WHERE user_id = ? ORDER BY seq",
+            (user_id,)
+        ).fetchall()
+
+    def context(self, user_id):
+        """
+        (resumo, mensagens) para montar o prompt: o resumo acumulado (ou None)
+        e as mensagens ainda não resumidas, no formato da OpenAI
+        """
+        conn = _conn()
+        self._ensure_loaded(conn, user_id)
+        summary, summarized_upto = conn.execute(
+            "SELECT summary, summarized_upto FROM windows WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT role, message FROM turns WHERE user_id = ? AND seq >= ? ORDER BY seq",
+            (user_id, summarized_upto)
+        )
+        return summary, [{"role": role, "content": message} for role, message in rows]
+
+    def append(self, user_id, turns):
+        """Acrescenta [(role, message)] à janela e agenda a gravação no banco"""
+        conn = _conn()
+        self._ensure_loaded(conn, user_id)
+        now = datetime.utcnow()
+        refresh = False
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            next_seq, summarized_upto, lease = conn.execute(
+                "SELECT next_seq, summarized_upto, summary_lease FROM windows WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            seqs = []
+            for role, message in turns:
+                conn.execute("INSERT INTO turns VALUES (?, ?, ?, ?, ?, NULL)",
+                             (user_id, next_seq, role, message, now.isoformat()))
+                seqs.append(next_seq)
+                next_seq += 1
+            conn.execute("UPDATE windows SET next_seq = ? WHERE user_id = ?", (next_seq, user_id))
+            conn.execute("DELETE FROM turns WHERE user_id = ? AND seq < ?",
+                         (user_id, next_seq - WINDOW_SIZE))
+            # Só um worker por vez gera o resumo de cada usuário
+            if (self.summarizer is not None
+                    and next_seq - KEEP_RECENT - summarized_upto >= SUMMARY_EVERY
+                    and (lease is None or lease < time.time())):
+                conn.execute("UPDATE windows SET summary_lease = ? WHERE user_id = ?",
+                             (time.time() + SUMMARY_LEASE, user_id))
+                refresh = True
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        for seq, (role, message) in zip(seqs, turns):
+            self._enqueue({"user_id": user_id, "role": role, "message": message, "created_at": now,
+                           "seq": seq})
+        if refresh:
+            self._background().submit(self._refresh_summary, user_id)
+
+    def clear(self, user_id):
+        """
+        Esvazia a janela e apaga o histórico durável do usuário. Mensagens
+        ainda na fila de outros workers são descartadas pela marca cleared_at.
+        """
+        self.flush()
+        now = datetime.utcnow().isoformat()
+        conn = _conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+            conn.execute(
+                "INSERT INTO windows (user_id, next_seq, cleared_at) VALUES (?, 0, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET cleared_at = excluded.cleared_at, "
+                "summary = NULL, summarized_upto = next_seq",
+                (user_id, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.history_model.query.filter_by(user_id=user_id).delete()
+        self.summary_model.query.filter_by(user_id=user_id).delete()
+        self.db.session.commit()
+
+    # Resumo acumulado
+
+    def _background(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor_pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        return self._executor
+
+    def _refresh_summary(self, user_id):
+        """Incorpora ao resumo as mensagens que saíram do trecho recente"""
+        conn = _conn()
+        try:
+            previous, summarized_upto, next_seq, cleared_at = conn.execute(
+                "SELECT summary, summarized_upto, next_seq, cleared_at FROM windows WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT seq, role, message, created_at FROM turns "
+                "WHERE user_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (user_id, summarized_upto, next_seq - KEEP_RECENT)
+            ).fetchall()
+            if not rows:
+                return
+            summary = self.summarizer(previous, [{"role": role, "content": message}
+                                                 for _, role, message, _ in rows])
+            if not summary:
+                return
+
+            # Descartar se o histórico foi limpo ou outro resumo foi gravado nesse meio tempo
+            last_seq, last_created = rows[-1][0], rows[-1][3]
+            updated = conn.execute(
+                "UPDATE windows SET summary = ?, summarized_upto = ? "
+                "WHERE user_id = ? AND summarized_upto = ? AND cleared_at IS ?",
+                (summary, last_seq + 1, user_id, summarized_upto, cleared_at)
+            ).rowcount
+            if not updated:
+                return
+            metrics.incr("ia_summary_refreshes")
+
+            summarized_through = datetime.fromisoformat(last_created)
+            with self.app.app_context():
+                stored = self.db.session.get(self.summary_model, user_id)
+                if stored is None:
+                    stored = self.summary_model(user_id=user_id)
+                    self.db.session.add(stored)
+                stored.summary = summary
+                stored.summarized_through = summarized_through
+                stored.updated_at = datetime.utcnow()
+                self._prune(user_id, summarized_through)
+                self.db.session.commit()
+        except Exception as e:
+            logger.error("Falha ao atualizar o resumo do chat (user_id=%s): %s", user_id, e)
+        finally:
+            conn.execute("UPDATE windows SET summary_lease = NULL WHERE user_id = ?", (user_id,))
+
+    def _prune(self, user_id, summarized_through):
+        """Política de retenção: só apaga mensagens antigas que já estão no resumo"""
+        cutoff = min(summarized_through, datetime.utcnow() - timedelta(days=RETENTION_DAYS))
+        self.history_model.query.filter(
+            self.history_model.user_id == user_id,
+            self.history_model.created_at <= cutoff
+        ).delete(synchronize_session=False)
+
+    # Write-behind
+
+    def _enqueue(self, item):
+        if self._thread is None or self._pid != os.getpid():
+            # Threads não sobrevivem ao fork: iniciar uma por processo
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+            self._thread.start()
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._retry_wait())
+            except queue.Empty:
+                # Nada novo, mas há um lote que falhou esperando a nova tentativa
+                self._write([])
+                continue
+            batch = []
+            marker = None
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while True:
+                if isinstance(item, threading.Event):
+                    # Pedido de flush(): grava o lote em andamento antes de responder
+                    marker = item
+                    break
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= BATCH_SIZE or timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch or marker is not None:
+                self._write(batch, force=marker is not None)
+            if marker is not None:
+                marker.set()
+
+    def flush(self):
+        """Grava imediatamente tudo o que está na fila (usado na saída e ao limpar)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            # A marca entra atrás das mensagens pendentes; a thread a sinaliza
+            # depois de gravar tudo o que veio antes, inclusive o lote que já tinha em mãos
+            marker = threading.Event()
+            self._queue.put(marker)
+            if marker.wait(FLUSH_TIMEOUT):
+                return
+            logger.warning("Gravação do chat não terminou em %ss; gravando o restante da fila", FLUSH_TIMEOUT)
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+            else:
+                batch.append(item)
+        if batch or self._failed:
+            self._write(batch, force=True)
+
+    def _write(self, batch, force=False):
+        """
+        Grava um lote no banco. Se a gravação falhar, as mensagens ficam
+        guardadas e voltam (antes das novas, na ordem) após uma espera que
+        dobra a cada falha; force=True (flush) tenta na hora.
+        """
+        with self._flush_lock:
+            if self._failed:
+                if not force and time.monotonic() < self._retry_at:
+                    self._failed.extend(batch)
+                    return False
+                batch, self._failed = self._failed + batch, []
+            if not batch:
+                return True
+            try:
+                conn = _conn()
+                user_ids = sorted({item["user_id"] for item in batch})
+                cleared = dict(conn.execute(
+                    "SELECT user_id, cleared_at FROM windows WHERE cleared_at IS NOT NULL "
+                    f"AND user_id IN ({','.join('?' * len(user_ids))})", user_ids
+                ).fetchall())
+                rows = [item for item in batch
+                        if not cleared.get(item["user_id"])
+                        or item["created_at"].isoformat() > cleared[item["user_id"]]]
+                if rows:
+                    ids = self._insert([{name: item[name] for name in HISTORY_COLUMNS} for item in rows])
+                    # A janela passa a expor o id definitivo de cada mensagem
+                    conn.executemany(
+                        "UPDATE turns SET history_id = ? WHERE user_id = ? AND seq = ?",
+                        [(history_id, item["user_id"], item["seq"]) for history_id, item in zip(ids, rows)]
+                    )
+            except Exception as e:
+                self._failed = batch
+                self._retry_at = time.monotonic() + self._retry_delay
+                logger.error("Falha ao gravar %d mensagens do chat (nova tentativa em %.0fs): %s",
+                             len(batch), self._retry_delay, e)
+                self._retry_delay = min(self._retry_delay * 2, RETRY_MAX)
+                return False
+            self._retry_delay = RETRY_MIN
+            return True
+
+    def _insert(self, rows):
+        """Insere as mensagens em chat_history e retorna os ids, na ordem de `rows`"""
+        with self.app.app_context():
+            try:
+                ids = self.db.session.execute(
+                    self.db.insert(self.history_model)
+                    .returning(self.history_model.id, sort_by_parameter_order=True),
+                    rows
+                ).scalars().all()
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+        return ids
+
+    def _retry_wait(self):
+        """Quanto a thread pode esperar por mensagens antes de retomar um lote que falhou"""
+        if not self._failed:
+            return None
+        return max(self._retry_at - time.monotonic(), 0.05)
+
+def init_chat_memory(app, history_model, summary_model, db, summarizer=None):
+    app.extensions["chat_memory"] = ChatMemory(app, history_model, summary_model, db, summarizer)
+    return app.extensions["chat_memory"]
@@ -185,12 +185,14 @@ def recommend_instruments(bpm, key):
     return instruments[:4]
 
 
-def analyze_chords_and_suggestions(bpm, audio_path=None):
+def analyze_chords_and_suggestions(bpm, audio_path=None, key=None):
     """
     Função principal que analisa o áudio e retorna acordes e sugestões.
+    Se `key` já foi estimada (ex.: análise rápida), ela é usada diretamente.
     """
     # Estima a tonalidade
-    key = estimate_key_from_audio(audio_path)
+    if key is None:
+        key = estimate_key_from_audio(audio_path)
     
     # Obtém os acordes principais
     chords = get_chords_for_key(key)
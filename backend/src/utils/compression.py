@@ -0,0 +1,76 @@
+"""
+Compressão negociada das respostas JSON da API
+
+Respostas de /api/ acima de COMPRESS_MIN_SIZE bytes são comprimidas com
+zstd (se o pacote zstandard estiver instalado e o cliente aceitar) ou gzip,
+conforme o Accept-Encoding. Níveis baixos e um teto de tamanho mantêm o
+custo de CPU limitado por resposta. Ficam de fora respostas em streaming
+(SSE, áudio decodificado), arquivos (send_file, X-Accel-Redirect), tipos já
+comprimidos como áudio e respostas que já têm Content-Encoding.
+
+Configuração: COMPRESS_MIN_SIZE (1024), COMPRESS_MAX_SIZE (8 MB),
+COMPRESS_GZIP_LEVEL (5), COMPRESS_ZSTD_LEVEL (3).
+"""
+import gzip
+import os
+
+from flask import request
+
+try:
+    import zstandard
+except ImportError:  # zstd é opcional: sem ele só gzip
+    zstandard = None
+
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+MAX_SIZE = int(os.environ.get("COMPRESS_MAX_SIZE", 8 * 1024 * 1024))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 5))
+ZSTD_LEVEL = int(os.environ.get("COMPRESS_ZSTD_LEVEL", 3))
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml")
+
+
+def _choose_encoding(accept_encodings):
+    if zstandard is not None and accept_encodings["zstd"]:
+        return "zstd"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def init_compression(app, prefix="/api/"):
+    @app.after_request
+    def compress_response(response):
+        if not request.path.startswith(prefix) or request.method == "HEAD":
+            return response
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or "Content-Encoding" in response.headers
+                or "X-Accel-Redirect" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        length = response.calculate_content_length()
+        if length is None or length < MIN_SIZE or length > MAX_SIZE:
+            return response
+        encoding = _choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        compressed = _compress(response.get_data(), encoding)
+        if len(compressed) >= length:
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        etag, _ = response.get_etag()
+        if etag:
+            # O corpo mudou: a ETag deixa de ser forte
+            response.set_etag(etag, weak=True)
+        return response
+
+    return compress_response
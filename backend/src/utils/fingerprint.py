@@ -0,0 +1,254 @@
+"""
+Impressão digital acústica por landmarks (reconhecimento local de gravações)
+
+Substitui o shazamio: nada sai do servidor. Cada gravação vira uma
+constelação de picos do espectrograma (máximos locais em tempo x
+frequência) e cada pico âncora é combinado com alguns picos seguintes. O
+par (frequência da âncora, frequência do alvo, distância em frames) vira
+um hash de 24 bits guardado com o frame da âncora em um índice invertido
+no SQLite (hash -> gravação, frame).
+
+Para reconhecer um trecho, os hashes dele são procurados no índice e, para
+cada gravação, conta-se quantos concordam na mesma diferença entre o frame
+da gravação e o do trecho: uma cópia (mesmo cortada, com ganho diferente ou
+com ruído) acumula dezenas de hashes alinhados no deslocamento em que o
+trecho começa, enquanto coincidências ficam espalhadas. A busca é por
+chave no índice, então o custo cresce com o tamanho do trecho e não com o
+do catálogo.
+
+Os landmarks são calculados pelo analisador interno "fingerprint"
+(utils/analyzers.py), que reaproveita o áudio já carregado na análise do
+upload. O índice é identificado por blob (SHA-256 do conteúdo); gravações
+cujo blob foi apagado saem na próxima `flask fingerprint-index`.
+"""
+import os
+import sqlite3
+import threading
+
+SAMPLE_RATE = 11025
+N_FFT = 1024
+HOP_LENGTH = 256
+FREQ_BINS = 512  # 9 bits; o bin de Nyquist é descartado
+
+# Constelação: máximos locais nessa vizinhança (bins x frames), acima do piso em dB,
+# e no máximo PEAKS_PER_SECOND picos (os mais fortes) em cada segundo
+PEAK_NEIGHBOURHOOD = (25, 15)
+PEAK_FLOOR_DB = -60
+PEAKS_PER_SECOND = 30
+# Pares: até FAN_OUT alvos por âncora, entre 1 e 63 frames depois (6 bits)
+FAN_OUT = 8
+MAX_DT = 63
+MAX_DF = 128
+
+# Hashes alinhados necessários para aceitar uma gravação
+MIN_ALIGNED = 12
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    blob_hash TEXT NOT NULL UNIQUE,
+    version TEXT NOT NULL,
+    landmarks INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS landmarks (
+    hash INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    frame INTEGER NOT NULL,
+    PRIMARY KEY (hash, track_id, frame)
+) WITHOUT ROWID;
+"""
+
+# Limite de parâmetros por consulta (SQLITE_MAX_VARIABLE_NUMBER antigo)
+_QUERY_CHUNK = 900
+
+
+def frames_to_seconds(frames):
+    return round(float(frames) * HOP_LENGTH / SAMPLE_RATE, 2)
+
+
+def constellation(y):
+    """Picos (frames, bins) do espectrograma de um sinal mono em SAMPLE_RATE"""
+    import librosa
+    import numpy as np
+    from scipy.ndimage import maximum_filter
+
+    spectrogram = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))[:FREQ_BINS]
+    if not spectrogram.size or not spectrogram.max():
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    db = librosa.amplitude_to_db(spectrogram, ref=np.max)
+    peaks = (db == maximum_filter(db, size=PEAK_NEIGHBOURHOOD, mode="constant", cval=-np.inf)) & (db > PEAK_FLOOR_DB)
+    bins, frames = np.nonzero(peaks)
+    # Ruído de fundo gera muitos picos fracos: fica só com os mais fortes de cada segundo
+    block = frames // round(SAMPLE_RATE / HOP_LENGTH)
+    order = np.lexsort((-db[bins, frames], block))
+    rank = np.arange(len(order)) - np.searchsorted(block[order], block[order])
+    keep = order[rank < PEAKS_PER_SECOND]
+    order = keep[np.lexsort((bins[keep], frames[keep]))]
+    return frames[order], bins[order]
+
+
+def landmarks(y):
+    """(hashes, frames) dos pares de picos de um sinal mono em SAMPLE_RATE"""
+    import numpy as np
+
+    frames, bins = constellation(y)
+    hashes, anchors = [], []
+    paired = np.zeros(len(frames), dtype=np.int64)
+    # Picos em ordem de tempo: os vizinhos seguintes são os alvos mais próximos
+    for k in range(1, 3 * FAN_OUT):
+        if k >= len(frames):
+            break
+        dt = frames[k:] - frames[:-k]
+        df = bins[k:] - bins[:-k]
+        valid = (dt > 0) & (dt <= MAX_DT) & (np.abs(df) <= MAX_DF) & (paired[:-k] < FAN_OUT)
+        paired[:-k] += valid
+        anchor = np.nonzero(valid)[0]
+        hashes.append((bins[anchor] << 15) | (bins[anchor + k] << 6) | dt[anchor])
+        anchors.append(frames[anchor])
+    if not hashes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(anchors)
+
+
+def fingerprint_signal(data, rate):
+    """Landmarks de um áudio mono em qualquer taxa de amostragem"""
+    import librosa
+    import numpy as np
+
+    y = np.asarray(data, dtype=np.float32)
+    if rate != SAMPLE_RATE:
+        y = librosa.resample(y, orig_sr=rate, target_sr=SAMPLE_RATE)
+    return landmarks(y)
+
+
+class FingerprintIndex:
+    """Índice invertido hash -> (gravação, frame) em um arquivo SQLite"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        # Uma conexão por thread, reaberta depois do fork dos workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def versions(self):
+        """{blob_hash: versão dos landmarks} de tudo que está indexado"""
+        return dict(self._conn().execute("SELECT blob_hash, version FROM tracks"))
+
+    def add(self, blob_hash, hashes, frames, version):
+        """Indexa uma gravação (substitui a anterior do mesmo blob, se a versão mudou)"""
+        import numpy as np
+
+        conn = self._conn()
+        row = conn.execute("SELECT id, version FROM tracks WHERE blob_hash = ?", (blob_hash,)).fetchone()
+        if row is not None and row[1] == version:
+            return False
+        # Ordenados por hash, as inserções seguem a ordem da chave da tabela
+        order = np.lexsort((frames, hashes))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if row is not None:
+                # Os landmarks da versão anterior ficam órfãos (ignorados na busca) até o prune()
+                conn.execute("DELETE FROM tracks WHERE id = ?", (row[0],))
+            track_id = conn.execute(
+                "INSERT INTO tracks (blob_hash, version, landmarks) VALUES (?, ?, ?)",
+                (blob_hash, version, len(hashes)),
+            ).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO landmarks (hash, track_id, frame) VALUES (?, ?, ?)",
+                ((int(h), track_id, int(f)) for h, f in zip(hashes[order], frames[order])),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def prune(self, keep):
+        """Remove as gravações cujo blob não está em `keep` e os landmarks órfãos; retorna quantas saíram"""
+        conn = self._conn()
+        gone = [(track_id,) for track_id, blob_hash in conn.execute("SELECT id, blob_hash FROM tracks")
+                if blob_hash not in keep]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("DELETE FROM tracks WHERE id = ?", gone)
+            # Varre o índice inteiro: só roda na manutenção, nunca em requisições
+            conn.execute("DELETE FROM landmarks WHERE track_id NOT IN (SELECT id FROM tracks)")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(gone)
+
+    def match(self, hashes, frames, limit=5, min_aligned=MIN_ALIGNED):
+        """
+        Gravações que contêm o trecho, da mais para a menos provável:
+        [{"blob_hash", "offset_seconds", "aligned", "confidence"}]. offset_seconds é
+        onde o trecho começa na gravação; confidence, a fração dos hashes do
+        trecho que concordaram.
+        """
+        import numpy as np
+
+        if not len(hashes):
+            return []
+        order = np.argsort(hashes, kind="stable")
+        query_hashes, query_frames = hashes[order], frames[order]
+
+        conn = self._conn()
+        unique = np.unique(query_hashes).tolist()
+        postings = []
+        for start in range(0, len(unique), _QUERY_CHUNK):
+            chunk = unique[start:start + _QUERY_CHUNK]
+            postings.extend(conn.execute(
+                f"SELECT hash, track_id, frame FROM landmarks WHERE hash IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        if not postings:
+            return []
+        found = np.array(postings, dtype=np.int64)
+
+        # Cada ocorrência no índice x cada ocorrência do mesmo hash no trecho
+        left = np.searchsorted(query_hashes, found[:, 0], side="left")
+        counts = np.searchsorted(query_hashes, found[:, 0], side="right") - left
+        posting = np.repeat(np.arange(len(found)), counts)
+        position = np.arange(len(posting)) - np.repeat(np.cumsum(counts) - counts, counts) + left[posting]
+        offsets = found[posting, 2] - query_frames[position]
+        tracks = found[posting, 1]
+
+        # Votos por (gravação, deslocamento), somando o deslocamento vizinho
+        # (o trecho raramente começa alinhado aos frames da gravação)
+        keys, votes = np.unique((tracks << 32) + (offsets + (1 << 31)), return_counts=True)
+        neighbour = np.zeros_like(votes)
+        adjacent = keys[1:] == keys[:-1] + 1
+        neighbour[:-1][adjacent] = votes[1:][adjacent]
+        votes = votes + neighbour
+
+        ranked = np.argsort(-votes, kind="stable")
+        best_tracks, first = np.unique(keys[ranked] >> 32, return_index=True)
+        best = ranked[np.sort(first)][:limit]
+        best = best[votes[best] >= min_aligned]
+        if not len(best):
+            return []
+
+        ids = [int(key >> 32) for key in keys[best]]
+        names = dict(conn.execute(
+            f"SELECT id, blob_hash FROM tracks WHERE id IN ({','.join('?' * len(ids))})", ids))
+        return [
+            {
+                "blob_hash": names[track_id],
+                "offset_seconds": frames_to_seconds((int(key) & 0xFFFFFFFF) - (1 << 31)),
+                "aligned": int(vote),
+                "confidence": round(min(1.0, vote / len(hashes)), 3),
+            }
+            for track_id, key, vote in zip(ids, keys[best], votes[best])
+            if track_id in names
+        ]
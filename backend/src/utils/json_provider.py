@@ -0,0 +1,78 @@
+"""
+Provider JSON do Flask baseado em orjson
+
+orjson serializa várias vezes mais rápido que o json da stdlib, trata
+escalares e arrays numpy nativamente e aceita orjson.Fragment: colunas que
+já guardam JSON (acordes, instrumentos, autores...) entram na resposta como
+estão, sem json.loads seguido de uma nova serialização.
+
+Sem orjson instalado, o provider padrão do Flask é usado com suporte a
+numpy, e raw_json() volta a decodificar o texto, mantendo o mesmo formato
+de resposta.
+"""
+import json
+import sys
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+_HAS_FRAGMENT = orjson is not None and hasattr(orjson, "Fragment")
+
+
+def raw_json(text, empty=None):
+    """Valor JSON já serializado para incluir em uma resposta; `empty` se vazio"""
+    if not text:
+        return empty
+    if _HAS_FRAGMENT:
+        return orjson.Fragment(text)
+    return json.loads(text)
+
+
+def _default(obj):
+    """Tipos que nem orjson nem a stdlib serializam sozinhos"""
+    # numpy só é consultado se já foi carregado por quem gerou o valor
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+    if isinstance(obj, date):
+        # Mesmo formato do provider padrão do Flask
+        return http_date(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return DefaultJSONProvider.default(obj)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+    if orjson is not None:
+        _options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+        def dumps(self, obj, **kwargs):
+            return self.dump_bytes(obj).decode("utf-8")
+
+        def dump_bytes(self, obj):
+            option = self._options
+            if self._app.debug:
+                option |= orjson.OPT_INDENT_2
+            return orjson.dumps(obj, default=_default, option=option)
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(self.dump_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def init_json(app):
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,320 @@
+"""
+Análise incremental de áudio recebido em pedaços (WebSocket /api/live-analysis)
+
+A extensão envia o áudio enquanto captura, e o servidor devolve estimativas
+de BPM, tom e loudness a cada poucos segundos de áudio, sem esperar o fim
+da música. Nada do áudio recebido é guardado: cada sessão mantém só
+estado de tamanho fixo, independente da duração:
+
+    loudness  filtro K (BS.1770) com estado entre pedaços, energia em passos
+              de 100 ms e um histograma das loudness dos blocos de 400 ms,
+              suficiente para o gating absoluto e relativo da loudness
+              integrada; momentânea (400 ms) e curta (3 s) dos últimos passos
+    onsets    espectro mel quadro a quadro (STFT 2048/512 a 22050 Hz) e um
+              buffer circular com os últimos ONSET_SECONDS do envelope de
+              onsets, de onde sai o tempo
+    croma     soma do croma de todos os quadros (12 valores), para o tom pelo
+              perfil de Krumhansl-Schmuckler
+
+Formatos aceitos: PCM s16le ou f32le (intercalado, com taxa e canais
+informados pelo cliente) ou Opus em WebM/Ogg, como gerado pelo
+MediaRecorder do navegador, decodificado por um ffmpeg por sessão.
+
+Configuração: LIVE_MAX_SESSIONS (1 por processo: cada sessão ocupa uma
+thread do worker), LIVE_MAX_SECONDS (300, em áudio e em tempo de conexão),
+LIVE_IDLE_TIMEOUT (10 s sem mensagens encerra a sessão). O handshake tem
+rate limit por IP (RATE_LIMIT_LIVE_ANALYSIS, 6/60).
+"""
+import os
+import queue
+import subprocess
+import threading
+from collections import deque
+
+import librosa
+import numpy as np
+import pyloudnorm as pyln
+import soxr
+from scipy.signal import lfilter
+
+from utils.preview_analysis import combine_tempos, estimate_key
+
+MAX_SESSIONS = int(os.environ.get("LIVE_MAX_SESSIONS", 1))
+MAX_SECONDS = float(os.environ.get("LIVE_MAX_SECONDS", 300))
+IDLE_TIMEOUT = float(os.environ.get("LIVE_IDLE_TIMEOUT", 10))
+MAX_CHUNK_BYTES = 1024 * 1024
+UPDATE_INTERVAL_RANGE = (1.0, 10.0)
+
+PCM_FORMATS = {"s16le": (np.int16, 1 / 32768.0), "f32le": (np.float32, 1.0)}
+CONTAINER_FORMATS = {"webm": "webm", "ogg": "ogg"}
+DECODED_RATE = 48000
+
+ANALYSIS_SR = 22050
+N_FFT = 2048
+HOP = 512
+N_MELS = 128
+ONSET_SECONDS = 12
+MIN_TEMPO_SECONDS = 4
+TEMPO_HISTORY = 5
+
+# Histograma de loudness dos blocos: -70 LUFS (gate absoluto) a +10, em 0,1 LU
+HIST_FLOOR = -70.0
+HIST_STEP = 0.1
+HIST_BINS = 800
+
+_slots = threading.BoundedSemaphore(MAX_SESSIONS)
+
+
+def acquire_slot():
+    """Reserva uma das LIVE_MAX_SESSIONS sessões do processo; False se lotado"""
+    return _slots.acquire(blocking=False)
+
+
+def release_slot():
+    _slots.release()
+
+
+def _loudness(mean_square):
+    return -0.691 + 10 * np.log10(max(mean_square, 1e-12))
+
+
+class LoudnessMeter:
+    """Loudness BS.1770 incremental com memória constante"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.step = int(rate * 0.1)
+        # Mesmos filtros do pyloudnorm (usado na análise do upload)
+        self.filters = []
+        for f in pyln.Meter(rate)._filters.values():
+            self.filters.append([f.b, f.a, np.zeros(max(len(f.a), len(f.b)) - 1)])
+        self.pending = 0.0
+        self.pending_count = 0
+        self.steps = deque(maxlen=30)  # últimos 3 s em passos de 100 ms
+        self.counts = np.zeros(HIST_BINS)
+        self.energy = np.zeros(HIST_BINS)
+
+    def feed(self, samples):
+        for f in self.filters:
+            samples, f[2] = lfilter(f[0], f[1], samples, zi=f[2])
+        squares = samples.astype(np.float64) ** 2
+        pos = 0
+        while pos < len(squares):
+            take = min(self.step - self.pending_count, len(squares) - pos)
+            self.pending += squares[pos:pos + take].sum()
+            self.pending_count += take
+            pos += take
+            if self.pending_count == self.step:
+                self._push_step(self.pending / self.step)
+                self.pending, self.pending_count = 0.0, 0
+
+    def _push_step(self, mean_square):
+        self.steps.append(mean_square)
+        if len(self.steps) < 4:
+            return
+        # Bloco de 400 ms com sobreposição de 75%: os últimos quatro passos
+        block = sum(list(self.steps)[-4:]) / 4
+        loudness = _loudness(block)
+        if loudness >= HIST_FLOOR:
+            index = min(HIST_BINS - 1, int((loudness - HIST_FLOOR) / HIST_STEP))
+            self.counts[index] += 1
+            self.energy[index] += block
+
+    def momentary(self):
+        return _loudness(sum(list(self.steps)[-4:]) / 4) if len(self.steps) >= 4 else None
+
+    def short_term(self):
+        return _loudness(sum(self.steps) / len(self.steps)) if len(self.steps) == self.steps.maxlen else None
+
+    def integrated(self):
+        total = self.counts.sum()
+        if not total:
+            return None
+        relative_gate = _loudness(self.energy.sum() / total) - 10
+        first = max(0, int(np.ceil((relative_gate - HIST_FLOOR) / HIST_STEP)))
+        counts, energy = self.counts[first:].sum(), self.energy[first:].sum()
+        return _loudness(energy / counts) if counts else None
+
+
+class SpectralTracker:
+    """Envelope de onsets e croma acumulado, quadro a quadro"""
+
+    def __init__(self):
+        self.window = np.hanning(N_FFT + 1)[:-1].astype(np.float32)
+        self.mel_basis = librosa.filters.mel(sr=ANALYSIS_SR, n_fft=N_FFT, n_mels=N_MELS)
+        self.chroma_basis = librosa.filters.chroma(sr=ANALYSIS_SR, n_fft=N_FFT)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.previous_mel = None
+        self.onsets = deque(maxlen=int(ONSET_SECONDS * ANALYSIS_SR / HOP))
+        self.chroma = np.zeros(12)
+        self.frames = 0
+
+    def feed(self, samples):
+        self.buffer = np.concatenate([self.buffer, samples])
+        if len(self.buffer) < N_FFT:
+            return
+        n_frames = 1 + (len(self.buffer) - N_FFT) // HOP
+        frames = np.lib.stride_tricks.sliding_window_view(self.buffer, N_FFT)[::HOP][:n_frames]
+        power = np.abs(np.fft.rfft(frames * self.window, axis=1)) ** 2
+        self.buffer = self.buffer[n_frames * HOP:]
+
+        mel = 10 * np.log10(np.maximum(power @ self.mel_basis.T, 1e-10))
+        previous = self.previous_mel if self.previous_mel is not None else mel[0]
+        diffs = np.diff(np.vstack([previous, mel]), axis=0)
+        self.onsets.extend(np.maximum(0.0, diffs).mean(axis=1))
+        self.previous_mel = mel[-1]
+
+        chroma = power @ self.chroma_basis.T
+        peak = chroma.max(axis=1, keepdims=True)
+        self.chroma += (chroma / np.where(peak > 0, peak, 1)).sum(axis=0)
+        self.frames += n_frames
+
+    def tempo(self):
+        if len(self.onsets) < MIN_TEMPO_SECONDS * ANALYSIS_SR / HOP:
+            return None
+        envelope = np.fromiter(self.onsets, dtype=np.float32, count=len(self.onsets))
+        return float(librosa.feature.tempo(onset_envelope=envelope, sr=ANALYSIS_SR, hop_length=HOP)[0])
+
+
+class FfmpegDecoder:
+    """Decodifica Opus em WebM/Ogg recebido aos pedaços para PCM f32 mono"""
+
+    def __init__(self, container):
+        self.output = queue.Queue()
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-v", "error", "-f", container, "-i", "pipe:0",
+             "-f", "f32le", "-ac", "1", "-ar", str(DECODED_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        fd = self.process.stdout.fileno()
+        while True:
+            data = os.read(fd, 64 * 1024)
+            if not data:
+                break
+            self.output.put(data)
+        self.output.put(None)
+
+    def feed(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+        return self._drain(block=False)
+
+    def finish(self):
+        self.process.stdin.close()
+        data = self._drain(block=True)
+        self.process.wait(timeout=10)
+        return data
+
+    def _drain(self, block):
+        chunks = []
+        while True:
+            try:
+                data = self.output.get(block=block, timeout=10 if block else None)
+            except queue.Empty:
+                break
+            if data is None:
+                break
+            chunks.append(data)
+        return b"".join(chunks)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class LiveSession:
+    """Estado de uma sessão: decodificação, loudness, onsets, croma e cadência das estimativas"""
+
+    def __init__(self, fmt="s16le", sample_rate=48000, channels=1, interval=3.0):
+        if fmt in PCM_FORMATS:
+            if not 8000 <= int(sample_rate) <= 192000 or not 1 <= int(channels) <= 8:
+                raise ValueError("sample_rate ou channels inválidos")
+            self.dtype, self.scale = PCM_FORMATS[fmt]
+            self.rate, self.channels = int(sample_rate), int(channels)
+            self.decoder = None
+        elif fmt in CONTAINER_FORMATS:
+            self.dtype, self.scale = np.float32, 1.0
+            self.rate, self.channels = DECODED_RATE, 1
+            self.decoder = FfmpegDecoder(CONTAINER_FORMATS[fmt])
+        else:
+            raise ValueError(f"Formato não suportado: {fmt}")
+
+        low, high = UPDATE_INTERVAL_RANGE
+        self.interval = max(low, min(high, float(interval)))
+        self.frame_bytes = np.dtype(self.dtype).itemsize * self.channels
+        self.leftover = b""
+        self.samples = 0
+        self.next_update = self.interval
+        self.loudness = LoudnessMeter(self.rate)
+        self.spectral = SpectralTracker()
+        self.resampler = None
+        if self.rate != ANALYSIS_SR:
+            self.resampler = soxr.ResampleStream(self.rate, ANALYSIS_SR, 1, dtype="float32", quality="LQ")
+        self.tempos = deque(maxlen=TEMPO_HISTORY)
+
+    @property
+    def seconds(self):
+        return self.samples / self.rate
+
+    def feed(self, data):
+        """Processa um pedaço recebido; retorna uma estimativa se chegou a hora de enviar"""
+        if self.decoder is not None:
+            data = self.decoder.feed(data)
+        self._process(data)
+        if self.seconds >= self.next_update:
+            self.next_update = self.seconds + self.interval
+            return self.estimate()
+        return None
+
+    def finish(self):
+        """Processa o que ainda está no decodificador e retorna a estimativa final"""
+        if self.decoder is not None:
+            self._process(self.decoder.finish())
+        return self.estimate()
+
+    def close(self):
+        if self.decoder is not None:
+            self.decoder.close()
+
+    def _process(self, data):
+        data = self.leftover + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self.leftover = data[usable:]
+        if not usable:
+            return
+        samples = np.frombuffer(data[:usable], dtype=self.dtype).astype(np.float32) * self.scale
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        self.samples += len(samples)
+        self.loudness.feed(samples)
+        if self.resampler is not None:
+            samples = self.resampler.resample_chunk(samples)
+        self.spectral.feed(samples)
+
+    def estimate(self):
+        tempo = self.spectral.tempo()
+        if tempo:
+            self.tempos.append(tempo)
+        bpm, bpm_confidence = combine_tempos(list(self.tempos)) if self.tempos else (None, 0.0)
+        key, key_confidence = estimate_key(self.spectral.chroma) if self.spectral.frames else (None, 0.0)
+        integrated = self.loudness.integrated()
+        momentary, short_term = self.loudness.momentary(), self.loudness.short_term()
+        return {
+            "seconds": round(self.seconds, 1),
+            "bpm": round(bpm) if bpm else None,
+            "key": key,
+            "lufs": round(integrated, 2) if integrated is not None else None,
+            "momentary_lufs": round(momentary, 2) if momentary is not None else None,
+            "short_term_lufs": round(short_term, 2) if short_term is not None else None,
+            "confidence": {
+                "bpm": round(bpm_confidence, 2),
+                "key": round(max(0.0, float(key_confidence)), 2),
+                # A loudness integrada estabiliza com a duração analisada
+                "lufs": round(min(1.0, self.seconds / 30), 2),
+            },
+        }
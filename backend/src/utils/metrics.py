@@ -0,0 +1,48 @@
+"""
+Contadores de métricas compartilhados entre workers
+
+Os valores ficam em SQLite no diretório compartilhado e são expostos em
+/api/metrics. Falhas ao gravar métricas são apenas registradas no log.
+"""
+import logging
+
+from utils import shared_state
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def incr(name, value=1):
+    """Soma `value` ao contador `name`"""
+    try:
+        shared_state.connect("metrics", _SCHEMA).execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, value)
+        )
+    except Exception as e:
+        logger.warning("Falha ao registrar métrica %s: %s", name, e)
+
+
+def set_value(name, value):
+    """Define o valor do medidor `name`"""
+    try:
+        shared_state.connect("metrics", _SCHEMA).execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, value)
+        )
+    except Exception as e:
+        logger.warning("Falha ao registrar métrica %s: %s", name, e)
+
+
+def snapshot():
+    """Todos os contadores como dict {nome: valor}"""
+    rows = shared_state.connect("metrics", _SCHEMA).execute("SELECT name, value FROM counters")
+    return {name: (int(value) if float(value).is_integer() else value) for name, value in rows}
@@ -0,0 +1,144 @@
+"""
+Análise rápida ("preview") para a extensão do Chrome
+
+Em vez de decodificar e analisar a faixa inteira, lê só algumas janelas
+curtas espalhadas pelo miolo da música (evitando introdução e final) e
+estima BPM, tom e loudness a partir delas. Cada estimativa vem com um
+valor de confiança entre 0 e 1:
+
+    bpm   fração das janelas cujo tempo concorda com a mediana (±4%,
+          dobros e metades incluídos)
+    key   correlação do croma médio com o perfil de Krumhansl-Schmuckler
+          do tom escolhido
+    lufs  1 - (diferença em LU entre a janela mais alta e a mais baixa) / 10
+
+Configuração: PREVIEW_WINDOWS (3) e PREVIEW_WINDOW_SECONDS (8), que a
+rota aceita sobrescrever por requisição dentro dos limites abaixo.
+"""
+import os
+
+import librosa
+import numpy as np
+import pyloudnorm as pyln
+import soundfile as sf
+
+DEFAULT_WINDOWS = int(os.environ.get("PREVIEW_WINDOWS", 3))
+DEFAULT_WINDOW_SECONDS = float(os.environ.get("PREVIEW_WINDOW_SECONDS", 8))
+MAX_WINDOWS = 10
+WINDOW_SECONDS_RANGE = (2.0, 30.0)
+ANALYSIS_SR = 22050
+TEMPO_TOLERANCE = 0.04
+
+PITCHES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+# Perfis de tonalidade de Krumhansl-Kessler (maior e menor, a partir de C)
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def clamp_params(windows=None, window_seconds=None):
+    """Número e duração das janelas dentro dos limites aceitos"""
+    windows = DEFAULT_WINDOWS if windows is None else windows
+    window_seconds = DEFAULT_WINDOW_SECONDS if window_seconds is None else window_seconds
+    low, high = WINDOW_SECONDS_RANGE
+    return max(1, min(MAX_WINDOWS, int(windows))), max(low, min(high, float(window_seconds)))
+
+
+def window_starts(total_frames, window_frames, windows):
+    """Início de cada janela: espalhadas entre 10% e 90% da faixa, ou nela toda se não couberem"""
+    if total_frames <= window_frames * windows:
+        return [0], total_frames
+    low, high = int(total_frames * 0.1), int(total_frames * 0.9)
+    if high - low < window_frames * windows:
+        low, high = 0, total_frames
+    if windows == 1:
+        return [(low + high - window_frames) // 2], window_frames
+    return [int(s) for s in np.linspace(low, high - window_frames, windows)], window_frames
+
+
+def read_windows(path, windows, window_seconds):
+    """Lê só as janelas escolhidas (mono, float32); retorna (janelas, taxa, duração em s)"""
+    with sf.SoundFile(path) as f:
+        rate, total = f.samplerate, f.frames
+        starts, length = window_starts(total, int(window_seconds * rate), windows)
+        chunks = []
+        for start in starts:
+            f.seek(start)
+            data = f.read(length, dtype="float32", always_2d=True)
+            chunks.append(data.mean(axis=1))
+    return chunks, rate, total / rate
+
+
+def estimate_key(chroma):
+    """Tom pelo método de Krumhansl-Schmuckler; retorna (nome, correlação)"""
+    scores = []
+    for mode, profile in (("Major", MAJOR_PROFILE), ("Minor", MINOR_PROFILE)):
+        for tonic in range(12):
+            r = np.corrcoef(chroma, np.roll(profile, tonic))[0, 1]
+            scores.append((0.0 if np.isnan(r) else r, f"{PITCHES[tonic]} {mode}"))
+    r, key = max(scores)
+    return key, r
+
+
+def combine_tempos(tempos):
+    """Mediana dos tempos por janela, corrigindo erros de oitava; retorna (bpm, concordância)"""
+    reference = float(np.median(tempos))
+    folded = [min((t, t * 2, t / 2), key=lambda c: abs(c - reference)) for t in tempos]
+    bpm = float(np.median(folded))
+    agreeing = sum(1 for t in folded if abs(t - bpm) <= bpm * TEMPO_TOLERANCE)
+    return bpm, agreeing / len(folded)
+
+
+def analyze_preview(audio_path, windows=None, window_seconds=None):
+    """Estimativas de BPM, tom e LUFS com confiança, a partir de poucas janelas da faixa"""
+    windows, window_seconds = clamp_params(windows, window_seconds)
+    try:
+        chunks, rate, duration = read_windows(audio_path, windows, window_seconds)
+        meter = pyln.Meter(rate)
+
+        tempos, window_lufs, spectra = [], [], []
+        chroma_total = np.zeros(12)
+        for chunk in chunks:
+            if len(chunk) < rate // 2:
+                continue
+            loudness = meter.integrated_loudness(chunk)
+            if np.isfinite(loudness):
+                window_lufs.append(loudness)
+
+            y = chunk if rate == ANALYSIS_SR else librosa.resample(
+                chunk, orig_sr=rate, target_sr=ANALYSIS_SR, res_type="soxr_qq")
+            stft = np.abs(librosa.stft(y))
+            spectra.append(np.mean(librosa.amplitude_to_db(stft, ref=np.max), axis=1))
+
+            onset_env = librosa.onset.onset_strength(S=librosa.amplitude_to_db(stft ** 2), sr=ANALYSIS_SR)
+            tempo = librosa.feature.tempo(onset_envelope=onset_env, sr=ANALYSIS_SR)[0]
+            if tempo > 0:
+                tempos.append(float(tempo))
+            chroma_total += librosa.feature.chroma_stft(S=stft ** 2, sr=ANALYSIS_SR).sum(axis=1)
+
+        if not spectra:
+            return None
+
+        analyzed = np.concatenate(chunks)
+        lufs = meter.integrated_loudness(analyzed) if len(analyzed) >= rate // 2 else float("-inf")
+        bpm, bpm_confidence = combine_tempos(tempos) if tempos else (0.0, 0.0)
+        key, key_confidence = estimate_key(chroma_total)
+        lufs_spread = max(window_lufs) - min(window_lufs) if window_lufs else None
+
+        return {
+            "bpm": round(bpm),
+            "key": key,
+            "lufs": round(float(lufs), 2) if np.isfinite(lufs) else None,
+            "confidence": {
+                "bpm": round(bpm_confidence, 2),
+                "key": round(max(0.0, float(key_confidence)), 2),
+                "lufs": round(max(0.0, 1 - lufs_spread / 10), 2) if lufs_spread is not None else 0.0,
+            },
+            "mean_frequency_spectrum": np.mean(spectra, axis=0).tolist(),
+            "windows": len(chunks),
+            "window_seconds": window_seconds,
+            "duration": round(duration, 2),
+            "coverage": round(min(1.0, len(analyzed) / rate / duration), 3) if duration else 0.0,
+        }
+    except Exception as e:
+        print(f"Erro na análise rápida: {e}")
+        return None
@@ -0,0 +1,195 @@
+"""
+Cache de respostas da IA para perguntas sem histórico
+
+Perguntas normalizadas (minúsculas, sem acentos, espaços e pontuação final
+colapsados) viram a chave de um cache LRU com TTL em SQLite no diretório
+compartilhado, visível para todos os workers. Perguntas idênticas feitas ao
+mesmo tempo são coalescidas: só uma chamada vai à OpenAI e as demais
+esperam o resultado, tanto entre threads quanto entre processos (via uma
+linha de "em andamento" com prazo de validade).
+
+Configuração: IA_CACHE_TTL (segundos, padrão 86400) e IA_CACHE_MAX_ENTRIES
+(padrão 1000).
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from utils import metrics, shared_state
+
+CACHE_TTL = int(os.environ.get("IA_CACHE_TTL", 86400))
+CACHE_MAX_ENTRIES = int(os.environ.get("IA_CACHE_MAX_ENTRIES", 1000))
+POLL_INTERVAL = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    tokens_used INTEGER NOT NULL,
+    latency_ms REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS inflight (
+    key TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_local_inflight = {}
+_local_lock = threading.Lock()
+
+
+def normalize_prompt(text):
+    """Forma canônica da pergunta usada na chave do cache"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip(" ?!.…")
+
+
+def cache_key(prompt, namespace):
+    """Chave do cache: namespace (modelo + system prompt) + pergunta normalizada"""
+    raw = f"{namespace}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _conn():
+    return shared_state.connect("prompt_cache", _SCHEMA)
+
+
+def get(key):
+    """Retorna {"response", "tokens_used", "latency_ms"} ou None"""
+    now = time.time()
+    conn = _conn()
+    row = conn.execute(
+        "SELECT response, tokens_used, latency_ms, created_at FROM responses WHERE key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    if now - row[3] > CACHE_TTL:
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        return None
+    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+    return {"response": row[0], "tokens_used": row[1], "latency_ms": row[2]}
+
+
+def put(key, response, tokens_used, latency_ms):
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, response, tokens_used, latency_ms, now, now)
+        )
+        # Evicção LRU: manter no máximo CACHE_MAX_ENTRIES respostas
+        conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+            "ORDER BY last_access DESC LIMIT -1 OFFSET ?)", (CACHE_MAX_ENTRIES,)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _claim(key, lease):
+    """
+    Marca a pergunta como em andamento. Retorna o prazo gravado, que
+    identifica a marca deste processo, ou None se outro processo já marcou.
+    """
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM inflight WHERE key = ? AND expires_at <= ?", (key, now))
+        claimed = conn.execute(
+            "INSERT OR IGNORE INTO inflight (key, expires_at) VALUES (?, ?)", (key, now + lease)
+        ).rowcount == 1
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return now + lease if claimed else None
+
+
+def _unclaim(key, claim):
+    """Remove a marca só se ainda for a deste processo (pode ter expirado e sido retomada)"""
+    _conn().execute("DELETE FROM inflight WHERE key = ? AND expires_at = ?", (key, claim))
+
+
+def _wait_for(key, timeout):
+    """Espera outro processo preencher o cache; None se o prazo esgotar"""
+    deadline = time.time() + timeout
+    conn = _conn()
+    while time.time() < deadline:
+        cached = get(key)
+        if cached is not None:
+            return cached
+        if conn.execute("SELECT 1 FROM inflight WHERE key = ?", (key,)).fetchone() is None:
+            return get(key)
+        time.sleep(POLL_INTERVAL)
+    return None
+
+
+def get_or_compute(key, compute, timeout):
+    """
+    Retorna (resultado, origem) com origem "hit", "coalesced" ou "miss".
+
+    compute() deve retornar um dict com "success", "response" e
+    "tokens_used"; só resultados com success são guardados no cache.
+    Resultados vindos do cache têm o formato de get().
+    """
+    cached = get(key)
+    if cached is not None:
+        metrics.incr("ia_cache_hits")
+        metrics.incr("ia_cache_saved_ms", cached["latency_ms"])
+        return cached, "hit"
+
+    # Coalescência entre threads do mesmo processo
+    with _local_lock:
+        event = _local_inflight.get(key)
+        owner = event is None
+        if owner:
+            event = _local_inflight[key] = threading.Event()
+    if not owner:
+        event.wait(timeout)
+        cached = get(key)
+        if cached is not None:
+            metrics.incr("ia_cache_coalesced")
+            metrics.incr("ia_cache_saved_ms", cached["latency_ms"])
+            return cached, "coalesced"
+        return compute(), "miss"
+
+    try:
+        # Coalescência entre processos
+        claim = _claim(key, timeout)
+        if claim is None:
+            cached = _wait_for(key, timeout)
+            if cached is not None:
+                metrics.incr("ia_cache_coalesced")
+                metrics.incr("ia_cache_saved_ms", cached["latency_ms"])
+                return cached, "coalesced"
+            # O dono pode ainda estar calculando: seguimos sem marca e não mexemos na dele
+            claim = _claim(key, timeout)
+
+        try:
+            metrics.incr("ia_cache_misses")
+            started = time.monotonic()
+            result = compute()
+            if result.get("success"):
+                put(key, result["response"], result.get("tokens_used", 0),
+                    (time.monotonic() - started) * 1000)
+            return result, "miss"
+        finally:
+            if claim is not None:
+                _unclaim(key, claim)
+    finally:
+        with _local_lock:
+            _local_inflight.pop(key, None)
+        event.set()
@@ -0,0 +1,168 @@
+"""
+Rate limiting por token bucket compartilhado entre workers
+
+Cada par (rota, chave) tem um balde com capacidade e taxa de reposição. O
+estado fica em SQLite no diretório compartilhado (utils/shared_state.py),
+então o limite vale para o container inteiro e não por worker. Cada
+verificação é uma leitura e uma escrita por chave primária (O(1)); baldes
+que já voltaram a encher são removidos periodicamente.
+"""
+import ipaddress
+import logging
+import math
+import os
+import random
+import time
+from functools import wraps
+
+from flask import request, jsonify, current_app
+
+from utils import shared_state
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    bucket TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    full_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Probabilidade de limpar baldes cheios a cada verificação
+PRUNE_PROBABILITY = 0.01
+
+
+def take_token(bucket, limit, period, cost=1.0):
+    """
+    Consome `cost` fichas do balde. Retorna (permitido, segundos_para_tentar_de_novo).
+    """
+    rate = limit / period
+    now = time.time()
+    conn = shared_state.connect("rate_limit", _SCHEMA)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE bucket = ?", (bucket,)).fetchone()
+        if row is None:
+            tokens = float(limit)
+        else:
+            tokens = min(float(limit), row[0] + (now - row[1]) * rate)
+
+        allowed = tokens >= cost
+        retry_after = 0.0
+        if allowed:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / rate
+
+        full_at = now + (limit - tokens) / rate
+        conn.execute(
+            "INSERT INTO buckets (bucket, tokens, updated, full_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(bucket) DO UPDATE SET tokens = excluded.tokens, "
+            "updated = excluded.updated, full_at = excluded.full_at",
+            (bucket, tokens, now, full_at)
+        )
+        if random.random() < PRUNE_PROBABILITY:
+            # Baldes cheios equivalem a baldes inexistentes
+            conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return allowed, retry_after
+
+
+def get_limit(name, limit, period):
+    """
+    Limite efetivo de uma rota. Pode ser sobrescrito por
+    app.config["RATE_LIMITS"][name] = (limite, período) ou pela variável de
+    ambiente RATE_LIMIT_<NOME> no formato "limite/período_em_segundos".
+    """
+    configured = current_app.config.get("RATE_LIMITS", {}).get(name)
+    if configured:
+        return configured
+    raw = os.environ.get(f"RATE_LIMIT_{name.upper()}")
+    if raw:
+        try:
+            raw_limit, raw_period = raw.split("/")
+            return int(raw_limit), float(raw_period)
+        except ValueError:
+            logger.warning("RATE_LIMIT_%s inválido: %s", name.upper(), raw)
+    return limit, period
+
+
+def trusted_proxies():
+    """
+    Redes dos proxies cujo X-Real-IP é aceito: app.config["TRUSTED_PROXIES"]
+    ou TRUSTED_PROXIES ("172.28.0.0/16,10.0.0.5"). Vazio por padrão.
+    """
+    raw = current_app.config.get("TRUSTED_PROXIES", os.environ.get("TRUSTED_PROXIES", ""))
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    networks = []
+    for entry in (part.strip() for part in raw):
+        if not entry:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(entry, strict=False))
+        except ValueError:
+            logger.warning("TRUSTED_PROXIES inválido: %s", entry)
+    return networks
+
+
+def client_ip():
+    """
+    IP do cliente. O X-Real-IP definido pelo nginx só vale quando a conexão
+    vem de um proxy confiável; de qualquer outro endereço o cabeçalho seria
+    escolhido pelo próprio cliente e burlaria o limite por IP.
+    """
+    remote = request.remote_addr or "unknown"
+    real_ip = request.headers.get("X-Real-IP")
+    if real_ip and remote != "unknown":
+        try:
+            address = ipaddress.ip_address(remote)
+        except ValueError:
+            return remote
+        if any(address in network for network in trusted_proxies()):
+            return real_ip.strip()
+    return remote
+
+
+def rate_limit(name, limit, period, key="user"):
+    """
+    Decorator de rate limit por rota.
+
+    key="user" usa o id do current_user (aplicar abaixo de @token_required);
+    key="ip" usa o IP do cliente, para rotas públicas.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method == "OPTIONS":
+                return f(*args, **kwargs)
+
+            if key == "user":
+                subject = f"user:{args[0].id}"
+            else:
+                subject = f"ip:{client_ip()}"
+
+            effective_limit, effective_period = get_limit(name, limit, period)
+            try:
+                allowed, retry_after = take_token(f"{name}:{subject}", effective_limit, effective_period)
+            except Exception as e:
+                # Falha no armazenamento do limiter não deve derrubar a API
+                logger.warning("Rate limiter indisponível (%s): %s", name, e)
+                allowed, retry_after = True, 0
+
+            if not allowed:
+                seconds = max(1, math.ceil(retry_after))
+                response = jsonify({
+                    "error": f"Limite de requisições excedido. Tente novamente em {seconds} segundos."
+                })
+                response.headers["Retry-After"] = str(seconds)
+                return response, 429
+
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
@@ -0,0 +1,58 @@
+"""
+Versões leves para o player ("web renditions")
+
+Cada upload ganha, no pipeline de ingestão, uma cópia comprimida (Opus ou
+AAC) com bitrate configurável, gravada ao lado do blob original como
+ab/cd/<hash>.web<ext>. /api/audio/<id>/stream entrega essa versão por
+padrão; ?quality=original devolve o arquivo enviado, e /download sempre
+serve o original.
+
+Configuração:
+    STREAM_RENDITION_CODEC (opus)  opus (Ogg) ou aac (M4A, para Safari antigo)
+    STREAM_RENDITION_BITRATE (96k) bitrate passado ao ffmpeg
+"""
+import logging
+import os
+import subprocess
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CODECS = {
+    "opus": (".opus", "audio/ogg", ["-c:a", "libopus", "-vbr", "on"]),
+    "aac": (".m4a", "audio/mp4", ["-c:a", "aac", "-movflags", "+faststart"]),
+}
+RENDITION_CODEC = os.environ.get("STREAM_RENDITION_CODEC", "opus")
+RENDITION_BITRATE = os.environ.get("STREAM_RENDITION_BITRATE", "96k")
+FFMPEG_TIMEOUT = 600
+
+
+def rendition_relpath(digest):
+    ext = CODECS[RENDITION_CODEC][0]
+    return os.path.join(digest[:2], digest[2:4], f"{digest}.web{ext}")
+
+
+def mimetype_for(relpath):
+    ext = os.path.splitext(relpath)[1]
+    return next((mimetype for codec_ext, mimetype, _ in CODECS.values() if codec_ext == ext),
+                "application/octet-stream")
+
+
+def encode_rendition(source, tmp_dir):
+    """Gera a versão web de `source` em um temporário; retorna o caminho ou None se falhar"""
+    ext, _, codec_args = CODECS[RENDITION_CODEC]
+    target = os.path.join(tmp_dir, uuid.uuid4().hex + ext)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source, "-map", "0:a", "-vn",
+             *codec_args, "-b:a", RENDITION_BITRATE, target],
+            check=True, timeout=FFMPEG_TIMEOUT
+        )
+        return target
+    except Exception as e:
+        logger.error("Falha ao gerar versão web de %s: %s", source, e)
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+        return None
@@ -0,0 +1,50 @@
+"""
+Estado compartilhado entre os workers do gunicorn
+
+Arquivos SQLite em um diretório em memória (/dev/shm por padrão) guardam
+dados que precisam ser vistos por todos os processos, como os baldes do rate
+limiter. O conteúdo é descartável: é perdido quando o container reinicia.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+
+
+def _default_dir():
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "registrasom")
+
+
+SHARED_STATE_DIR = os.environ.get("SHARED_STATE_DIR") or _default_dir()
+
+_local = threading.local()
+
+
+def state_path(name):
+    """Caminho de um arquivo dentro do diretório compartilhado"""
+    os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+    return os.path.join(SHARED_STATE_DIR, name)
+
+
+def connect(name, schema=None):
+    """
+    Retorna a conexão SQLite desta thread para <name>.db.
+
+    As conexões são reabertas após um fork (o gunicorn importa o app antes de
+    criar os workers) e o schema é aplicado uma vez por conexão.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "pid", None) != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(name)
+    if conn is None:
+        conn = sqlite3.connect(state_path(f"{name}.db"), timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        if schema:
+            conn.executescript(schema)
+        connections[name] = conn
+    return conn
@@ -0,0 +1,405 @@
+"""
+Busca de faixas com som parecido (/api/audio/<id>/similar)
+
+Cada áudio ganha um embedding compacto (EMBEDDING_SIZE floats) calculado
+pelo analisador interno "embedding" a partir do que a análise já tem em
+mãos: média e desvio do cromagrama (harmonia), forma do espectro
+(centróide, largura de banda, rolloff, planicidade e contraste por banda)
+e o andamento. Ele é gravado em Audio.embedding e versionado como as
+outras features, então `flask backfill-analysis` preenche os uploads
+antigos.
+
+VectorIndex guarda todos os embeddings em uma matriz NumPy padronizada
+(média e desvio da biblioteca, com peso igual para cada grupo de
+atributos) e normalizada, e a similaridade é o cosseno. Até EXACT_MAX
+faixas a busca é exata (um produto matriz-vetor); acima disso as faixas são
+divididas em partições por k-means e a consulta só compara com as
+N_PROBE partições (de ~sqrt(n) faixas cada) de centróide mais próximo.
+
+O índice é montado em memória por processo na primeira busca e depois
+atualizado faixa a faixa: o listener de sessão grava em um log no
+shared_state cada embedding criado, alterado ou removido em um commit, e
+cada worker aplica as alterações posteriores à sua geração (acrescenta o
+vetor no fim da matriz, na partição de centróide mais próximo, ou marca a
+linha como removida). A padronização e os centróides valem enquanto a
+biblioteca não dobrar (ou cair pela metade) de tamanho; aí, ou com linhas
+removidas demais, o índice é reconstruído em uma thread enquanto o atual
+continua respondendo.
+"""
+import json
+import logging
+import math
+import os
+import threading
+
+from sqlalchemy import event, inspect
+
+from utils import shared_state
+
+logger = logging.getLogger(__name__)
+
+EXACT_MAX = int(os.environ.get("SIMILARITY_EXACT_MAX", 20000))
+N_PROBE = 8
+KMEANS_ITERATIONS = 15
+KMEANS_SAMPLE = 50000
+SPECTRUM_FLOOR = 1e-3
+MAX_FREQUENCY = 11025
+CONTRAST_BANDS = 5  # oitavas a partir de 200 Hz, até 6,4 kHz
+
+# Grupos do embedding, na ordem em que aparecem no vetor
+EMBEDDING_GROUPS = (
+    ("chroma_mean", 12),
+    ("chroma_std", 12),
+    ("spectral_shape", 8),  # log de centróide, banda, rolloff e planicidade: médias e desvios
+    ("spectral_contrast", CONTRAST_BANDS + 1),
+    ("tempo", 1),
+)
+EMBEDDING_SIZE = sum(size for _, size in EMBEDDING_GROUPS)
+MIN_STANDARDIZE = 2 * EMBEDDING_SIZE  # faixas para padronizar só pela biblioteca
+
+# Log de alterações de embedding (embedding NULL = áudio removido); a geração é o último seq
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    audio_id INTEGER NOT NULL,
+    user_id INTEGER,
+    embedding TEXT
+);
+"""
+CHANGELOG_MAX = 50000  # alterações guardadas; um índice mais atrasado que isso é reconstruído
+
+_lock = threading.Lock()
+_index = None
+_rebuilding = False
+
+
+def track_embedding(stft, rate, bpm):
+    """Embedding de uma faixa a partir da STFT em magnitude e do BPM"""
+    import librosa
+    import numpy as np
+
+    chroma = librosa.feature.chroma_stft(S=stft ** 2, sr=rate)
+    # Só até MAX_FREQUENCY, para não depender da taxa de amostragem do arquivo, e com
+    # piso em -60 dB, para planicidade e contraste não medirem ruído de quantização/codec
+    freq = librosa.fft_frequencies(sr=rate, n_fft=2 * (stft.shape[0] - 1))
+    band = freq <= MAX_FREQUENCY
+    freq = freq[band]
+    spectrum = np.maximum(stft[band], stft.max() * SPECTRUM_FLOOR)
+    shape = np.log(np.vstack([
+        librosa.feature.spectral_centroid(S=spectrum, freq=freq),
+        librosa.feature.spectral_bandwidth(S=spectrum, freq=freq),
+        librosa.feature.spectral_rolloff(S=spectrum, freq=freq),
+        librosa.feature.spectral_flatness(S=spectrum),
+    ]))
+    contrast = librosa.feature.spectral_contrast(S=spectrum, freq=freq, n_bands=CONTRAST_BANDS)
+    # Oitavas acima ou abaixo de 120 BPM; 0 quando o beat tracking não achou andamento
+    tempo = math.log2(bpm / 120) if bpm else 0.0
+    vector = np.concatenate([chroma.mean(axis=1), chroma.std(axis=1), shape.mean(axis=1),
+                             shape.std(axis=1), contrast.mean(axis=1), [tempo]])
+    return [round(float(value), 5) for value in vector]
+
+
+def _group_weights():
+    import numpy as np
+
+    return np.concatenate([np.full(size, 1 / math.sqrt(size)) for _, size in EMBEDDING_GROUPS])
+
+
+def _kmeans(points, clusters, seed=0):
+    """Centróides (normalizados) por k-means esférico"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), clusters, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = np.argmax(points @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, points)
+        empty = ~sums.any(axis=1)
+        # Partição vazia recomeça em um ponto aleatório
+        sums[empty] = points[rng.choice(len(points), int(empty.sum()))]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class VectorIndex:
+    """Embeddings padronizados com busca exata ou por partições, atualizável faixa a faixa"""
+
+    def __init__(self, ids, owners, vectors, generation=None, previous=None):
+        import numpy as np
+
+        ids = np.asarray(ids, dtype=np.int64)
+        n = len(ids)
+        raw = np.asarray(vectors, dtype=np.float32).reshape(n, EMBEDDING_SIZE)
+        self.generation = generation
+
+        reuse = previous is not None and previous.trained_size / 2 <= n <= previous.trained_size * 2
+        if reuse:
+            self.mean, self.scale, self.trained_size = previous.mean, previous.scale, previous.trained_size
+        else:
+            # Bibliotecas pequenas não estimam média e desvio de cada atributo (com duas
+            # faixas, cada uma vira o oposto da outra): mistura com a identidade até MIN_STANDARDIZE
+            weight = min(1.0, n / MIN_STANDARDIZE)
+            self.mean = (weight * raw.mean(axis=0)).astype(np.float32) if n \
+                else np.zeros(EMBEDDING_SIZE, dtype=np.float32)
+            variance = weight * (raw.var(axis=0) if n else 0) + (1 - weight)
+            self.scale = (_group_weights() / np.maximum(np.sqrt(variance), 1e-6)).astype(np.float32)
+            self.trained_size = max(n, 1)
+
+        # Buffers com folga: add() acrescenta no fim e remove() só marca a linha como morta
+        capacity = max(2 * n, 64)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._owners = np.zeros(capacity, dtype=np.int64)
+        self._vectors = np.zeros((capacity, EMBEDDING_SIZE), dtype=np.float32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._ids[:n], self._owners[:n], self._alive[:n] = ids, owners, True
+        self._vectors[:n] = self.normalize(raw)
+        self.size = self.count = n
+        self._rows = {int(audio_id): row for row, audio_id in enumerate(ids)}
+
+        self.centroids = self.lists = None
+        if n > EXACT_MAX:
+            vectors = self._vectors[:n]
+            if reuse and previous.centroids is not None:
+                self.centroids = previous.centroids
+            else:
+                sample = vectors[np.random.default_rng(0).permutation(n)[:KMEANS_SAMPLE]]
+                self.centroids = _kmeans(sample, int(math.sqrt(n)))
+            assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            bounds = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+            self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        self._publish()
+
+    @property
+    def method(self):
+        return "exact" if self.centroids is None else "partitioned"
+
+    def __len__(self):
+        return self.count
+
+    def normalize(self, vectors):
+        import numpy as np
+
+        scaled = (np.asarray(vectors, dtype=np.float32) - self.mean) * self.scale
+        norms = np.linalg.norm(scaled, axis=-1, keepdims=True)
+        return scaled / np.maximum(norms, 1e-12)
+
+    def _publish(self):
+        # Buscas em outras threads leem só essa tupla, trocada de uma vez ao fim de cada atualização
+        lists = None if self.lists is None else list(self.lists)
+        self._view = (self._ids[:self.size], self._owners[:self.size], self._vectors[:self.size],
+                      self._alive, lists)
+
+    def add(self, audio_id, owner, vector):
+        """Inclui (ou substitui) o embedding de um áudio"""
+        import numpy as np
+
+        self.remove(audio_id)
+        if self.size == len(self._ids):
+            capacity = 2 * len(self._ids)
+            self._ids = np.resize(self._ids, capacity)
+            self._owners = np.resize(self._owners, capacity)
+            self._vectors = np.resize(self._vectors, (capacity, EMBEDDING_SIZE))
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self.size] = self._alive[:self.size]
+            self._alive = alive
+        row = self.size
+        self._ids[row], self._owners[row] = audio_id, owner
+        self._vectors[row] = self.normalize(vector)
+        self._alive[row] = True
+        self._rows[int(audio_id)] = row
+        if self.centroids is not None:
+            nearest = int(np.argmax(self.centroids @ self._vectors[row]))
+            self.lists[nearest] = np.append(self.lists[nearest], row)
+        self.size += 1
+        self.count += 1
+
+    def remove(self, audio_id):
+        """Tira um áudio da busca; a linha só sai da matriz na próxima reconstrução"""
+        row = self._rows.pop(int(audio_id), None)
+        if row is not None:
+            self._alive[row] = False
+            self.count -= 1
+
+    def apply(self, changes, generation):
+        """Aplica [(audio_id, user_id, embedding_json ou None)] do log de alterações"""
+        for audio_id, owner, embedding in changes:
+            if embedding is None:
+                self.remove(audio_id)
+            else:
+                self.add(audio_id, owner, json.loads(embedding))
+        self.generation = generation
+        self._publish()
+
+    def stale(self):
+        """True se a padronização/partições não valem mais para o tamanho atual ou há linhas mortas demais"""
+        return (not self.trained_size / 2 <= max(self.count, 1) <= self.trained_size * 2
+                or (self.centroids is None and self.count > EXACT_MAX)
+                or self.size - self.count > max(self.count, 1000))
+
+    def _allowed(self, view, rows, owners, exclude):
+        import numpy as np
+
+        ids, index_owners, _, alive, _ = view
+        rows = rows[alive[rows]]
+        mask = np.zeros(len(rows), dtype=bool)
+        for owner in owners:
+            mask |= index_owners[rows] == owner
+        rows = rows[mask]
+        return rows[~np.isin(ids[rows], list(exclude))]
+
+    def search(self, vector, k, owners, exclude=()):
+        """[(id, similaridade)] dos k mais parecidos entre os áudios de `owners`, sem os ids de `exclude`"""
+        import numpy as np
+
+        view = self._view
+        ids, _, vectors, _, lists = view
+        if not len(ids):
+            return []
+        query = self.normalize(vector)
+        candidates = None
+        if lists is not None:
+            probed = np.argsort(self.centroids @ query)[-N_PROBE:]
+            candidates = self._allowed(view, np.concatenate([lists[i] for i in probed]), owners, exclude)
+        if candidates is None or len(candidates) < k:
+            # Busca exata, ou poucos áudios do usuário nas partições visitadas
+            candidates = self._allowed(view, np.arange(len(ids)), owners, exclude)
+        if not len(candidates):
+            return []
+        scores = vectors[candidates] @ query
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(ids[candidates[i]]), round(float(scores[i]), 4)) for i in top]
+
+
+def _conn():
+    return shared_state.connect("similarity", _SCHEMA)
+
+
+def current_generation():
+    return _conn().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+
+def record_changes(changes):
+    """Acrescenta [(audio_id, user_id, embedding_json ou None)] ao log lido pelos índices dos workers"""
+    conn = _conn()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT INTO changes (audio_id, user_id, embedding) VALUES (?, ?, ?)", changes)
+            conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGELOG_MAX,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    except Exception as e:
+        logger.warning("Falha ao registrar alterações no índice de similaridade: %s", e)
+
+
+def changes_since(generation):
+    """
+    (geração atual, [(audio_id, user_id, embedding_json)]) posteriores a
+    `generation`, ou (geração atual, None) se parte delas já saiu do log.
+    """
+    conn = _conn()
+    oldest, latest = conn.execute("SELECT MIN(seq), COALESCE(MAX(seq), 0) FROM changes").fetchone()
+    if latest <= generation:
+        return latest, []
+    if oldest > generation + 1:
+        return latest, None
+    rows = conn.execute(
+        "SELECT audio_id, user_id, embedding FROM changes WHERE seq > ? AND seq <= ? ORDER BY seq",
+        (generation, latest),
+    ).fetchall()
+    return latest, rows
+
+
+def _build(load, previous=None):
+    # Geração lida antes dos dados: alterações gravadas durante o load() são reaplicadas depois (são idempotentes)
+    generation = current_generation()
+    rows = load()
+    index = VectorIndex(
+        [row[0] for row in rows],
+        [row[1] for row in rows],
+        [json.loads(row[2]) for row in rows],
+        generation=generation,
+        previous=previous,
+    )
+    logger.info("Índice de similaridade montado: %d faixas (%s, pid %d)", len(index), index.method, os.getpid())
+    return index
+
+
+def _rebuild(load):
+    global _index, _rebuilding
+    try:
+        index = _build(load, previous=_index)
+        with _lock:
+            _index = index
+    except Exception as e:
+        logger.warning("Falha ao reconstruir o índice de similaridade: %s", e)
+    finally:
+        _rebuilding = False
+
+
+def _schedule_rebuild(load):
+    global _rebuilding
+    if _rebuilding:
+        return
+    _rebuilding = True
+    threading.Thread(target=_rebuild, args=(load,), name="similarity-rebuild", daemon=True).start()
+
+
+def get_index(load):
+    """
+    Índice do processo, em dia com o log de alterações.
+    `load()` devolve [(id, user_id, embedding_json)] de todos os áudios com embedding.
+
+    Só a primeira chamada do processo monta o índice na requisição. Depois as
+    alterações entram uma a uma, e reconstruções (biblioteca com o dobro ou
+    metade do tamanho, linhas removidas demais ou log perdido) rodam em uma
+    thread enquanto o índice atual continua respondendo.
+    """
+    global _index
+    with _lock:
+        if _index is None:
+            _index = _build(load)
+        generation, changes = changes_since(_index.generation)
+        if changes is None:
+            _schedule_rebuild(load)
+        elif changes:
+            _index.apply(changes, generation)
+        if _index.stale():
+            _schedule_rebuild(load)
+        return _index
+
+
+def install_similarity_listener(session, audio_model):
+    """Registra os hooks que levam ao log as alterações de embedding confirmadas em commits"""
+    @event.listens_for(session, "after_flush")
+    def _track_changes(flush_session, flush_context):
+        # Depois do flush os ids já existem; new/dirty/deleted ainda mostram o que foi gravado
+        changes = flush_session.info.setdefault("similarity_changes", [])
+        for obj in flush_session.new:
+            if isinstance(obj, audio_model) and obj.embedding is not None:
+                changes.append((obj.id, obj.user_id, obj.embedding))
+        for obj in flush_session.dirty:
+            if isinstance(obj, audio_model) and inspect(obj).attrs.embedding.history.has_changes():
+                changes.append((obj.id, obj.user_id, obj.embedding))
+        for obj in flush_session.deleted:
+            # Embedding não carregado: não dá para saber, então registra a remoção
+            state = inspect(obj)
+            if isinstance(obj, audio_model) and state.attrs.embedding.loaded_value is not None:
+                changes.append((state.identity[0], None, None))
+
+    @event.listens_for(session, "after_commit")
+    def _record(committed_session):
+        changes = committed_session.info.pop("similarity_changes", None)
+        if changes:
+            record_changes(changes)
+
+    @event.listens_for(session, "after_rollback")
+    def _discard(rolled_back_session):
+        rolled_back_session.info.pop("similarity_changes", None)
+
+    return _track_changes
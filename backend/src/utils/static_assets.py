@@ -0,0 +1,131 @@
+"""
+Entrega do build do SPA a partir de um manifesto montado na inicialização
+
+O diretório do build é lido uma vez por processo: cada arquivo vira uma
+entrada em memória com ETag forte (hash do conteúdo) e, para tipos
+textuais, variantes gzip e brotli pré-comprimidas. Cada requisição faz só
+uma busca em dict, sem os.path.exists nem leitura de disco, e caminhos
+desconhecidos caem no index.html do SPA.
+
+Só o que o Vite gera com hash no nome dentro de assets/ (assets/index-<hash>.js)
+recebe Cache-Control immutable de um ano; index.html e os demais arquivos,
+inclusive os copiados de public/ (apple-touch-icon.png,
+android-chrome-512x512.png...), são revalidados a cada visita (no-cache +
+ETag, resposta 304 sem corpo), para que uma troca chegue aos usuários.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só há variante gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml",
+                      "application/manifest+json", "application/xml")
+MIN_COMPRESS_SIZE = 1024
+MAX_MEMORY_FILE = 8 * 1024 * 1024  # arquivos maiores são servidos do disco
+HASHED_DIR = "assets/"  # build.assetsDir do Vite (padrão)
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def is_hashed(relpath):
+    """True para a saída com hash do Vite (assets/<nome>-<hash>.<ext>), que nunca muda de conteúdo"""
+    return relpath.startswith(HASHED_DIR) and bool(HASHED_NAME.search(os.path.basename(relpath)))
+
+
+class Asset:
+    def __init__(self, path, relpath):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(relpath)[0] or "application/octet-stream"
+        self.cache_control = IMMUTABLE if is_hashed(relpath) else REVALIDATE
+        self.size = os.path.getsize(path)
+        self.body = None
+        self.variants = {}  # encoding -> corpo comprimido
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            data = f.read() if self.size <= MAX_MEMORY_FILE else None
+            if data is None:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(chunk)
+            else:
+                sha.update(data)
+        self.etag = sha.hexdigest()[:20]
+
+        if data is None:
+            return
+        self.body = data
+        if self.size >= MIN_COMPRESS_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            candidates = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                candidates["br"] = brotli.compress(data, quality=11)
+            self.variants = {encoding: body for encoding, body in candidates.items() if len(body) < self.size}
+
+
+class AssetManifest:
+    index = None
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.assets = {}
+        if not os.path.isdir(self.root):
+            logger.warning("Build do frontend não encontrado em %s", self.root)
+            return
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                relpath = os.path.relpath(path, self.root).replace(os.sep, "/")
+                self.assets[relpath] = Asset(path, relpath)
+        self.index = self.assets.get("index.html")
+        logger.info("Manifesto do frontend: %d arquivos, %d com variantes comprimidas",
+                    len(self.assets), sum(1 for asset in self.assets.values() if asset.variants))
+
+    def lookup(self, path):
+        """Asset do caminho pedido ou o index.html (rotas do SPA); None sem build"""
+        return self.assets.get(path) or self.index
+
+    def respond(self, path):
+        asset = self.lookup(path)
+        if asset is None:
+            return None
+
+        encoding = None
+        if asset.variants:
+            accepted = request.accept_encodings
+            encoding = next((e for e in ("br", "gzip") if e in asset.variants and accepted[e]), None)
+        etag = asset.etag + (f"-{encoding}" if encoding else "")
+
+        headers = {"Cache-Control": asset.cache_control}
+        if asset.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if etag in request.if_none_match:
+            response = Response(status=304, headers=headers)
+        elif asset.body is None:
+            response = Response(_read_chunks(asset.path), mimetype=asset.mimetype, headers=headers)
+            response.headers["Content-Length"] = str(asset.size)
+        else:
+            body = asset.variants[encoding] if encoding else asset.body
+            response = Response(body, mimetype=asset.mimetype, headers=headers)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        return response
+
+
+def _read_chunks(path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b""):
+            yield chunk
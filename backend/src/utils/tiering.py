@@ -0,0 +1,166 @@
+"""
+Camada fria dos uploads: recompressão sem perdas de arquivos não acessados
+
+Blobs em formatos sem compressão (WAV/AIFF) que não são tocados nem baixados
+há COLD_TIER_IDLE_DAYS dias são recomprimidos para FLAC com o ffmpeg da
+imagem, e o original é apagado. A leitura continua transparente: stream e
+download decodificam o FLAC on-the-fly para o formato original, sem
+restaurar o arquivo inteiro em disco; rotas que precisam de um arquivo
+(transcrição) usam materialize(), que decodifica para um temporário.
+
+O job roda pelo comando `flask tier-uploads` (ver main.py) e devolve um
+relatório com os bytes recuperados.
+"""
+import logging
+import os
+import subprocess
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+COLD_EXT = ".flac"
+# Extensão do original -> formato de saída do ffmpeg na decodificação
+TIERABLE_FORMATS = {".wav": "wav", ".aif": "aiff", ".aiff": "aiff"}
+MIMETYPES = {"wav": "audio/wav", "aiff": "audio/aiff"}
+TOUCH_INTERVAL = timedelta(hours=1)
+CHUNK_SIZE = 64 * 1024
+FFMPEG_TIMEOUT = 600
+
+
+def original_format(path):
+    return TIERABLE_FORMATS[os.path.splitext(path)[1].lower()]
+
+
+def touch(engine, blob_table, digest):
+    """Registra acesso ao blob (no máximo uma escrita por TOUCH_INTERVAL)"""
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            blob_table.update()
+            .where(blob_table.c.hash == digest,
+                   (blob_table.c.last_access.is_(None)) | (blob_table.c.last_access < now - TOUCH_INTERVAL))
+            .values(last_access=now)
+        )
+
+
+def decode_stream(path, fmt):
+    """Gerador com o áudio decodificado pelo ffmpeg em `fmt`, em blocos"""
+    process = subprocess.Popen(
+        ["ffmpeg", "-nostdin", "-v", "error", "-i", path, "-f", fmt, "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            chunk = process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        # Cliente desconectou ou terminou: não deixar o ffmpeg órfão
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+@contextmanager
+def materialize(store, blob):
+    """Caminho de um arquivo com o conteúdo original do blob (temporário se estiver frio)"""
+    if not blob.cold_path:
+        yield store.abspath(blob.path)
+        return
+    ext = os.path.splitext(blob.path)[1].lower()
+    temp_path = os.path.join(store.tmp_dir, uuid.uuid4().hex + ext)
+    try:
+        subprocess.run(
+            ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", store.abspath(blob.cold_path),
+             "-f", original_format(blob.path), temp_path],
+            check=True, timeout=FFMPEG_TIMEOUT
+        )
+        yield temp_path
+    finally:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _recompress(source, target):
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-v", "error", "-y", "-i", source,
+         "-map", "0:a", "-c:a", "flac", "-compression_level", "8", target],
+        check=True, timeout=FFMPEG_TIMEOUT
+    )
+
+
+def run_tiering(engine, blob_table, store, idle_days, limit=None, dry_run=False):
+    """
+    Recomprime os blobs ociosos e retorna o relatório:
+    {"candidates", "tiered", "skipped", "failed", "bytes_before", "bytes_after", "bytes_reclaimed"}
+    """
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    last_seen = func.coalesce(blob_table.c.last_access, blob_table.c.created_at)
+    query = (
+        blob_table.select()
+        .where(blob_table.c.cold_path.is_(None), blob_table.c.refcount > 0, last_seen < cutoff)
+        .order_by(last_seen)
+    )
+    with engine.connect() as conn:
+        candidates = [row for row in conn.execute(query)
+                      if os.path.splitext(row.path)[1].lower() in TIERABLE_FORMATS]
+    if limit:
+        candidates = candidates[:limit]
+
+    report = {"candidates": len(candidates), "tiered": 0, "skipped": 0, "failed": 0,
+              "bytes_before": 0, "bytes_after": 0, "bytes_reclaimed": 0}
+    if dry_run:
+        report["bytes_before"] = sum(row.size for row in candidates)
+        return report
+
+    for row in candidates:
+        source = store.abspath(row.path)
+        cold_path = os.path.splitext(row.path)[0] + COLD_EXT
+        temp_path = os.path.join(store.tmp_dir, uuid.uuid4().hex + COLD_EXT)
+        try:
+            _recompress(source, temp_path)
+            hot_size = os.path.getsize(source)
+            cold_size = os.path.getsize(temp_path)
+            if cold_size >= hot_size:
+                report["skipped"] += 1
+                continue
+
+            with store.shard_lock(row.hash):
+                with engine.begin() as conn:
+                    # O blob pode ter sido liberado ou tocado enquanto comprimíamos
+                    updated = conn.execute(
+                        blob_table.update()
+                        .where(blob_table.c.hash == row.hash, blob_table.c.cold_path.is_(None),
+                               blob_table.c.refcount > 0,
+                               func.coalesce(blob_table.c.last_access, blob_table.c.created_at) < cutoff)
+                        .values(cold_path=cold_path, cold_size=cold_size)
+                    ).rowcount
+                    if updated:
+                        os.replace(temp_path, store.abspath(cold_path))
+                if not updated:
+                    report["skipped"] += 1
+                    continue
+                store.unlink(row.path)
+
+            report["tiered"] += 1
+            report["bytes_before"] += hot_size
+            report["bytes_after"] += cold_size
+        except Exception as e:
+            report["failed"] += 1
+            logger.error("Falha ao recomprimir blob %s: %s", row.hash, e)
+        finally:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+    report["bytes_reclaimed"] = report["bytes_before"] - report["bytes_after"]
+    return report
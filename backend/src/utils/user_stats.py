@@ -0,0 +1,240 @@
+"""
+Agregados por usuário mantidos de forma incremental
+
+Os contadores e histogramas da tabela user_stats são ajustados dentro do
+mesmo flush que insere, altera ou remove linhas de Audio, então /api/stats
+vira uma busca por chave primária em vez de quatro varreduras da biblioteca.
+"""
+import json
+import math
+from collections import defaultdict
+
+from sqlalchemy import event, func, inspect
+
+# Largura dos buckets dos histogramas
+BPM_BUCKET_WIDTH = 10
+LUFS_BUCKET_WIDTH = 3
+
+# Atributos de Audio que afetam os agregados
+TRACKED_ATTRIBUTES = ("user_id", "status", "filesize", "bpm", "key", "lufs")
+
+
+def bpm_bucket(bpm):
+    """Retorna o rótulo do bucket de BPM (ex.: '120-129')"""
+    if bpm is None:
+        return None
+    start = int(math.floor(bpm / BPM_BUCKET_WIDTH) * BPM_BUCKET_WIDTH)
+    return f"{start}-{start + BPM_BUCKET_WIDTH - 1}"
+
+
+def lufs_bucket(lufs):
+    """Retorna o rótulo do bucket de LUFS (ex.: '-15' para [-15, -12))"""
+    if lufs is None or math.isinf(lufs) or math.isnan(lufs):
+        return None
+    return str(int(math.floor(lufs / LUFS_BUCKET_WIDTH) * LUFS_BUCKET_WIDTH))
+
+
+class StatsDelta:
+    """Variação acumulada dos agregados de um usuário durante um flush"""
+
+    def __init__(self):
+        self.total_uploads = 0
+        self.completed_analyses = 0
+        self.pending_analyses = 0
+        self.total_size = 0
+        self.bpm = defaultdict(int)
+        self.key = defaultdict(int)
+        self.lufs = defaultdict(int)
+
+    def add(self, values, sign):
+        """Soma (sign=1) ou subtrai (sign=-1) a contribuição de um áudio"""
+        self.total_uploads += sign
+        if values["status"] == "completed":
+            self.completed_analyses += sign
+        elif values["status"] == "pending":
+            self.pending_analyses += sign
+        self.total_size += sign * (values["filesize"] or 0)
+
+        bucket = bpm_bucket(values["bpm"])
+        if bucket is not None:
+            self.bpm[bucket] += sign
+        if values["key"]:
+            self.key[values["key"]] += sign
+        bucket = lufs_bucket(values["lufs"])
+        if bucket is not None:
+            self.lufs[bucket] += sign
+
+    def is_empty(self):
+        return not (self.total_uploads or self.completed_analyses or self.pending_analyses
+                    or self.total_size or any(self.bpm.values())
+                    or any(self.key.values()) or any(self.lufs.values()))
+
+
+def load_histogram(raw):
+    """Decodifica um histograma armazenado, descartando buckets zerados"""
+    if not raw:
+        return {}
+    return {bucket: count for bucket, count in json.loads(raw).items() if count > 0}
+
+
+def _merge_histogram(raw, changes):
+    histogram = json.loads(raw) if raw else {}
+    for bucket, count in changes.items():
+        if not count:
+            continue
+        new_count = histogram.get(bucket, 0) + count
+        if new_count > 0:
+            histogram[bucket] = new_count
+        else:
+            histogram.pop(bucket, None)
+    return json.dumps(histogram, sort_keys=True)
+
+
+def _histogram_expression(column, changes):
+    """
+    Monta um UPDATE atômico do histograma JSON com json_set do SQLite, para
+    que dois workers atualizando o mesmo usuário não percam incrementos.
+    """
+    expression = func.coalesce(column, "{}")
+    for bucket, count in changes.items():
+        if not count:
+            continue
+        path = '$."%s"' % bucket.replace('"', '')
+        expression = func.json_set(
+            expression, path,
+            func.coalesce(func.json_extract(column, path), 0) + count
+        )
+    return expression
+
+
+def _snapshot(audio, committed):
+    """Valores atuais (committed=False) ou anteriores (committed=True) de um áudio"""
+    state = inspect(audio)
+    values = {}
+    for name in TRACKED_ATTRIBUTES:
+        history = state.attrs[name].history
+        if committed and history.deleted:
+            values[name] = history.deleted[0]
+        elif committed and history.unchanged:
+            values[name] = history.unchanged[0]
+        elif not committed and history.added:
+            values[name] = history.added[0]
+        else:
+            values[name] = getattr(audio, name)
+        if values[name] is None and not committed:
+            # Defaults de coluna (ex.: status) só são aplicados no INSERT
+            default = audio.__table__.c[name].default
+            if default is not None and default.is_scalar:
+                values[name] = default.arg
+    return values
+
+
+def build_user_stats(session, stats_model, audio_model, user_id):
+    """Cria a linha de agregados a partir de uma única varredura dos áudios do usuário"""
+    stats = stats_model(user_id=user_id, total_uploads=0, completed_analyses=0,
+                        pending_analyses=0, total_size=0)
+    delta = StatsDelta()
+    rows = session.query(
+        audio_model.status, audio_model.filesize, audio_model.bpm,
+        audio_model.key, audio_model.lufs
+    ).filter(audio_model.user_id == user_id)
+    for status, filesize, bpm, key, lufs in rows:
+        delta.add({"status": status, "filesize": filesize, "bpm": bpm,
+                   "key": key, "lufs": lufs}, 1)
+    _apply_plain(stats, delta)
+    return stats
+
+
+def seed_user_stats(session, stats_model, audio_model, user_id):
+    """
+    Garante a linha de agregados do usuário e a retorna. A semente vem de
+    build_user_stats e é gravada com INSERT ... ON CONFLICT DO NOTHING: se
+    outra transação semear o mesmo usuário ao mesmo tempo, vale a linha dela
+    em vez de um IntegrityError.
+    """
+    from sqlalchemy.dialects.sqlite import insert
+
+    seed = build_user_stats(session, stats_model, audio_model, user_id)
+    values = {name: getattr(seed, name) for name in (
+        "user_id", "total_uploads", "completed_analyses", "pending_analyses", "total_size",
+        "bpm_histogram", "key_histogram", "lufs_histogram")}
+    session.execute(insert(stats_model).values(**values)
+                    .on_conflict_do_nothing(index_elements=[stats_model.user_id]))
+    return session.get(stats_model, user_id)
+
+
+def _apply_plain(stats, delta):
+    stats.total_uploads = (stats.total_uploads or 0) + delta.total_uploads
+    stats.completed_analyses = (stats.completed_analyses or 0) + delta.completed_analyses
+    stats.pending_analyses = (stats.pending_analyses or 0) + delta.pending_analyses
+    stats.total_size = (stats.total_size or 0) + delta.total_size
+    stats.bpm_histogram = _merge_histogram(stats.bpm_histogram, delta.bpm)
+    stats.key_histogram = _merge_histogram(stats.key_histogram, delta.key)
+    stats.lufs_histogram = _merge_histogram(stats.lufs_histogram, delta.lufs)
+
+
+def _apply_atomic(stats, stats_model, delta):
+    stats.total_uploads = stats_model.total_uploads + delta.total_uploads
+    stats.completed_analyses = stats_model.completed_analyses + delta.completed_analyses
+    stats.pending_analyses = stats_model.pending_analyses + delta.pending_analyses
+    stats.total_size = stats_model.total_size + delta.total_size
+    if any(delta.bpm.values()):
+        stats.bpm_histogram = _histogram_expression(stats_model.bpm_histogram, delta.bpm)
+    if any(delta.key.values()):
+        stats.key_histogram = _histogram_expression(stats_model.key_histogram, delta.key)
+    if any(delta.lufs.values()):
+        stats.lufs_histogram = _histogram_expression(stats_model.lufs_histogram, delta.lufs)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    """Listener vazio: só existe para ligar active_history nos atributos acompanhados"""
+
+
+def install_stats_listener(session, stats_model, audio_model):
+    """
+    Registra o hook before_flush que mantém user_stats em sincronia com Audio.
+
+    Como o ajuste acontece no próprio flush, ele é confirmado ou desfeito
+    junto com a transação que criou, alterou ou excluiu o áudio.
+    """
+    # Sem active_history, alterar um atributo expirado (ex.: depois de um commit)
+    # não guarda o valor anterior, e o ajuste sairia zerado
+    for name in TRACKED_ATTRIBUTES:
+        event.listen(getattr(audio_model, name), "set", _keep_old_value, active_history=True)
+
+    @event.listens_for(session, "before_flush")
+    def _update_user_stats(flush_session, flush_context, instances):
+        deltas = defaultdict(StatsDelta)
+
+        for obj in flush_session.new:
+            if isinstance(obj, audio_model):
+                values = _snapshot(obj, committed=False)
+                deltas[values["user_id"]].add(values, 1)
+
+        for obj in flush_session.deleted:
+            if isinstance(obj, audio_model):
+                values = _snapshot(obj, committed=True)
+                deltas[values["user_id"]].add(values, -1)
+
+        for obj in flush_session.dirty:
+            if not isinstance(obj, audio_model) or not flush_session.is_modified(obj):
+                continue
+            state = inspect(obj)
+            if not any(state.attrs[name].history.has_changes() for name in TRACKED_ATTRIBUTES):
+                continue
+            old_values = _snapshot(obj, committed=True)
+            new_values = _snapshot(obj, committed=False)
+            deltas[old_values["user_id"]].add(old_values, -1)
+            deltas[new_values["user_id"]].add(new_values, 1)
+
+        with flush_session.no_autoflush:
+            for user_id, delta in deltas.items():
+                if user_id is None or delta.is_empty():
+                    continue
+                stats = flush_session.get(stats_model, user_id)
+                if stats is None:
+                    # Primeira alteração do usuário: semear a partir das linhas já gravadas
+                    stats = seed_user_stats(flush_session, stats_model, audio_model, user_id)
+                _apply_atomic(stats, stats_model, delta)
+
+    return _update_user_stats
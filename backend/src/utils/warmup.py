@@ -0,0 +1,124 @@
+"""
+Aquecimento do pipeline de análise na inicialização dos workers
+
+A primeira chamada de librosa.beat.beat_track / chroma_stft em um processo
+novo dispara a compilação JIT do numba, o que atrasa em vários segundos o
+primeiro upload que cai em cada worker recém-reciclado (--max-requests).
+warm_up() roda analyze_audio_features sobre um sinal sintético curto; com
+NUMBA_CACHE_DIR persistente a compilação só acontece no primeiro boot do
+container, e os seguintes só carregam o cache.
+
+O hook post_worker_init do gunicorn (backend/gunicorn.conf.py) chama
+warm_up_in_background(): o aquecimento roda em uma thread e o worker
+atende (/api/health e as rotas que não analisam áudio) desde o início.
+warm_up() também serve como initializer de pools de processos. Desligado
+com ANALYSIS_WARMUP=0.
+
+Métricas (em /api/metrics):
+    warmup_cold_ms / warmup_warm_ms    primeira e segunda execução do aquecimento
+    first_analysis_cold_ms             primeira análise real em processo não aquecido
+    first_analysis_warm_ms             primeira análise real em processo aquecido
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.environ.get("ANALYSIS_WARMUP", "1") != "0"
+SAMPLE_RATE = 22050
+DURATION = 3.0
+
+_warmed = False
+_first_analysis_done = False
+
+
+def synthetic_signal(sr=SAMPLE_RATE, duration=DURATION):
+    """Acorde de Lá maior com cliques a 120 BPM: exercita STFT, croma e beat tracking"""
+    import numpy as np
+
+    t = np.arange(int(sr * duration)) / sr
+    y = sum(0.2 * np.sin(2 * np.pi * f * t) for f in (220.0, 277.18, 329.63))
+    clicks = np.zeros_like(t)
+    step = int(sr * 0.5)
+    clicks[::step] = 1.0
+    y += np.convolve(clicks, np.hanning(256), mode="same")
+    return (y / np.max(np.abs(y)) * 0.8).astype("float32")
+
+
+def warm_up():
+    """Roda a análise completa duas vezes (fria e quente) e registra os tempos"""
+    global _warmed
+    if _warmed or not WARMUP_ENABLED:
+        return None
+
+    import soundfile as sf
+    from utils.audio_analysis import analyze_audio_features
+
+    fd, path = tempfile.mkstemp(prefix="warmup_", suffix=".wav")
+    os.close(fd)
+    try:
+        sf.write(path, synthetic_signal(), SAMPLE_RATE)
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            if analyze_audio_features(path) is None:
+                logger.warning("Aquecimento da análise falhou (pid %d)", os.getpid())
+                return None
+            timings.append((time.perf_counter() - start) * 1000)
+        # Modo rápido da extensão (janelas curtas) usa outras funções do librosa
+        from utils.preview_analysis import analyze_preview
+        analyze_preview(path, windows=1, window_seconds=2)
+    except Exception as e:
+        logger.warning("Aquecimento da análise falhou (pid %d): %s", os.getpid(), e)
+        return None
+    finally:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    _warmed = True
+    cold_ms, warm_ms = timings
+    metrics.set_value("warmup_cold_ms", round(cold_ms))
+    metrics.set_value("warmup_warm_ms", round(warm_ms))
+    logger.info("Análise aquecida (pid %d): %.0f ms a frio, %.0f ms aquecida",
+                os.getpid(), cold_ms, warm_ms)
+    return {"cold_ms": cold_ms, "warm_ms": warm_ms}
+
+
+def warm_up_in_background(log=logger):
+    """Inicia warm_up() em uma thread daemon, sem atrasar o início do worker"""
+    if _warmed or not WARMUP_ENABLED:
+        return None
+
+    def run():
+        result = warm_up()
+        if result:
+            log.info("Worker %s aquecido: %.0f ms a frio, %.0f ms aquecido",
+                     os.getpid(), result["cold_ms"], result["warm_ms"])
+
+    thread = threading.Thread(target=run, name="analysis-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+@contextmanager
+def timed_first_analysis():
+    """Mede a primeira análise real do processo, separando workers aquecidos ou não"""
+    global _first_analysis_done
+    if _first_analysis_done:
+        yield
+        return
+    _first_analysis_done = True
+    state = "warm" if _warmed else "cold"
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.set_value(f"first_analysis_{state}_ms", round((time.perf_counter() - start) * 1000))
@@ -0,0 +1,23 @@
+"""
+Configuração dos testes: o código do backend fica em backend/src e é
+importado como nos workers (utils.*). Cada teste usa um diretório de
+estado compartilhado próprio (ver utils/shared_state.py).
+"""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from utils import shared_state  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def shared_dir(tmp_path, monkeypatch):
+    """SHARED_STATE_DIR temporário, com as conexões SQLite das threads reabertas"""
+    directory = tmp_path / "shared"
+    monkeypatch.setattr(shared_state, "SHARED_STATE_DIR", str(directory))
+    monkeypatch.setattr(shared_state, "_local", threading.local())
+    return directory
@@ -0,0 +1,49 @@
+import pytest
+
+from utils import analyzers
+from utils.analyzers import REGISTRY, Analyzer, plan, run_analysis
+
+
+def register(monkeypatch, name, func, requires=()):
+    monkeypatch.setitem(REGISTRY, name, Analyzer(name, func, tuple(requires), 1, False))
+
+
+def test_plan_puts_dependencies_first():
+    order = plan(["embedding"])
+    assert order[-1] == "embedding"
+    for dependency in ("signal", "stft", "bpm"):
+        assert order.index(dependency) < order.index("embedding")
+    assert order.count("signal") == 1
+
+
+def test_plan_skips_known_features():
+    order = plan(["embedding"], known={"signal": None, "bpm": 120})
+    assert "signal" not in order and "bpm" not in order
+    assert order == ["stft", "embedding"]
+
+
+def test_plan_rejects_cycles(monkeypatch):
+    register(monkeypatch, "test_a", None, requires=("test_b",))
+    register(monkeypatch, "test_b", None, requires=("test_a",))
+    with pytest.raises(ValueError):
+        plan(["test_a"])
+
+
+def test_run_analysis_keeps_results_when_optional_feature_fails(monkeypatch):
+    def fail(audio_path, value):
+        raise RuntimeError("falhou")
+
+    register(monkeypatch, "test_base", lambda audio_path: 1)
+    register(monkeypatch, "test_double", lambda audio_path, value: value * 2, requires=("test_base",))
+    register(monkeypatch, "test_broken", fail, requires=("test_base",))
+
+    assert run_analysis("x.wav", ["test_double"], optional=["test_broken"]) == {
+        "test_double": 2, "test_broken": None}
+    assert run_analysis("x.wav", ["test_broken"]) is None
+
+
+def test_feature_versions_change_with_dependencies(monkeypatch):
+    before = analyzers.feature_versions(["embedding"])["embedding"]
+    signal = REGISTRY["signal"]
+    monkeypatch.setitem(REGISTRY, "signal", signal._replace(version=signal.version + 1))
+    assert analyzers.feature_versions(["embedding"])["embedding"] != before
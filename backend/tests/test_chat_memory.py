@@ -0,0 +1,155 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from utils import chat_memory
+from utils.chat_memory import ChatMemory
+
+
+class RecordingMemory(ChatMemory):
+    """Grava os lotes em uma lista, devagar, no lugar do banco"""
+
+    def __init__(self, delay=0.0):
+        super().__init__(app=None, history_model=None, summary_model=None, db=None)
+        self.delay = delay
+        self.written = []
+
+    def _insert(self, rows):
+        time.sleep(self.delay)
+        self.written.extend(rows)
+        return list(range(len(self.written) - len(rows) + 1, len(self.written) + 1))
+
+
+def item(n):
+    return {"user_id": 1, "role": "user", "message": str(n), "created_at": datetime.utcnow(), "seq": n}
+
+
+def numbers(rows):
+    return [int(row["message"]) for row in rows]
+
+
+def test_flush_includes_batch_held_by_writer():
+    memory = RecordingMemory(delay=0.2)
+    for i in range(5):
+        memory._enqueue(item(i))
+    # A thread já tirou o lote da fila e está gravando
+    time.sleep(0.05)
+    assert memory._queue.empty()
+
+    memory.flush()
+
+    assert numbers(memory.written) == [0, 1, 2, 3, 4]
+    assert memory._thread.is_alive()
+
+
+def test_flush_can_run_repeatedly_and_concurrently():
+    memory = RecordingMemory()
+    for i in range(3):
+        memory._enqueue(item(i))
+    flushers = [threading.Thread(target=memory.flush) for _ in range(3)]
+    for thread in flushers:
+        thread.start()
+    for thread in flushers:
+        thread.join(5)
+    memory._enqueue(item(3))
+    memory.flush()
+
+    assert numbers(memory.written) == [0, 1, 2, 3]
+
+
+def test_flush_without_writer_drains_queue():
+    memory = RecordingMemory()
+    memory._queue.put(item(0))
+
+    memory.flush()
+
+    assert numbers(memory.written) == [0]
+
+
+class FlakyMemory(RecordingMemory):
+    """Falha nas primeiras `failures` gravações, como um banco travado"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def _insert(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        return super()._insert(rows)
+
+
+def test_failed_batch_is_retried_in_order(monkeypatch):
+    monkeypatch.setattr(chat_memory, "RETRY_MIN", 0.1)
+    memory = FlakyMemory(failures=2)
+    memory._retry_delay = chat_memory.RETRY_MIN
+    memory._enqueue(item(0))
+    time.sleep(0.7)  # primeira gravação falhou; a thread aguarda a nova tentativa
+    memory._enqueue(item(1))
+
+    deadline = time.monotonic() + 5
+    while len(memory.written) < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert numbers(memory.written) == [0, 1]
+    assert memory.failures == 0 and not memory._failed
+
+
+def test_flush_retries_failed_batch_immediately():
+    memory = FlakyMemory(failures=1)
+    memory._queue.put(item(0))
+    memory.flush()
+    assert memory.written == [] and len(memory._failed) == 1
+
+    memory.flush()
+
+    assert numbers(memory.written) == [0]
+
+
+@pytest.fixture
+def app_memory(tmp_path):
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'chat.db'}"
+    db = SQLAlchemy(app)
+
+    class ChatHistory(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+        role = db.Column(db.String(20), nullable=False)
+        message = db.Column(db.Text, nullable=False)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+        def to_dict(self):
+            return {"id": self.id, "user_id": self.user_id, "role": self.role,
+                    "message": self.message, "created_at": self.created_at.isoformat()}
+
+    class ChatSummary(db.Model):
+        user_id = db.Column(db.Integer, primary_key=True)
+        summary = db.Column(db.Text)
+        summarized_through = db.Column(db.DateTime)
+        updated_at = db.Column(db.DateTime)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(ChatHistory(user_id=7, role="user", message="antiga", created_at=datetime(2024, 1, 1)))
+        db.session.commit()
+        yield ChatMemory(app, ChatHistory, ChatSummary, db), ChatHistory
+
+
+def test_history_keeps_chat_history_ids_and_shape(app_memory):
+    memory, history_model = app_memory
+    memory.append(7, [("user", "oi"), ("assistant", "olá")])
+
+    history = memory.recent(7)
+
+    stored = {record.message: record.id for record in history_model.query.all()}
+    assert [entry["message"] for entry in history] == ["antiga", "oi", "olá"]
+    assert [entry["id"] for entry in history] == [stored["antiga"], stored["oi"], stored["olá"]]
+    assert all(set(entry) == {"id", "user_id", "role", "message", "created_at"} and entry["user_id"] == 7
+               for entry in history)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from utils.fingerprint import SAMPLE_RATE, FingerprintIndex, fingerprint_signal
+
+
+def synthetic_track(seed, seconds=30):
+    """Sequência de notas curtas com harmônicos em frequências aleatórias"""
+    rng = np.random.default_rng(seed)
+    note = int(0.25 * SAMPLE_RATE)
+    t = np.arange(note) / SAMPLE_RATE
+    envelope = np.exp(-6 * t)
+    notes = []
+    for _ in range(int(seconds / 0.25)):
+        f0 = rng.uniform(150, 1500)
+        notes.append(envelope * sum(np.sin(2 * np.pi * f0 * h * t) / h for h in (1, 2, 3)))
+    return np.concatenate(notes).astype(np.float32)
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = FingerprintIndex(str(tmp_path / "fingerprints.db"))
+    for seed in (1, 2, 3):
+        index.add(f"blob{seed}", *fingerprint_signal(synthetic_track(seed), SAMPLE_RATE), "1")
+    return index
+
+
+def test_match_finds_excerpt_and_offset(index):
+    track = synthetic_track(2)
+    excerpt = track[10 * SAMPLE_RATE:18 * SAMPLE_RATE]
+    excerpt = 0.5 * excerpt + np.random.default_rng(0).normal(0, 0.01, len(excerpt)).astype(np.float32)
+
+    matches = index.match(*fingerprint_signal(excerpt, SAMPLE_RATE))
+
+    assert matches[0]["blob_hash"] == "blob2"
+    assert abs(matches[0]["offset_seconds"] - 10) < 0.1
+    assert matches[0]["aligned"] >= 12
+    assert all(match["blob_hash"] != "blob1" for match in matches)
+
+
+def test_match_ignores_unknown_audio(index):
+    assert index.match(*fingerprint_signal(synthetic_track(99, seconds=8), SAMPLE_RATE)) == []
+
+
+def test_add_replaces_old_version_and_prune_removes_blobs(index):
+    hashes, frames = fingerprint_signal(synthetic_track(3), SAMPLE_RATE)
+    assert index.add("blob3", hashes, frames, "1") is False
+    assert index.add("blob3", hashes, frames, "2") is True
+    assert index.versions()["blob3"] == "2"
+    assert index.match(hashes[:500], frames[:500])[0]["blob_hash"] == "blob3"
+
+    assert index.prune({"blob1", "blob3"}) == 1
+    assert set(index.versions()) == {"blob1", "blob3"}
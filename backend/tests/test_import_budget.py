@@ -0,0 +1,44 @@
+"""
+Orçamento de inicialização: importar src/main.py não pode carregar as
+dependências pesadas da análise (ver tools/import_report.py) e deve caber em
+IMPORT_BUDGET_MS.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools", "import_report.py")
+BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 1500))
+
+
+def load_tool():
+    spec = importlib.util.spec_from_file_location("import_report", TOOL)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def probe(tool, tmp_path):
+    env = dict(os.environ,
+               UPLOAD_FOLDER=str(tmp_path / "uploads"),
+               SHARED_STATE_DIR=str(tmp_path / "shared"),
+               FINGERPRINT_DB=str(tmp_path / "fingerprints.db"))
+    result = subprocess.run([sys.executable, "-c", tool.PROBE, json.dumps(tool.HEAVY_MODULES)],
+                            cwd=tool.SRC_DIR, env=env, capture_output=True, text=True, timeout=300)
+    if result.returncode != 0 and "ModuleNotFoundError" in result.stderr:
+        pytest.skip("dependências do app não instaladas: " + result.stderr.strip().splitlines()[-1])
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_main_import_stays_light_and_within_budget(tmp_path):
+    tool = load_tool()
+    first = probe(tool, tmp_path)
+    assert first["heavy"] == []
+    # A primeira importação pode incluir a compilação dos .pyc; vale a melhor de duas
+    elapsed = min(first["elapsed_ms"], probe(tool, tmp_path)["elapsed_ms"])
+    assert elapsed < BUDGET_MS, f"import main levou {elapsed:.0f} ms (orçamento {BUDGET_MS:.0f} ms)"
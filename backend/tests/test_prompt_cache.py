@@ -0,0 +1,56 @@
+import time
+
+from utils import prompt_cache
+
+
+def result(text="resposta"):
+    return {"success": True, "response": text, "tokens_used": 3}
+
+
+def inflight(key):
+    return prompt_cache._conn().execute("SELECT expires_at FROM inflight WHERE key = ?", (key,)).fetchone()
+
+
+def test_miss_then_hit_and_claim_released():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return result()
+
+    first, origin = prompt_cache.get_or_compute("k1", compute, timeout=1)
+    assert origin == "miss" and first["response"] == "resposta"
+    assert inflight("k1") is None
+
+    cached, origin = prompt_cache.get_or_compute("k1", compute, timeout=1)
+    assert origin == "hit" and cached["response"] == "resposta"
+    assert len(calls) == 1
+
+
+def test_unclaim_only_removes_own_claim():
+    claim = prompt_cache._claim("k2", 60)
+    assert claim is not None
+    assert prompt_cache._claim("k2", 60) is None
+
+    prompt_cache._unclaim("k2", claim - 1)
+    assert inflight("k2") is not None
+    prompt_cache._unclaim("k2", claim)
+    assert inflight("k2") is None
+
+
+def test_timeout_does_not_remove_other_process_claim():
+    # Outro processo marcou a pergunta e ainda está calculando
+    other = time.time() + 60
+    prompt_cache._conn().execute("INSERT INTO inflight (key, expires_at) VALUES (?, ?)", ("k3", other))
+
+    response, origin = prompt_cache.get_or_compute("k3", result, timeout=0.3)
+
+    assert origin == "miss" and response["response"] == "resposta"
+    assert inflight("k3") == (other,)
+
+
+def test_failed_results_are_not_cached():
+    response, origin = prompt_cache.get_or_compute("k4", lambda: {"success": False, "error": "x"}, timeout=1)
+    assert origin == "miss" and not response["success"]
+    assert prompt_cache.get("k4") is None
+    assert inflight("k4") is None
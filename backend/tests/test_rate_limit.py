@@ -0,0 +1,35 @@
+from flask import Flask
+
+from utils import rate_limit
+from utils.rate_limit import client_ip, take_token
+
+
+def test_bucket_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "time", lambda: now[0])
+
+    assert [take_token("test:ip", 3, 60)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = take_token("test:ip", 3, 60)
+    assert not allowed
+    assert retry_after == 20
+
+    now[0] += 20
+    assert take_token("test:ip", 3, 60)[0]
+    assert not take_token("test:ip", 3, 60)[0]
+
+
+def test_buckets_are_independent():
+    assert take_token("test:a", 1, 60)[0]
+    assert not take_token("test:a", 1, 60)[0]
+    assert take_token("test:b", 1, 60)[0]
+
+
+def test_real_ip_only_trusted_from_configured_proxies():
+    app = Flask(__name__)
+    app.config["TRUSTED_PROXIES"] = "172.28.0.0/16"
+    with app.test_request_context(headers={"X-Real-IP": "203.0.113.7"},
+                                  environ_base={"REMOTE_ADDR": "172.28.0.5"}):
+        assert client_ip() == "203.0.113.7"
+    with app.test_request_context(headers={"X-Real-IP": "203.0.113.7"},
+                                  environ_base={"REMOTE_ADDR": "198.51.100.1"}):
+        assert client_ip() == "198.51.100.1"
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+import pytest
+
+from utils import similarity
+from utils.similarity import EMBEDDING_SIZE, VectorIndex
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    monkeypatch.setattr(similarity, "_index", None)
+
+
+def vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, EMBEDDING_SIZE)).astype(np.float32)
+
+
+@pytest.mark.parametrize("exact_max", [10 ** 9, 200])
+def test_incremental_updates_match_fresh_index(monkeypatch, exact_max):
+    monkeypatch.setattr(similarity, "EXACT_MAX", exact_max)
+    data = vectors(900)
+    index = VectorIndex(range(600), [i % 2 for i in range(600)], data[:600])
+    for i in range(600, 900):
+        index.add(i, i % 2, data[i])
+    for i in range(0, 900, 5):
+        index.remove(i)
+    index.apply([], generation=1)
+
+    kept = [i for i in range(900) if i % 5]
+    fresh = VectorIndex(kept, [i % 2 for i in kept], data[kept], previous=index)
+    found = index.search(data[7], 10, {1})
+    expected = fresh.search(data[7], 10, {1})
+
+    assert len(index) == len(kept)
+    assert all(audio_id % 5 and audio_id % 2 == 1 for audio_id, _ in found)
+    if index.method == "exact":
+        assert found == expected
+    else:
+        assert len({i for i, _ in found} & {i for i, _ in expected}) >= 8
+
+
+def test_get_index_applies_changes_without_reloading():
+    data = vectors(20)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [(i, 1, json.dumps(data[i].tolist())) for i in range(10)]
+
+    index = similarity.get_index(load)
+    similarity.record_changes([(50, 1, json.dumps(data[15].tolist())), (3, None, None)])
+    index = similarity.get_index(load)
+
+    assert len(loads) == 1
+    assert len(index) == 10
+    assert index.search(data[15], 1, {1})[0][0] == 50
+    assert 3 not in {audio_id for audio_id, _ in index.search(data[3], 10, {1})}
+
+
+def test_small_library_scores_are_not_mirrored():
+    data = vectors(3, seed=4)
+    index = VectorIndex([1, 2], [1, 1], data[:2])
+
+    own, other = index.search(data[0], 2, {1})
+
+    assert own == (1, 1.0)
+    # Com a padronização pura, duas faixas sempre saíam com similaridade -1
+    assert other[1] > -0.5
+    assert index.search(data[0], 1, {1}, exclude={1})[0][1] == other[1]
+
+
+def test_standardization_reaches_library_statistics():
+    data = vectors(similarity.MIN_STANDARDIZE, seed=5) * 3 + 10
+    index = VectorIndex(range(len(data)), [1] * len(data), data)
+
+    assert np.allclose(index.mean, data.mean(axis=0), atol=1e-4)
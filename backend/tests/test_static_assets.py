@@ -0,0 +1,39 @@
+import pytest
+from flask import Flask
+
+from utils.static_assets import IMMUTABLE, REVALIDATE, AssetManifest
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    files = {
+        "index.html": "<html></html>",
+        "assets/index-BxYz12_a.js": "console.log(1);" * 200,
+        "assets/logo-D4fG7hJk.svg": "<svg/>",
+        "apple-touch-icon.png": "png",
+        "android-chrome-512x512.png": "png",
+        "site.webmanifest": "{}",
+    }
+    for relpath, content in files.items():
+        path = tmp_path / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return AssetManifest(str(tmp_path))
+
+
+def test_only_hashed_vite_output_is_immutable(manifest):
+    assert manifest.assets["assets/index-BxYz12_a.js"].cache_control == IMMUTABLE
+    assert manifest.assets["assets/logo-D4fG7hJk.svg"].cache_control == IMMUTABLE
+    for relpath in ("index.html", "apple-touch-icon.png", "android-chrome-512x512.png", "site.webmanifest"):
+        assert manifest.assets[relpath].cache_control == REVALIDATE, relpath
+
+
+def test_revalidation_and_spa_fallback(manifest):
+    app = Flask(__name__)
+    icon = manifest.assets["apple-touch-icon.png"]
+    with app.test_request_context(headers={"If-None-Match": f'"{icon.etag}"'}):
+        response = manifest.respond("apple-touch-icon.png")
+        assert response.status_code == 304
+        assert response.headers["Cache-Control"] == REVALIDATE
+    with app.test_request_context():
+        assert manifest.respond("some/spa/route").get_data(as_text=True) == "<html></html>"
@@ -0,0 +1,169 @@
+import json
+
+import pytest
+from sqlalchemy import BigInteger, Column, Float, Integer, String, Text, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from utils import user_stats
+from utils.user_stats import install_stats_listener, load_histogram, seed_user_stats
+
+Base = declarative_base()
+
+
+class Audio(Base):
+    __tablename__ = "audio"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    filesize = Column(Integer, nullable=False)
+    bpm = Column(Float)
+    key = Column(String(10))
+    lufs = Column(Float)
+    status = Column(String(20), default="completed")
+
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, primary_key=True)
+    total_uploads = Column(Integer, nullable=False, default=0)
+    completed_analyses = Column(Integer, nullable=False, default=0)
+    pending_analyses = Column(Integer, nullable=False, default=0)
+    total_size = Column(BigInteger, nullable=False, default=0)
+    bpm_histogram = Column(Text)
+    key_histogram = Column(Text)
+    lufs_histogram = Column(Text)
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    install_stats_listener(factory, UserStats, Audio)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def session(factory):
+    session = factory()
+    yield session
+    session.close()
+
+
+def stats_of(session, user_id):
+    session.expire_all()
+    stats = session.get(UserStats, user_id)
+    if stats is None:
+        return None
+    return {
+        "total": stats.total_uploads,
+        "completed": stats.completed_analyses,
+        "pending": stats.pending_analyses,
+        "size": stats.total_size,
+        "bpm": load_histogram(stats.bpm_histogram),
+        "key": load_histogram(stats.key_histogram),
+        "lufs": load_histogram(stats.lufs_histogram),
+    }
+
+
+def add_audio(session, **values):
+    audio = Audio(**{"user_id": 1, "filesize": 100, "bpm": 121.0, "key": "C Major", "lufs": -14.0, **values})
+    session.add(audio)
+    session.commit()
+    return audio
+
+
+def test_insert_seeds_and_increments(session):
+    add_audio(session)
+    add_audio(session, bpm=128.0, lufs=-8.0, status="pending", filesize=50)
+
+    assert stats_of(session, 1) == {
+        "total": 2, "completed": 1, "pending": 1, "size": 150,
+        "bpm": {"120-129": 2}, "key": {"C Major": 2}, "lufs": {"-15": 1, "-9": 1},
+    }
+
+
+def test_delete_removes_contribution(session):
+    keep = add_audio(session)
+    gone = add_audio(session, bpm=90.0, key="A Minor")
+    session.delete(gone)
+    session.commit()
+
+    stats = stats_of(session, 1)
+    assert stats["total"] == 1 and stats["size"] == keep.filesize
+    assert stats["bpm"] == {"120-129": 1}
+    assert stats["key"] == {"C Major": 1}
+
+
+def test_update_moves_buckets(session):
+    audio = add_audio(session)
+    audio.bpm = 95.0
+    audio.lufs = -20.0
+    session.commit()
+
+    stats = stats_of(session, 1)
+    assert stats["total"] == 1
+    assert stats["bpm"] == {"90-99": 1}
+    assert stats["lufs"] == {"-21": 1}
+
+
+def test_update_changing_owner_moves_audio_between_users(session):
+    add_audio(session, user_id=2)
+    audio = add_audio(session)
+    audio.user_id = 2
+    session.commit()
+
+    assert stats_of(session, 1)["total"] == 0
+    assert stats_of(session, 1)["bpm"] == {}
+    other = stats_of(session, 2)
+    assert other["total"] == 2 and other["size"] == 200 and other["bpm"] == {"120-129": 2}
+
+
+def test_rollback_leaves_stats_unchanged(session):
+    add_audio(session)
+    before = stats_of(session, 1)
+
+    session.add(Audio(user_id=1, filesize=999, bpm=60.0, key="E Minor", lufs=-30.0))
+    session.flush()
+    session.rollback()
+
+    assert stats_of(session, 1) == before
+
+
+def test_histograms_are_stored_as_json(session):
+    add_audio(session)
+    stored = session.get(UserStats, 1)
+    assert json.loads(stored.key_histogram) == {"C Major": 1}
+
+
+def test_seed_is_idempotent(session):
+    add_audio(session)
+    session.commit()
+
+    seeded = seed_user_stats(session, UserStats, Audio, 1)
+    session.commit()
+
+    assert seeded.total_uploads == 1
+    assert session.query(UserStats).count() == 1
+
+
+def test_concurrent_first_seed_does_not_fail(factory, session, monkeypatch):
+    build = user_stats.build_user_stats
+
+    def racing_build(*args):
+        # Outro worker semeia e confirma o mesmo usuário enquanto este varre os áudios
+        other = factory()
+        other.add(UserStats(user_id=1, total_uploads=5, completed_analyses=5, pending_analyses=0,
+                            total_size=500))
+        other.commit()
+        other.close()
+        return build(*args)
+
+    monkeypatch.setattr(user_stats, "build_user_stats", racing_build)
+    add_audio(session)
+
+    stats = stats_of(session, 1)
+    assert stats["total"] == 6 and stats["size"] == 600
+    assert stats["bpm"] == {"120-129": 1}
@@ -0,0 +1,31 @@
+import threading
+import time
+
+from utils import warmup
+
+
+def test_background_warm_up_does_not_block(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_warm_up():
+        started.set()
+        release.wait(5)
+        return {"cold_ms": 1.0, "warm_ms": 1.0}
+
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", True)
+    monkeypatch.setattr(warmup, "_warmed", False)
+    monkeypatch.setattr(warmup, "warm_up", slow_warm_up)
+
+    begin = time.perf_counter()
+    thread = warmup.warm_up_in_background()
+    assert time.perf_counter() - begin < 0.5
+    assert started.wait(5) and thread.daemon and thread.is_alive()
+
+    release.set()
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_background_warm_up_respects_switch(monkeypatch):
+    monkeypatch.setattr(warmup, "WARMUP_ENABLED", False)
+    assert warmup.warm_up_in_background() is None
@@ -0,0 +1,110 @@
+"""
+Relatório de tempo de importação do backend (python -X importtime)
+
+Importa src/main.py em um processo novo, mede o tempo total até o app
+estar montado e lista os módulos com maior tempo cumulativo. Também aponta
+dependências pesadas (librosa, scipy, numba, openai, whisper...) que tenham
+sido carregadas na inicialização: elas devem ser importadas só nas rotas
+que as usam, para que um worker recém-iniciado responda logo.
+
+Com --budget-ms o script serve de verificação (CI ou antes de um deploy):
+sai com código 1 se a importação passar do orçamento ou se algum módulo
+pesado for carregado.
+
+Uso:
+    python tools/import_report.py
+    python tools/import_report.py --budget-ms 800 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+HEAVY_MODULES = ("librosa", "numba", "scipy", "soundfile", "pyloudnorm", "openai",
+                 "torch", "whisper", "fpdf", "sklearn")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - start) * 1000
+heavy = sorted({name.split(".")[0] for name in sys.modules} & set(json.loads(sys.argv[1])))
+print(json.dumps({"elapsed_ms": elapsed, "heavy": heavy}))
+"""
+
+
+def parse_importtime(stderr):
+    """[(cumulativo_us, módulo)] a partir da saída de -X importtime"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|", 2)
+            rows.append((int(cumulative), name.rstrip()))
+        except ValueError:
+            continue
+    return rows
+
+
+def _depth(name):
+    """Nível na árvore de -X importtime (dois espaços por nível)"""
+    return (len(name) - len(name.lstrip()) - 1) // 2
+
+
+def run_probe(env_overrides):
+    import json
+
+    env = dict(os.environ)
+    env.update(env_overrides)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, json.dumps(HEAVY_MODULES)],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True
+    )
+    report = None
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            report = json.loads(line)
+            break
+    if result.returncode != 0 or report is None:
+        sys.stderr.write(result.stderr[-4000:])
+        sys.exit("Falha ao importar main.py")
+    return report, parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação de src/main.py")
+    parser.add_argument("--budget-ms", type=float, help="falha se a importação passar deste tempo")
+    parser.add_argument("--top", type=int, default=20, help="módulos mais lentos a listar")
+    args = parser.parse_args()
+
+    # Uploads e estado compartilhado descartáveis: a medição não toca nos arquivos reais
+    workdir = tempfile.mkdtemp(prefix="import-report-")
+    report, rows = run_probe({
+        "UPLOAD_FOLDER": os.path.join(workdir, "uploads"),
+        "SHARED_STATE_DIR": os.path.join(workdir, "shared"),
+    })
+
+    print(f"import main: {report['elapsed_ms']:.0f} ms")
+    print(f"\n{'cumulativo':>12}  módulo")
+    # Importações diretas de main.py (um nível abaixo na árvore), para não repetir os filhos
+    direct = [(us, name.strip()) for us, name in rows if _depth(name) == 1]
+    for us, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"{us / 1000:>9.1f} ms  {name}")
+
+    failures = []
+    if report["heavy"]:
+        failures.append("módulos pesados carregados na inicialização: " + ", ".join(report["heavy"]))
+    if args.budget_ms is not None and report["elapsed_ms"] > args.budget_ms:
+        failures.append(f"importação levou {report['elapsed_ms']:.0f} ms (orçamento {args.budget_ms:.0f} ms)")
+
+    for failure in failures:
+        print(f"\nFALHOU  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Servidor local compatível com a API de chat da OpenAI, para testes offline
+
+Implementa POST /v1/chat/completions com e sem streaming, gerando uma
+resposta determinística a partir da última mensagem do usuário. O atraso
+entre tokens e o tamanho da resposta são configuráveis, o que permite
+medir o tempo até o primeiro token e o comportamento sob backpressure do
+/api/ia/chat/stream sem rede nem chave de API.
+
+Uso:
+    python tools/openai_stub.py --port 8099 --token-delay 0.05 --tokens 80
+
+    # em outro terminal
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub \\
+        python src/main.py
+
+    curl -N -X POST http://localhost:5000/api/ia/chat/stream \\
+        -H "Authorization: Bearer <token>" -H "Content-Type: application/json" \\
+        -d '{"message": "O que é ISRC?"}'
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("royalties", "ECAD", "ISRC", "ISWC", "editora", "distribuidora", "fonograma",
+         "autor", "intérprete", "contrato", "streaming", "arrecadação")
+
+
+def fake_answer(prompt, tokens):
+    """Resposta determinística com `tokens` palavras derivada do prompt"""
+    seed = sum(prompt.encode("utf-8")) if prompt else 0
+    return [WORDS[(seed + i * 7) % len(WORDS)] + " " for i in range(tokens)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    token_delay = 0.05
+    tokens = 80
+    first_token_delay = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        messages = body.get("messages", [])
+        prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        words = fake_answer(prompt, min(self.tokens, body.get("max_tokens") or self.tokens))
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                 "total_tokens": prompt_tokens + len(words)}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            time.sleep(self.first_token_delay + self.token_delay * len(words))
+            self._send_json({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": model, "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(words)}}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None, chunk_usage=None):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "usage": chunk_usage,
+                "choices": [] if chunk_usage else [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            # write() bloqueia quando o cliente não consome: backpressure real
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            time.sleep(self.first_token_delay)
+            send_chunk({"role": "assistant", "content": ""})
+            for word in words:
+                send_chunk({"content": word})
+                time.sleep(self.token_delay)
+            send_chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send_chunk(None, chunk_usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local da API de chat da OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--token-delay", type=float, default=0.05, help="segundos entre tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="segundos até o primeiro token")
+    parser.add_argument("--tokens", type=int, default=80, help="tokens por resposta")
+    args = parser.parse_args()
+
+    StubHandler.token_delay = args.token_delay
+    StubHandler.first_token_delay = args.first_token_delay
+    StubHandler.tokens = args.tokens
+
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub OpenAI em http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
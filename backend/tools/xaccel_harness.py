@@ -0,0 +1,128 @@
+"""
+Teste local da entrega de arquivos via nginx (X-Accel-Redirect)
+
+Sobe um nginx temporário com o frontend/nginx.conf do repositório (backend
+apontado para um Flask local, /srv/uploads trocado pelo UPLOAD_FOLDER
+local) e verifica, para um áudio já enviado:
+
+  - /api/audio/<id>/stream responde pelo nginx com o arquivo completo;
+  - pedidos com Range recebem 206 com o trecho certo;
+  - /api/audio/<id>/download mantém o Content-Disposition do Flask;
+  - o cabeçalho X-Accel-Redirect não vaza para o cliente;
+  - /_protected_uploads/ não é acessível diretamente.
+
+Uso:
+    # terminal 1
+    FILE_DELIVERY_MODE=nginx UPLOAD_FOLDER=/tmp/uploads python src/main.py
+
+    # terminal 2 (nginx precisa estar instalado)
+    python tools/xaccel_harness.py --uploads /tmp/uploads --audio-id 1 --token <jwt>
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+NGINX_CONF = os.path.join(REPO_ROOT, "frontend", "nginx.conf")
+
+
+def render_config(workdir, port, backend, uploads, mime_types):
+    """nginx.conf completo a partir do server block usado em produção"""
+    server = open(NGINX_CONF, encoding="utf-8").read()
+    server = server.replace("http://backend:5000", backend.rstrip("/"))
+    server = server.replace("alias /srv/uploads/;", f"alias {os.path.abspath(uploads)}/;")
+    server = re.sub(r"listen\s+80;", f"listen 127.0.0.1:{port};", server)
+    server = server.replace("root /usr/share/nginx/html;", f"root {workdir};")
+    return f"""
+daemon off;
+pid {workdir}/nginx.pid;
+error_log {workdir}/error.log warn;
+events {{ worker_connections 64; }}
+http {{
+    include {mime_types};
+    access_log off;
+    client_body_temp_path {workdir}/client_body;
+    proxy_temp_path {workdir}/proxy;
+    fastcgi_temp_path {workdir}/fastcgi;
+    uwsgi_temp_path {workdir}/uwsgi;
+    scgi_temp_path {workdir}/scgi;
+{server}
+}}
+"""
+
+
+def fetch(url, headers=None):
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verifica a entrega de uploads via X-Accel-Redirect")
+    parser.add_argument("--uploads", required=True, help="UPLOAD_FOLDER do backend local")
+    parser.add_argument("--audio-id", type=int, required=True)
+    parser.add_argument("--token", required=True, help="JWT de um usuário (para /download)")
+    parser.add_argument("--backend", default="http://127.0.0.1:5000")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument("--nginx", default=shutil.which("nginx") or "nginx")
+    parser.add_argument("--mime-types", default="/etc/nginx/mime.types")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="xaccel-")
+    conf_path = os.path.join(workdir, "nginx.conf")
+    with open(conf_path, "w", encoding="utf-8") as f:
+        f.write(render_config(workdir, args.port, args.backend, args.uploads, args.mime_types))
+
+    nginx = subprocess.Popen([args.nginx, "-c", conf_path, "-p", workdir])
+    time.sleep(0.5)
+    if nginx.poll() is not None:
+        print(open(os.path.join(workdir, "error.log")).read(), file=sys.stderr)
+        sys.exit("nginx não iniciou")
+
+    base = f"http://127.0.0.1:{args.port}"
+    auth = {"Authorization": f"Bearer {args.token}"}
+    failures = []
+
+    def check(name, condition, detail=""):
+        print(f"{'ok ' if condition else 'FALHOU'}  {name} {detail}")
+        if not condition:
+            failures.append(name)
+
+    try:
+        status, headers, body = fetch(f"{base}/api/audio/{args.audio_id}/stream?quality=original")
+        check("stream completo", status == 200 and len(body) > 0, f"({status}, {len(body)} bytes)")
+        check("X-Accel-Redirect não vaza", "X-Accel-Redirect" not in headers)
+        check("Accept-Ranges", headers.get("Accept-Ranges") == "bytes", headers.get("Accept-Ranges", ""))
+        full = body
+
+        status, headers, body = fetch(f"{base}/api/audio/{args.audio_id}/stream?quality=original",
+                                      {"Range": "bytes=10-99"})
+        check("Range parcial", status == 206 and body == full[10:100], f"({status}, {len(body)} bytes)")
+
+        status, headers, body = fetch(f"{base}/api/audio/{args.audio_id}/download", auth)
+        check("download", status == 200 and body == full, f"({status})")
+        check("Content-Disposition", "attachment" in headers.get("Content-Disposition", ""),
+              headers.get("Content-Disposition", ""))
+
+        status, _, _ = fetch(f"{base}/_protected_uploads/")
+        check("location interna bloqueada", status == 404, f"({status})")
+    finally:
+        nginx.terminate()
+        nginx.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
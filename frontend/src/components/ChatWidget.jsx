@@ -77,7 +77,7 @@ const ChatWidget = () => {
         throw new Error('Você precisa estar logado');
       }
 
-      const response = await fetch('/api/ia/chat', {
+      const response = await fetch('/api/ia/chat/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -86,19 +86,53 @@ const ChatWidget = () => {
         body: JSON.stringify({ message: userMessage })
       });
 
-      const data = await response.json();
-
-      if (response.ok && data.success) {
-        // Adicionar resposta da IA
-        const assistantMessage = {
-          role: 'assistant',
-          message: data.response,
-          created_at: new Date().toISOString()
-        };
-        setMessages(prev => [...prev, assistantMessage]);
-      } else {
+      if (!response.ok) {
+        const data = await response.json();
         throw new Error(data.error || 'Erro ao enviar mensagem');
       }
+
+      // Mensagem da IA preenchida conforme os eventos SSE chegam
+      setMessages(prev => [...prev, {
+        role: 'assistant',
+        message: '',
+        created_at: new Date().toISOString()
+      }]);
+      const updateAssistant = (text) => {
+        setMessages(prev => [...prev.slice(0, -1), { ...prev[prev.length - 1], message: text }]);
+      };
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let text = '';
+      let finished = false;
+
+      while (!finished) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+          const dataLine = rawEvent.match(/^data: (.*)$/m)?.[1];
+          if (!dataLine) continue;
+          const payload = JSON.parse(dataLine);
+
+          if (eventName === 'delta') {
+            text += payload.content;
+            updateAssistant(text);
+          } else if (eventName === 'done') {
+            updateAssistant(payload.response);
+            finished = true;
+          } else if (eventName === 'error') {
+            // Remover a resposta parcial; a mensagem do usuário sai no catch
+            setMessages(prev => prev.slice(0, -1));
+            throw new Error(payload.error || 'Erro ao enviar mensagem');
+          }
+        }
+      }
     } catch (err) {
       setError(err.message);
       // Remover mensagem do usuário em caso de erro
@@ -46,12 +46,15 @@ const Dashboard = ({ user, token, onLogout }) => {
   const [error, setError] = useState('')
   const [currentPage, setCurrentPage] = useState(1)
   const [totalPages, setTotalPages] = useState(1)
+  // Cursores da paginação: pageCursors[n - 1] carrega a página n
+  const [pageCursors, setPageCursors] = useState([null])
 
   const [showSpectrum, setShowSpectrum] = useState(null)
   const [showTranscription, setShowTranscription] = useState(null)
   const [showChords, setShowChords] = useState(null)
   const [showInstruments, setShowInstruments] = useState(null)
   const [transcriptionData, setTranscriptionData] = useState({})
+  const [spectrumData, setSpectrumData] = useState({})
   const [showMusicRegistration, setShowMusicRegistration] = useState(false)
 
   useEffect(() => {
@@ -61,7 +64,13 @@ const Dashboard = ({ user, token, onLogout }) => {
 
   const fetchUploads = async () => {
     try {
-      const response = await fetch(`/api/my-uploads?page=${currentPage}&per_page=10`, {
+      const cursor = pageCursors[currentPage - 1]
+      const params = new URLSearchParams({
+        per_page: '10',
+        fields: 'summary,chords,chord_progressions,instruments'
+      })
+      if (cursor) params.set('cursor', cursor)
+      const response = await fetch(`/api/my-uploads?${params}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
@@ -71,6 +80,13 @@ const Dashboard = ({ user, token, onLogout }) => {
         const data = await response.json()
         setUploads(data.audios)
         setTotalPages(data.pages)
+        if (data.next_cursor) {
+          setPageCursors(prev => {
+            const next = prev.slice(0, currentPage)
+            next[currentPage] = data.next_cursor
+            return next
+          })
+        }
       } else {
         setError('Erro ao carregar uploads')
       }
@@ -185,6 +201,38 @@ const Dashboard = ({ user, token, onLogout }) => {
     }
   }
 
+  const handleToggleSpectrum = async (audioId) => {
+    if (showSpectrum === audioId) {
+      setShowSpectrum(null)
+      return
+    }
+
+    // O espectro não vem na listagem; buscar sob demanda
+    if (!spectrumData[audioId]) {
+      try {
+        const response = await fetch(`/api/audio/${audioId}?fields=frequency_spectrum`, {
+          headers: {
+            'Authorization': `Bearer ${token}`
+          }
+        })
+
+        if (!response.ok) {
+          setError('Erro ao carregar espectro')
+          return
+        }
+        const data = await response.json()
+        setSpectrumData(prev => ({
+          ...prev,
+          [audioId]: data.audio.frequency_spectrum
+        }))
+      } catch (err) {
+        setError('Erro de conexão')
+        return
+      }
+    }
+    setShowSpectrum(audioId)
+  }
+
   const handleViewTranscription = async (audioId) => {
     if (showTranscription === audioId) {
       setShowTranscription(null)
@@ -566,7 +614,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                                   variant="ghost"
                                   size="sm"
                                   className="p-0 h-auto text-orange-600 hover:text-orange-700 font-bold text-sm"
-                                  onClick={() => setShowSpectrum(showSpectrum === audio.id ? null : audio.id)}
+                                  onClick={() => handleToggleSpectrum(audio.id)}
                                 >
                                   {showSpectrum === audio.id ? (
                                     <><ChevronUp className="h-4 w-4 mr-1" />Ocultar</>
@@ -580,7 +628,7 @@ const Dashboard = ({ user, token, onLogout }) => {
 
                           {/* 📈 Espectro de Frequência (Expandível) */}
                           <AnimatePresence>
-                            {showSpectrum === audio.id && audio.frequency_spectrum && (
+                            {showSpectrum === audio.id && spectrumData[audio.id] && (
                               <motion.div
                                 initial={{ opacity: 0, height: 0 }}
                                 animate={{ opacity: 1, height: 'auto' }}
@@ -593,7 +641,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                                   Espectro de Frequência
                                 </h4>
                                 <ResponsiveContainer width="100%" height={250}>
-                                  <BarChart data={renderFrequencySpectrum(audio.frequency_spectrum)}>
+                                  <BarChart data={renderFrequencySpectrum(spectrumData[audio.id])}>
                                     <CartesianGrid strokeDasharray="3 3" />
                                     <XAxis
                                       dataKey="frequency"
@@ -704,7 +752,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                                   <FileText className="h-4 w-4 mr-2 text-green-600" />
                                   Transcrição
                                 </h4>
-                                {audio.transcription && audio.transcription !== '.' && (
+                                {audio.has_transcription && (
                                   <Button
                                     variant="ghost"
                                     size="sm"
@@ -719,7 +767,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                                   </Button>
                                 )}
                               </div>
-                              {audio.transcription && audio.transcription !== '.' ? (
+                              {audio.has_transcription ? (
                                 <>
                                   <AnimatePresence>
                                     {showTranscription === audio.id && (
@@ -730,7 +778,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                                         className="bg-green-50 p-4 rounded-lg border border-green-200 max-h-64 overflow-y-auto"
                                       >
                                         <p className="text-sm text-gray-700 whitespace-pre-wrap">
-                                          {transcriptionData[audio.id] || audio.transcription}
+                                          {transcriptionData[audio.id]}
                                         </p>
                                       </motion.div>
                                     )}
@@ -820,7 +868,7 @@ const Dashboard = ({ user, token, onLogout }) => {
                     </span>
                     <Button
                       onClick={() => setCurrentPage(prev => Math.min(totalPages, prev + 1))}
-                      disabled={currentPage === totalPages}
+                      disabled={currentPage === totalPages || !pageCursors[currentPage]}
                       variant="outline"
                       size="sm"
                     >
@@ -106,7 +106,7 @@ echo "  ✅ Instalação concluída com sucesso!"
 echo "========================================="
 echo ""
 echo "🌐 Acesse a aplicação em: http://localhost"
-echo "🔧 Backend API: http://localhost:5000/api/health"
+echo "🔧 Backend API (via nginx): http://localhost/api/health"
 echo ""
 echo "📝 Comandos úteis:"
 echo "  - Ver logs: docker compose logs -f"